@@ -0,0 +1,79 @@
+# Similarity index - recall and query time vs the exact search (every signature compared with the query)
+# usage (from the project directory): python -m benchmarks.bench_ann [n_streams | hourly_interval_data.csv]
+# without a file, the signatures are built from synthetic load shapes (a few archetypes + noise per stream)
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from modules import ann
+
+__n_streams__ = 50000
+__n_queries__ = 500
+__k__ = 10
+
+# (tables, bits, probes)
+__settings__ = [(4, 12, 1), (8, 12, 1), (8, 10, 1), (8, 10, 3), (16, 10, 2)]
+
+
+def get_synthetic_signatures(n_streams: int, n_shapes: int = 200, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+	rng = np.random.default_rng(seed)
+	hours = np.arange(24)
+
+	# archetypes - a few harmonics of the day with random phases/amplitudes
+	shapes = sum(rng.normal(size=(n_shapes, 1)) * np.sin((hours[None, :] / 24 + rng.random((n_shapes, 1))) * 2 *
+	                                                      np.pi * harmonic) for harmonic in (1, 2, 3))
+	profiles = shapes[rng.integers(0, n_shapes, n_streams)] * rng.uniform(1, 100, (n_streams, 1))
+	profiles += rng.normal(0, 0.3, profiles.shape) * np.abs(profiles).mean(axis=1, keepdims=True)
+
+	hourly_df = pd.DataFrame({"stream_id": np.repeat(np.arange(n_streams), 24),
+	                          "hour_interval": np.tile(hours, n_streams),
+	                          "hour_mean": profiles.ravel()})
+	return ann.get_load_shapes(hourly_df)
+
+
+def main(source: str | None = None):
+	if source is not None and not source.isdigit():
+		stream_ids, signatures = ann.get_load_shapes(pd.read_csv(source))
+	else:
+		stream_ids, signatures = get_synthetic_signatures(int(source or __n_streams__))
+
+	queries = np.random.default_rng(1).choice(len(stream_ids), min(__n_queries__, len(stream_ids)), replace=False)
+
+	# exact top k of every query - the same products as the all-pairs comparison, only for the query rows
+	start = time.perf_counter()
+	exact = []
+	for row in queries:
+		scores = signatures @ signatures[row]
+		scores[row] = -np.inf
+		exact.append(set(stream_ids[np.argpartition(-scores, __k__)[:__k__]].tolist()))
+	exact_time = (time.perf_counter() - start) / len(queries)
+
+	print(f"{len(stream_ids)} streams, {len(queries)} queries, top {__k__}")
+	print(f"{'tables':>6} {'bits':>5} {'probes':>6} {'build (s)':>10} {'query (ms)':>11} {'speedup':>8} "
+	      f"{'scanned':>8} {'recall':>7}")
+	print(f"{'exact':>19} {'':>10} {exact_time * 1000:>11.3f} {1:>8.1f} {1:>8.3f} {1:>7.3f}")
+
+	for n_tables, n_bits, n_probes in __settings__:
+		start = time.perf_counter()
+		index = ann.SimilarityIndex(n_tables=n_tables, n_bits=n_bits)
+		index.add_many(stream_ids, signatures)
+		build_time = time.perf_counter() - start
+
+		hits, scanned = 0, 0
+		start = time.perf_counter()
+		for row, expected in zip(queries, exact):
+			res = index.query_stream(int(stream_ids[row]), k=__k__, n_probes=n_probes)
+			hits += len(expected & set(res["stream_id"].tolist()))
+		query_time = (time.perf_counter() - start) / len(queries)
+
+		for row in queries[:50]:
+			scanned += len(index.get_candidates(signatures[row], n_probes=n_probes))
+
+		print(f"{n_tables:>6} {n_bits:>5} {n_probes:>6} {build_time:>10.2f} {query_time * 1000:>11.3f} "
+		      f"{exact_time / query_time:>8.1f} {scanned / 50 / len(stream_ids):>8.3f} "
+		      f"{hits / (len(queries) * __k__):>7.3f}")
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:2])
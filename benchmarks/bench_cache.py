@@ -0,0 +1,45 @@
+# Re-run over unchanged files - cold run (parse + store in the stream cache) vs warm run (load from the cache)
+# usage (from the project directory): python -m benchmarks.bench_cache [n_streams] [n_intervals]
+
+import sys
+import time
+import logging
+import tempfile
+import config
+from main import get_stream_results
+from modules import cache, DataStream
+from benchmarks.synthetic import write_synthetic_streams
+
+
+def run(path: str, file_list: list[str]) -> float:
+	start = time.perf_counter()
+	for _ in get_stream_results(path=path, file_list=file_list):
+		pass
+	return time.perf_counter() - start
+
+
+def main(n_streams: int = 20, n_intervals: int = 105120):
+	config.logger.setLevel(logging.WARNING)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		path = f"{tmp_dir}/csv/"
+		file_list = write_synthetic_streams(path, n_streams=n_streams, n_intervals=n_intervals)
+
+		print(f"{n_streams} streams x {n_intervals} intervals")
+		print(f"{'intake':>8} {'format':>8} {'no cache (s)':>13} {'cold (s)':>9} {'warm (s)':>9}")
+		for intake_mode in ["memory", "typed"]:
+			DataStream.intake_mode = intake_mode
+
+			DataStream.use_cache = False
+			no_cache = run(path, file_list)
+
+			DataStream.use_cache = True
+			cache.__stream_cache__ = cache.StreamCache(cache_path=f"{tmp_dir}/cache-{intake_mode}/")
+			cold = run(path, file_list)
+			warm = run(path, file_list)
+			print(f"{intake_mode:>8} {cache.__stream_cache__.get_format():>8} {no_cache:>13.3f} {cold:>9.3f} "
+			      f"{warm:>9.3f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,32 @@
+# Zero/NaN/binary classification of a stream - value_counts + boolean scans (previous approach) vs classify_values
+# usage (from the project directory): python -m benchmarks.bench_classification [n_intervals ...]
+
+import sys
+import timeit
+import numpy as np
+import pandas as pd
+from modules.DataStream import classify_values
+from benchmarks.synthetic import generate_stream
+
+
+def value_counts(values: pd.Series) -> tuple:
+	counts = values.value_counts(dropna=False)
+	index = counts.index.to_numpy()
+	return counts[index == 0].sum(), counts[np.isnan(index)].sum(), counts[index == 1].sum()
+
+
+def main(*interval_counts: int):
+	interval_counts = interval_counts or (105120, 1051200)
+
+	print(f"{'intervals':>10} {'value_counts (ms)':>18} {'classify_values (ms)':>21} {'speedup':>8}")
+	for n_intervals in interval_counts:
+		values = generate_stream(n_intervals)["value"]
+		repeat = max(1, 10 ** 7 // n_intervals)
+
+		legacy = timeit.timeit(lambda: value_counts(values), number=repeat) / repeat
+		kernel = timeit.timeit(lambda: classify_values(values.to_numpy()), number=repeat) / repeat
+		print(f"{n_intervals:>10} {legacy * 1000:>18.2f} {kernel * 1000:>21.2f} {legacy / kernel:>8.1f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,62 @@
+# Green Button (ESPI) XML intake vs the CSV intake of the same site - time and peak memory (tracemalloc) of each, and
+# whether both read the same DataFrame. Without a site ID, a year of synthetic 5-minute intervals is written as both
+# formats; with one, <csv_path>/<site ID>.csv and <gb_xml_path>/<site ID>.xml are read
+# usage (from the project directory): python -m benchmarks.bench_greenbutton [site ID]
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import tracemalloc
+import config
+from modules import DataStream
+from benchmarks.synthetic import generate_stream, write_greenbutton_stream
+
+
+def run(intake, file_path: str) -> tuple[float, float, DataStream.DataStream]:
+	"""intake seconds, peak memory (MB - traced in a second read, tracemalloc slows down the parsing), and the
+	DataStream that was read"""
+	start = time.perf_counter()
+	ds = DataStream.DataStream(1, config.valid_column_names)
+	intake(ds, file_path)
+	seconds = time.perf_counter() - start
+
+	tracemalloc.start()
+	intake(DataStream.DataStream(1, config.valid_column_names), file_path)
+	peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+	tracemalloc.stop()
+	return seconds, peak, ds
+
+
+def compare(csv_file: str, xml_file: str) -> None:
+	intakes = {"csv": (lambda ds, file: ds.read_csv_data(file=file), csv_file),
+	           "greenbutton": (lambda ds, file: ds.read_greenbutton_data(file=file), xml_file)}
+
+	print(f"{'intake':>12} {'file MB':>8} {'rows':>8} {'intake (s)':>11} {'rows/s':>10} {'peak MB':>8}")
+	frames = []
+	for name, (intake, file_path) in intakes.items():
+		seconds, peak, ds = run(intake, file_path)
+		rows = ds.get_total_intervals() or 0
+		frames.append(ds.get_df())
+		print(f"{name:>12} {os.path.getsize(file_path) / 2 ** 20:>8.1f} {rows:>8} {seconds:>11.3f} "
+		      f"{rows / seconds:>10.0f} {peak:>8.1f}")
+
+	print(f"same DataFrame: {frames[0].equals(frames[1])}")
+
+
+def main(site_id: str | None = None):
+	config.logger.setLevel(logging.WARNING)
+
+	if site_id is not None:
+		return compare(f"{config.csv_path}{site_id}.csv", f"{config.gb_xml_path}{site_id}.xml")
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		df = generate_stream(105120, seed=1)
+		df.to_csv(f"{tmp_dir}/1.csv", index=False)
+		write_greenbutton_stream(f"{tmp_dir}/1.xml", df)
+		compare(f"{tmp_dir}/1.csv", f"{tmp_dir}/1.xml")
+
+
+if __name__ == '__main__':
+	main(*sys.argv[1:2])
@@ -0,0 +1,54 @@
+# Time-bucket keys - pd.to_datetime + dt.date/dt.hour (previous approach) vs integer arithmetic on the epoch column
+# usage (from the project directory): python -m benchmarks.bench_grouping [n_intervals] [repeat]
+
+import sys
+import time
+import pandas as pd
+import config
+from modules import rollup
+from benchmarks.synthetic import generate_stream
+
+
+def legacy_keys(df: pd.DataFrame) -> None:
+	df["dttm_utc"] = pd.to_datetime(df["dttm_utc"])
+	df["day_interval"] = df["dttm_utc"].dt.date
+	df["hour_interval"] = df["dttm_utc"].dt.hour
+
+
+def epoch_keys(df: pd.DataFrame) -> None:
+	hours = df["timestamp"].to_numpy() // rollup.seconds_per_hour
+	df["day_interval"] = (hours // 24).astype("int32")
+	df["hour_interval"] = (hours % 24).astype("int8")
+
+
+def run(df: pd.DataFrame, generate_keys, repeat: int) -> tuple[float, float]:
+	"""mean time to generate the keys, and to group the data by them"""
+	keys_time, group_time = 0, 0
+	for _ in range(repeat):
+		tmp = df.copy()
+
+		start = time.perf_counter()
+		generate_keys(tmp)
+		keys_time += time.perf_counter() - start
+
+		start = time.perf_counter()
+		tmp.groupby(["day_interval", "hour_interval"])["value"].agg(["max", "min", "median", "mean", "sum"])
+		group_time += time.perf_counter() - start
+
+	return keys_time / repeat, group_time / repeat
+
+
+def main(n_intervals: int = 1051200, repeat: int = 5):
+	files = {"718.csv": pd.read_csv(f"{config.csv_path_test}csv_local_test/718.csv",
+	                                usecols=config.valid_column_names),
+	         f"synthetic ({n_intervals} rows)": generate_stream(n_intervals)}
+
+	print(f"{'file':>28} {'keys':>8} {'keys (s)':>10} {'groupby (s)':>12} {'total (s)':>10}")
+	for name, df in files.items():
+		for label, generate_keys in [("legacy", legacy_keys), ("epoch", epoch_keys)]:
+			keys_time, group_time = run(df, generate_keys, repeat)
+			print(f"{name:>28} {label:>8} {keys_time:>10.4f} {group_time:>12.4f} {keys_time + group_time:>10.4f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
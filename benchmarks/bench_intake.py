@@ -0,0 +1,71 @@
+# Intake of a single stream - time and peak memory (tracemalloc) of each intake path, for a short and a long file.
+# "intake" is the read only; "total" also includes the stream-level and interval-level results
+# usage (from the project directory): python -m benchmarks.bench_intake [n_intervals ...]
+
+import sys
+import time
+import logging
+import tempfile
+import tracemalloc
+import config
+from modules import DataStream
+from benchmarks.synthetic import write_synthetic_streams
+
+
+def intake_memory(ds: DataStream.DataStream, file_path: str) -> None:
+	ds.read_csv_data(file=file_path)
+
+
+def intake_typed(ds: DataStream.DataStream, file_path: str) -> None:
+	ds.read_csv_data_typed(file=file_path)
+
+
+def intake_typed_downcast(ds: DataStream.DataStream, file_path: str) -> None:
+	ds.read_csv_data_typed(file=file_path, downcast=True)
+
+
+def intake_chunked(ds: DataStream.DataStream, file_path: str) -> None:
+	ds.read_csv_data_chunked(file=file_path, chunk_size=config.chunk_size)
+
+
+def run(intake, file_path: str) -> tuple[float, float, float, float]:
+	"""intake seconds, intake peak memory (MB), total seconds, and total peak memory (MB)"""
+	tracemalloc.start()
+	start = time.perf_counter()
+
+	ds = DataStream.DataStream(1, config.valid_column_names)
+	intake(ds, file_path)
+	intake_time = time.perf_counter() - start
+	intake_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+
+	ds.get_stream_level_results()
+	for grouping_type, grouping_config in ds.get_grouping_config().items():
+		ds.get_interval_level_results(grouping_type, grouping_config)
+
+	total_time = time.perf_counter() - start
+	total_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+	tracemalloc.stop()
+	return intake_time, intake_peak, total_time, total_peak
+
+
+def main(*interval_counts: int):
+	interval_counts = interval_counts or (105120, 525600)
+	config.logger.setLevel(logging.WARNING)
+
+	intakes = {"memory": intake_memory, "typed": intake_typed, "typed (downcast)": intake_typed_downcast,
+	           f"chunked ({config.chunk_size})": intake_chunked}
+
+	print(f"{'intervals':>10} {'intake':>18} {'intake (s)':>11} {'intake MB':>10} {'total (s)':>10} {'total MB':>9}")
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		for n_intervals in interval_counts:
+			path = f"{tmp_dir}/{n_intervals}/"
+			file_path = f"{path}{write_synthetic_streams(path, n_streams=1, n_intervals=n_intervals)[0]}"
+
+			for name, intake in intakes.items():
+				intake_time, intake_peak, total_time, total_peak = run(intake, file_path)
+				print(f"{n_intervals:>10} {name:>18} {intake_time:>11.3f} {intake_peak:>10.1f} {total_time:>10.3f} "
+				      f"{total_peak:>9.1f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
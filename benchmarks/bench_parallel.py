@@ -0,0 +1,43 @@
+# Scaling of the per-stream processing from 1 to N worker processes
+# usage (from the project directory): python -m benchmarks.bench_parallel [n_streams] [n_intervals]
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import config
+from main import get_stream_results
+from benchmarks.synthetic import write_synthetic_streams
+
+
+def run(path: str, file_list: list[str], processing_mode: str, max_workers: int | None) -> float:
+	start = time.perf_counter()
+	for _ in get_stream_results(path=path, file_list=file_list, processing_mode=processing_mode,
+	                            max_workers=max_workers):
+		pass
+	return time.perf_counter() - start
+
+
+def main(n_streams: int = 64, n_intervals: int = 105120):
+	config.logger.setLevel(logging.WARNING)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		path = f"{tmp_dir}/"
+		file_list = write_synthetic_streams(path, n_streams=n_streams, n_intervals=n_intervals)
+
+		serial = run(path, file_list, "serial", None)
+		print(f"{n_streams} streams x {n_intervals} intervals")
+		print(f"{'mode':>10} {'workers':>8} {'seconds':>10} {'speedup':>8}")
+		print(f"{'serial':>10} {1:>8} {serial:>10.3f} {1:>8.2f}")
+
+		# powers of 2 up to the number of cores (+ the number of cores itself)
+		worker_counts = sorted({2 ** i for i in range(os.cpu_count().bit_length()) if 2 ** i <= os.cpu_count()} |
+		                       {os.cpu_count()})
+		for workers in worker_counts:
+			elapsed = run(path, file_list, "parallel", workers)
+			print(f"{'parallel':>10} {workers:>8} {elapsed:>10.3f} {serial / elapsed:>8.2f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,60 @@
+# End-to-end time of a batch - read, compute and write one file after another (serial) vs the pipelined runner, where
+# reader threads parse ahead of the compute worker processes and the interval-level rows are written as each stream is
+# done (and the parallel runner, for reference). The speedup is bounded by the number of cores
+# usage (from the project directory): python -m benchmarks.bench_pipeline [n_streams] [n_intervals]
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import config
+from main import get_stream_results
+from modules import pipeline, writers
+from benchmarks.synthetic import write_synthetic_streams
+
+
+def run(path: str, file_list: list[str], processing_mode: str, timings: pipeline.StageTimings | None = None) -> float:
+	start = time.perf_counter()
+
+	interval_writers = dict()
+	for _, interval_level_res in get_stream_results(path=path, file_list=file_list, processing_mode=processing_mode,
+	                                                timings=timings):
+		# written to the temporary directory instead of the configured output paths
+		writers.write_interval_level_results(interval_writers, {grouping_type: {**res, "output_path":
+		                                                                        f"{path}out/{grouping_type}.csv"}
+		                                                        for grouping_type, res in interval_level_res.items()})
+	writers.close_writers(interval_writers)
+
+	return time.perf_counter() - start
+
+
+def main(n_streams: int = 32, n_intervals: int = 105120):
+	config.logger.setLevel(logging.WARNING)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		path = f"{tmp_dir}/"
+		file_list = write_synthetic_streams(path, n_streams=n_streams, n_intervals=n_intervals)
+
+		serial = run(path, file_list, "serial")
+		print(f"{n_streams} streams x {n_intervals} intervals, {os.cpu_count()} core(s)")
+		print(f"{'mode':>10} {'readers':>8} {'workers':>8} {'queue':>6} {'seconds':>10} {'speedup':>8}")
+		print(f"{'serial':>10} {'':>8} {'':>8} {'':>6} {serial:>10.3f} {1:>8.2f}")
+
+		parallel = run(path, file_list, "parallel")
+		print(f"{'parallel':>10} {'':>8} {os.cpu_count():>8} {'':>6} {parallel:>10.3f} {serial / parallel:>8.2f}")
+
+		for n_readers, n_workers, queue_size in [(1, 1, 2), (2, 2, 8), (2, os.cpu_count(), 8)]:
+			config.pipeline_readers, config.pipeline_workers, config.pipeline_queue_size = n_readers, n_workers, \
+				queue_size
+			timings = pipeline.StageTimings()
+			elapsed = run(path, file_list, "pipelined", timings)
+			print(f"{'pipelined':>10} {n_readers:>8} {n_workers:>8} {queue_size:>6} {elapsed:>10.3f} "
+			      f"{serial / elapsed:>8.2f}")
+
+			for stage, stage_timings in timings.get_summary().items():
+				print(f"{'':>12} {stage:>8} : busy {stage_timings['busy']:>7.3f}s, waiting {stage_timings['wait']:>7.3f}s")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,55 @@
+# Query API - latency with and without the LRU cache, for a skewed workload (a few streams are requested most of the
+# time, over random month-long ranges)
+# usage (from the project directory): python -m benchmarks.bench_query [n_streams] [n_queries]
+
+import sys
+import time
+import logging
+import tempfile
+import numpy as np
+import config
+from modules import query, sinks
+from benchmarks.bench_writers import get_interval_level_res
+
+
+def run(path: str, workload: list, cache_max_bytes: int) -> tuple[float, dict]:
+	q = query.ResultQuery(path, cache_max_bytes=cache_max_bytes)
+
+	start = time.perf_counter()
+	for stream_id, grouping_type, first_day in workload:
+		q.get_interval_results(stream_id, grouping_type=grouping_type, start=first_day,
+		                       end=first_day + np.timedelta64(30, "D"))
+	elapsed = time.perf_counter() - start
+
+	metrics = q.get_metrics()
+	q.close()
+	return elapsed, metrics
+
+
+def main(n_streams: int = 200, n_queries: int = 2000):
+	config.logger.setLevel(logging.WARNING)
+	rng = np.random.default_rng(0)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		path = f"{tmp_dir}/results.sqlite"
+		sink = sinks.SqliteSink(path)
+		for stream_id in range(n_streams):
+			sink.write_interval_level_results(get_interval_level_res(stream_id, tmp_dir))
+		sink.close()
+
+		# zipf distributed streams, 3/4 of the queries on the daily results
+		workload = [(int(min(rng.zipf(1.5), n_streams) - 1), "day_interval" if rng.random() < 0.75 else "hour_interval",
+		             np.datetime64("2012-01-01") + np.timedelta64(int(rng.integers(0, 330)), "D"))
+		            for _ in range(n_queries)]
+
+		print(f"{n_streams} streams, {n_queries} queries")
+		print(f"{'cache (MB)':>10} {'mean (ms)':>10} {'hit rate':>9} {'hit (ms)':>9} {'miss (ms)':>10} {'evictions':>10}")
+		for cache_mb in [0, 1, 8, 64]:
+			elapsed, metrics = run(path, workload, cache_max_bytes=cache_mb * 2 ** 20)
+			print(f"{cache_mb:>10} {elapsed / n_queries * 1000:>10.3f} {metrics['hit_rate']:>9.2f} "
+			      f"{metrics['hit_latency_mean_ms'] or 0:>9.3f} {metrics['miss_latency_mean_ms'] or 0:>10.3f} "
+			      f"{metrics['evictions']:>10}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,58 @@
+# Accumulation of the per-stream results - repeated append (quadratic) vs the ResultCollector (linear)
+# usage (from the project directory): python -m benchmarks.bench_result_collector [n_streams ...]
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from modules.ResultCollector import ResultCollector
+
+
+def get_stream_level_res(stream_id: int) -> pd.DataFrame:
+	return pd.DataFrame({"stream_id": [stream_id], "status": ["Processed"], "message": [None], "rank": [np.nan],
+	                     "% of 0 and NaN": [0.02], "% of 0": [0.01], "% of NaN": [0.01], "count of 0 and NaN": [2],
+	                     "count of 0's": [1], "count of NaN": [1], "ignore": [False]})
+
+
+def get_interval_level_res(stream_id: int) -> dict:
+	"""one day worth of hourly rows per stream"""
+	df = pd.DataFrame({"stream_id": stream_id, "day_interval": "2012-01-01", "hour_interval": np.arange(24),
+	                   "hour_max": 1.0, "hour_min": 0.0, "hour_median": 0.5, "hour_mean": 0.5})
+	return {"hour_interval": {"df": df, "output_path": "doesnt matter...."}}
+
+
+def run_append(results: list) -> float:
+	"""the previous approach - every call copies the whole accumulated frame"""
+	start = time.perf_counter()
+	stream_df = pd.DataFrame()
+	interval_df = pd.DataFrame()
+	for stream_level_res, interval_level_res in results:
+		stream_df = pd.concat([stream_df, stream_level_res], ignore_index=True)
+		interval_df = pd.concat([interval_df, interval_level_res["hour_interval"]["df"]], ignore_index=True)
+	return time.perf_counter() - start
+
+
+def run_collector(results: list) -> float:
+	start = time.perf_counter()
+	collector = ResultCollector()
+	for stream_level_res, interval_level_res in results:
+		collector.add_stream_level_results(stream_level_res)
+		collector.add_interval_level_results(interval_level_res)
+	collector.get_stream_df()
+	collector.get_interval_df()
+	return time.perf_counter() - start
+
+
+def main(*stream_counts: int):
+	stream_counts = stream_counts or (100, 1000, 10000)
+
+	print(f"{'streams':>8} {'append (s)':>12} {'collector (s)':>14} {'collector us/stream':>20}")
+	for n_streams in stream_counts:
+		results = [(get_stream_level_res(i), get_interval_level_res(i)) for i in range(1, n_streams + 1)]
+		append = run_append(results)
+		collector = run_collector(results)
+		print(f"{n_streams:>8} {append:>12.3f} {collector:>14.3f} {collector / n_streams * 1e6:>20.1f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,47 @@
+# Interval-level work per stream - flat rollups vs daily rollups derived from the hourly partials
+# usage (from the project directory): python -m benchmarks.bench_rollup [n_intervals] [repeat]
+
+import sys
+import time
+import logging
+import tempfile
+import config
+from modules import DataStream
+from benchmarks.synthetic import write_synthetic_streams
+
+
+def run(file_path: str, rollup_mode: str, median_mode: str, repeat: int) -> float:
+	DataStream.rollup_mode = rollup_mode
+	DataStream.median_mode = median_mode
+
+	elapsed = 0
+	for _ in range(repeat):
+		ds = DataStream.get_data_stream(stream_id=1, file_path=file_path, valid_column_names=config.valid_column_names)
+
+		start = time.perf_counter()
+		for grouping_type, grouping_config in ds.get_grouping_config().items():
+			ds.get_interval_level_results(grouping_type, grouping_config)
+		elapsed += time.perf_counter() - start
+
+	return elapsed / repeat
+
+
+def main(n_intervals: int = 105120, repeat: int = 5):
+	config.logger.setLevel(logging.WARNING)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		file_list = write_synthetic_streams(tmp_dir, n_streams=1, n_intervals=n_intervals)
+		file_path = f"{tmp_dir}/{file_list[0]}"
+
+		flat = run(file_path, "flat", "exact", repeat)
+		print(f"1 stream x {n_intervals} intervals (mean of {repeat} runs)")
+		print(f"{'rollup mode':>14} {'median mode':>12} {'seconds':>10} {'vs flat':>8}")
+		print(f"{'flat':>14} {'exact':>12} {flat:>10.4f} {1:>8.2f}")
+
+		for median_mode in ["exact", "approximate"]:
+			elapsed = run(file_path, "hierarchical", median_mode, repeat)
+			print(f"{'hierarchical':>14} {median_mode:>12} {elapsed:>10.4f} {elapsed / flat:>8.2f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,39 @@
+# All-pairs stream similarity - pairs compared per second, for a growing number of streams, with the profiles read from
+# a memory-mapped matrix file (as in main.py); complete profiles, and profiles with ~5% of the intervals missing
+# usage (from the project directory): python -m benchmarks.bench_similarity [n_streams ...]
+
+import sys
+import time
+import tempfile
+import numpy as np
+from modules import similarity
+
+# 90 days of hourly means
+__n_slots__ = 24 * 90
+
+
+def main(*stream_counts: int):
+	stream_counts = stream_counts or (1000, 4000, 10000)
+	rng = np.random.default_rng(0)
+
+	print(f"{'streams':>8} {'missing':>8} {'pairs':>12} {'time (s)':>9} {'pairs/s':>12}")
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		for n_streams in stream_counts:
+			for missing in [0, 0.05]:
+				matrix = np.lib.format.open_memmap(f"{tmp_dir}/profiles.npy", mode="w+", dtype="float32",
+				                                   shape=(n_streams, __n_slots__))
+				matrix[:] = rng.normal(size=(n_streams, __n_slots__))
+				matrix[rng.random(matrix.shape) < missing] = np.nan
+				matrix.flush()
+
+				start = time.perf_counter()
+				similarity.top_k_similar_pairs(stream_ids=np.arange(n_streams), matrix=matrix, k=10)
+				elapsed = time.perf_counter() - start
+				del matrix
+
+				n_pairs = n_streams * (n_streams - 1) // 2
+				print(f"{n_streams:>8} {missing:>8.0%} {n_pairs:>12} {elapsed:>9.2f} {n_pairs / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
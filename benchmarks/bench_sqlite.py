@@ -0,0 +1,78 @@
+# SQLite result store - insert rate for a few transaction sizes, and the latency of "daily max of a stream in March"
+# from the store vs a scan of the daily CSV output
+# usage (from the project directory): python -m benchmarks.bench_sqlite [n_streams]
+
+import sys
+import time
+import sqlite3
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+import config
+from modules import sinks, writers
+from benchmarks.bench_writers import get_interval_level_res
+
+# days since 1970-01-01 of 2012-03-01 and 2012-04-01
+__march__ = (15400, 15431)
+
+
+def insert(path: str, n_streams: int, batch_size: int) -> float:
+	sink = sinks.SqliteSink(path, batch_size=batch_size)
+
+	start = time.perf_counter()
+	for stream_id in range(n_streams):
+		sink.write_interval_level_results(get_interval_level_res(stream_id, path))
+	sink.close()
+	return time.perf_counter() - start
+
+
+def query_store(connection: sqlite3.Connection, stream_id: int) -> pd.DataFrame:
+	return pd.read_sql_query("SELECT day_interval, day_max FROM day_interval WHERE stream_id = ? AND day_interval >= ? "
+	                         "AND day_interval < ? AND batch_id = ?", connection,
+	                         params=(stream_id, *__march__, sinks.get_latest_batch_id(connection)))
+
+
+def query_csv(path: str, stream_id: int) -> pd.DataFrame:
+	df = pd.read_csv(path, usecols=["stream_id", "day_interval", "day_max"], parse_dates=["day_interval"])
+	return df[(df["stream_id"] == stream_id) & (df["day_interval"] >= "2012-03-01") &
+	          (df["day_interval"] < "2012-04-01")]
+
+
+def main(n_streams: int = 200):
+	config.logger.setLevel(logging.WARNING)
+	# rows per stream - hourly + daily
+	n_rows = n_streams * 365 * 25
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		print(f"{n_streams} streams, {n_rows} rows")
+		print(f"{'batch size':>10} {'seconds':>9} {'rows/s':>10}")
+		for batch_size in [1000, 10000, 100000]:
+			elapsed = insert(f"{tmp_dir}/results-{batch_size}.sqlite", n_streams, batch_size)
+			print(f"{batch_size:>10} {elapsed:>9.2f} {n_rows / elapsed:>10.0f}")
+
+		# the same daily rows as CSV
+		csv_path = f"{tmp_dir}/daily_interval_data.csv"
+		writer = writers.CsvWriter(csv_path)
+		for stream_id in range(n_streams):
+			writer.write(get_interval_level_res(stream_id, tmp_dir)["day_interval"]["df"])
+		writer.close()
+
+		stream_ids = np.random.default_rng(0).integers(0, n_streams, 20)
+		with sqlite3.connect(f"{tmp_dir}/results-10000.sqlite") as connection:
+			start = time.perf_counter()
+			for stream_id in stream_ids:
+				assert len(query_store(connection, int(stream_id)).index) == 31
+			store_latency = (time.perf_counter() - start) / len(stream_ids)
+
+		start = time.perf_counter()
+		for stream_id in stream_ids[:3]:
+			assert len(query_csv(csv_path, int(stream_id)).index) == 31
+		csv_latency = (time.perf_counter() - start) / 3
+
+		print(f"daily max of a stream in March - store: {store_latency * 1000:.2f} ms, "
+		      f"CSV scan: {csv_latency * 1000:.2f} ms ({csv_latency / store_latency:.0f}x)")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,74 @@
+# Interval-level output - collect every stream and write at the end (previous approach) vs the streaming writers.
+# Peak memory should grow with the number of streams for the former, and stay flat for the latter
+# usage (from the project directory): python -m benchmarks.bench_writers [n_streams ...]
+
+import sys
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from modules import rollup, writers
+from modules.ResultCollector import ResultCollector
+
+# a year of hourly/daily rows per stream
+__n_days__ = 365
+
+
+def get_interval_level_res(stream_id: int, path: str) -> dict:
+	rng = np.random.default_rng(stream_id)
+	days = np.arange(15340, 15340 + __n_days__, dtype="int32")
+	hourly = pd.DataFrame({"stream_id": stream_id,
+	                       "day_interval": np.repeat(days, 24),
+	                       "hour_interval": np.tile(np.arange(24, dtype="int8"), __n_days__)})
+	daily = pd.DataFrame({"stream_id": stream_id, "day_interval": days})
+	for df, prefix in [(hourly, "hour"), (daily, "day")]:
+		for calc in ["max", "min", "median", "mean", "sum"]:
+			df[f"{prefix}_{calc}"] = rng.random(len(df.index))
+
+	return {"hour_interval": {"df": hourly, "output_path": f"{path}hourly_interval_data.csv"},
+	        "day_interval": {"df": daily, "output_path": f"{path}daily_interval_data.csv"}}
+
+
+def run_collect(n_streams: int, path: str) -> None:
+	collector = ResultCollector()
+	for stream_id in range(n_streams):
+		collector.add_interval_level_results(get_interval_level_res(stream_id, path))
+
+	for res in collector.get_interval_df().values():
+		rollup.format_interval_keys(res["df"]).to_csv(res["output_path"], index=False)
+
+
+def run_streaming(n_streams: int, path: str, output_format: str) -> None:
+	interval_writers = dict()
+	for stream_id in range(n_streams):
+		writers.write_interval_level_results(interval_writers, get_interval_level_res(stream_id, path),
+		                                     output_format=output_format, row_group_size=2 ** 18)
+	writers.close_writers(interval_writers)
+
+
+def measure(func, *args) -> tuple[float, float]:
+	tracemalloc.start()
+	start = time.perf_counter()
+	func(*args)
+	elapsed = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return elapsed, peak / 2 ** 20
+
+
+def main(*stream_counts: int):
+	stream_counts = stream_counts or (25, 100)
+
+	print(f"{'streams':>8} {'output':>18} {'seconds':>9} {'peak (MB)':>10}")
+	for n_streams in stream_counts:
+		for name, func, args in [("collect + csv", run_collect, ()),
+		                         ("streaming csv", run_streaming, ("csv",)),
+		                         ("streaming columnar", run_streaming, ("columnar",))]:
+			with tempfile.TemporaryDirectory() as tmp_dir:
+				elapsed, peak = measure(func, n_streams, f"{tmp_dir}/", *args)
+			print(f"{n_streams:>8} {name:>18} {elapsed:>9.2f} {peak:>10.1f}")
+
+
+if __name__ == '__main__':
+	main(*[int(arg) for arg in sys.argv[1:]])
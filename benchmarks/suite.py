@@ -0,0 +1,178 @@
+# Benchmark suite of the whole run, on synthetic streams - the time of each stage (intake, stream-level results,
+# interval-level results of each grouping type, ranking, and writing the outputs), written as JSON. Runs offline.
+# With a baseline (a JSON written by an earlier run), a stage that is more than the threshold slower than the baseline
+# is reported as a regression, and the suite exits with status 1
+# usage (from the project directory): python -m benchmarks.suite [--streams N] [--intervals N] [--nan-ratio R]
+#                                     [--zero-ratio R] [--binary-ratio R] [--repeat N] [--output results.json]
+#                                     [--baseline baseline.json] [--threshold 0.2] [--min-seconds 0.05]
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import numpy as np
+import pandas as pd
+import config
+from modules import ranking, writers
+from modules.DataStream import get_data_stream, get_stream_id
+from modules.ResultCollector import ResultCollector
+from benchmarks.synthetic import write_synthetic_streams
+
+# stages faster than this (seconds) aren't compared with the baseline - their timings are mostly noise
+__min_seconds__ = 0.05
+
+
+def run_suite(path: str, file_list: list[str]) -> dict:
+	"""Seconds spent in each stage, for all the streams of the directory"""
+	seconds = dict()
+
+	def timed(stage: str, func, *args, **kwargs):
+		start = time.perf_counter()
+		res = func(*args, **kwargs)
+		seconds[stage] = seconds.get(stage, 0.0) + time.perf_counter() - start
+		return res
+
+	collector = ResultCollector()
+	stream_ranking = ranking.StreamRanking(n=config.rank_top_n)
+	interval_level_res = []
+	for file in file_list:
+		stream_id = get_stream_id(pattern=config.stream_id_pattern, file=file)
+		ds = timed("read_csv_data", get_data_stream, stream_id, f"{path}{file}", config.valid_column_names)
+		stream_level_res = timed("get_stream_level_results", ds.get_stream_level_results)
+		collector.add_stream_level_results(stream_level_res)
+
+		# streams that aren't valid are ignored - they aren't ranked
+		if ds.is_valid_stream() is not True:
+			continue
+
+		res = dict()
+		for grouping_type, grouping_config in ds.get_grouping_config().items():
+			df = timed(f"get_interval_level_results[{grouping_type}]", ds.get_interval_level_results, grouping_type,
+			           grouping_config)
+			res[grouping_type] = {"df": df, "output_path": f"{path}output/{grouping_type}.csv"}
+		interval_level_res.append(res)
+		timed("ranking", stream_ranking.add_stream_level_results, stream_level_res)
+
+	stream_df = timed("ranking", collector.get_stream_df)
+	stream_df["rank"] = timed("ranking", stream_ranking.get_rank, stream_df)
+
+	interval_writers = dict()
+	for res in interval_level_res:
+		timed("write", writers.write_interval_level_results, interval_writers, res, output_format=config.output_format,
+		      row_group_size=config.output_row_group_size)
+	timed("write", stream_df.to_csv, f"{path}output/stream_level.csv", index=False)
+	timed("write", writers.close_writers, interval_writers)
+
+	return seconds
+
+
+def get_stages(runs: list[dict], n_streams: int, n_intervals: int) -> dict:
+	"""Best (minimum) time of each stage over the repeats, and the matching throughput"""
+	stages = dict()
+	for stage in runs[0]:
+		best = min(seconds[stage] for seconds in runs)
+		stages[stage] = {"seconds": best,
+		                 "median_seconds": float(np.median([seconds[stage] for seconds in runs])),
+		                 "rows_per_second": n_streams * n_intervals / best if best > 0 else None}
+	return stages
+
+
+def compare(stages: dict, baseline: dict, threshold: float = 0.2, min_seconds: float = __min_seconds__) -> list[dict]:
+	"""Stages more than threshold (e.g., 0.2 -> 20%) slower than in the baseline. Stages that aren't in both, or that
+	are faster than min_seconds in the baseline, are skipped"""
+	regressions = []
+	for stage, timings in stages.items():
+		base = baseline.get("stages", baseline).get(stage)
+		if base is None or base["seconds"] < min_seconds:
+			continue
+
+		ratio = timings["seconds"] / base["seconds"]
+		if ratio > 1 + threshold:
+			regressions.append({"stage": stage, "seconds": timings["seconds"], "baseline_seconds": base["seconds"],
+			                    "ratio": ratio})
+	return regressions
+
+
+def get_meta(args: argparse.Namespace) -> dict:
+	return {"streams": args.streams,
+	        "intervals": args.intervals,
+	        "nan_ratio": args.nan_ratio,
+	        "zero_ratio": args.zero_ratio,
+	        "binary_ratio": args.binary_ratio,
+	        "repeat": args.repeat,
+	        "seed": args.seed,
+	        "intake_mode": config.intake_mode,
+	        "rollup_mode": config.rollup_mode,
+	        "median_mode": config.median_mode,
+	        "output_format": config.output_format,
+	        "python": platform.python_version(),
+	        "numpy": np.__version__,
+	        "pandas": pd.__version__,
+	        "platform": platform.platform(),
+	        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Benchmark suite of the stages of a run, on synthetic streams")
+	parser.add_argument("--streams", type=int, default=20, help="number of streams")
+	parser.add_argument("--intervals", type=int, default=105120, help="5-minute intervals per stream (a year by default)")
+	parser.add_argument("--nan-ratio", type=float, default=0.01, help="share of the values that are NaN")
+	parser.add_argument("--zero-ratio", type=float, default=0.01, help="share of the values that are 0")
+	parser.add_argument("--binary-ratio", type=float, default=0.1, help="share of the streams with only 0's and 1's")
+	parser.add_argument("--repeat", type=int, default=3, help="runs of the suite - the best time of each stage is kept")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", default="benchmark_results.json", help="path of the JSON results")
+	parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+	parser.add_argument("--threshold", type=float, default=0.2,
+	                    help="slowdown over the baseline reported as a regression (0.2 -> 20%%)")
+	parser.add_argument("--min-seconds", type=float, default=__min_seconds__,
+	                    help="stages faster than this in the baseline aren't compared")
+	return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+	args = parse_args(argv)
+	config.logger.setLevel(logging.WARNING)
+
+	runs = []
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		path = f"{tmp_dir}/"
+		file_list = write_synthetic_streams(path, n_streams=args.streams, n_intervals=args.intervals, seed=args.seed,
+		                                    nan_ratio=args.nan_ratio, zero_ratio=args.zero_ratio,
+		                                    binary_ratio=args.binary_ratio)
+		for _ in range(args.repeat):
+			runs.append(run_suite(path, file_list))
+
+	results = {"meta": get_meta(args), "stages": get_stages(runs, args.streams, args.intervals)}
+
+	os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+	with open(args.output, "w") as f:
+		json.dump(results, f, indent=2)
+
+	print(f"{'stage':>45} {'seconds':>9} {'rows/s':>12}")
+	for stage, timings in results["stages"].items():
+		print(f"{stage:>45} {timings['seconds']:>9.3f} {timings['rows_per_second'] or 0:>12.0f}")
+	print(f"Results written to '{args.output}'")
+
+	if args.baseline is None:
+		return 0
+
+	with open(args.baseline, "r") as f:
+		baseline = json.load(f)
+
+	regressions = compare(results["stages"], baseline, threshold=args.threshold,
+	                      min_seconds=args.min_seconds)
+	for regression in regressions:
+		print(f"REGRESSION {regression['stage']} : {regression['seconds']:.3f}s vs {regression['baseline_seconds']:.3f}s "
+		      f"in the baseline ({regression['ratio']:.2f}x)")
+	if len(regressions) == 0:
+		print(f"No stage is more than {args.threshold:.0%} slower than the baseline '{args.baseline}'")
+	return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
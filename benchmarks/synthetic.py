@@ -0,0 +1,81 @@
+# Synthetic meter data in the same 5-column format as the files in all-data.tar/csv
+
+import os
+import numpy as np
+import pandas as pd
+
+# 2012-01-01 00:05:00 UTC - the first interval of the EnerNOC data set
+__start_timestamp__ = 1325376300
+__interval_seconds__ = 300
+
+
+def generate_stream(n_intervals: int, seed: int = 0, nan_ratio: float = 0.01, zero_ratio: float = 0.01,
+                    binary: bool = False) -> pd.DataFrame:
+	"""Builds a single stream with a daily load shape, some noise, and a sprinkling of 0's and NaN's. A binary stream
+	only has 0's and 1's (and NaN's) - it's classified as "ignore" by the stream-level results"""
+	rng = np.random.default_rng(seed)
+
+	timestamp = __start_timestamp__ + np.arange(n_intervals, dtype="int64") * __interval_seconds__
+	if binary:
+		value = (rng.random(n_intervals) < 0.5).astype("float64")
+	else:
+		hour_of_day = (timestamp // 3600) % 24
+		value = 50 + 25 * np.sin((hour_of_day - 6) / 24 * 2 * np.pi) + rng.normal(0, 5, n_intervals)
+		value = np.round(value, 4)
+	value[rng.random(n_intervals) < zero_ratio] = 0
+	value[rng.random(n_intervals) < nan_ratio] = np.nan
+
+	return pd.DataFrame({"timestamp": timestamp,
+	                     "dttm_utc": pd.to_datetime(timestamp, unit="s").strftime("%Y-%m-%d %H:%M:%S"),
+	                     "value": value,
+	                     "estimated": np.zeros(n_intervals, dtype="int64"),
+	                     "anomaly": np.full(n_intervals, np.nan)})
+
+
+def write_synthetic_streams(directory: str, n_streams: int, n_intervals: int, seed: int = 0, nan_ratio: float = 0.01,
+                            zero_ratio: float = 0.01, binary_ratio: float = 0) -> list[str]:
+	"""Writes n_streams files named <stream_id>.csv into the directory; returns the list of file names. binary_ratio is
+	the share of the streams that only have 0's and 1's"""
+	os.makedirs(directory, exist_ok=True)
+	n_binary = int(round(n_streams * binary_ratio))
+
+	file_list = []
+	for stream_id in range(1, n_streams + 1):
+		file = f"{stream_id}.csv"
+		generate_stream(n_intervals, seed=seed + stream_id, nan_ratio=nan_ratio, zero_ratio=zero_ratio,
+		                binary=stream_id <= n_binary).to_csv(f"{directory}/{file}", index=False)
+		file_list.append(file)
+
+	return file_list
+
+
+def write_greenbutton_stream(file: str, df: pd.DataFrame, power_of_ten: int = -1, block_size: int = 288) -> None:
+	"""Writes a stream (the 5-column format, values in kWh) as a Green Button (ESPI) feed: a ReadingType entry (Wh, with
+	power_of_ten), and an IntervalBlock entry for every block_size readings (a day of 5-minute intervals). NaN values are
+	written as readings without a value, and the estimated readings with a ReadingQuality"""
+	scale = 10 ** (3 - power_of_ten)
+	starts = df["timestamp"].to_numpy() - __interval_seconds__
+	values = np.round(df["value"].to_numpy() * scale)
+	estimated = df["estimated"].to_numpy()
+
+	with open(file, "w") as f:
+		f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+		        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:espi="http://naesb.org/espi">\n'
+		        '<entry><content><espi:ReadingType>'
+		        f'<espi:powerOfTenMultiplier>{power_of_ten}</espi:powerOfTenMultiplier><espi:uom>72</espi:uom>'
+		        f'<espi:intervalLength>{__interval_seconds__}</espi:intervalLength></espi:ReadingType></content></entry>\n')
+
+		for i in range(0, len(starts), block_size):
+			block_starts = starts[i:i + block_size].tolist()
+			f.write(f'<entry><content><espi:IntervalBlock><espi:interval>'
+			        f'<espi:duration>{__interval_seconds__ * len(block_starts)}</espi:duration>'
+			        f'<espi:start>{block_starts[0]}</espi:start></espi:interval>\n')
+			for start, value, is_estimated in zip(block_starts, values[i:i + block_size].tolist(),
+			                                      estimated[i:i + block_size].tolist()):
+				quality = "<espi:ReadingQuality><espi:quality>8</espi:quality></espi:ReadingQuality>" if is_estimated else ""
+				value = "" if np.isnan(value) else f"<espi:value>{int(value)}</espi:value>"
+				f.write(f'<espi:IntervalReading>{quality}<espi:timePeriod>'
+				        f'<espi:duration>{__interval_seconds__}</espi:duration><espi:start>{start}</espi:start>'
+				        f'</espi:timePeriod>{value}</espi:IntervalReading>\n')
+			f.write('</espi:IntervalBlock></content></entry>\n')
+		f.write('</feed>\n')
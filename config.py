@@ -16,9 +16,168 @@ csv_path = f"{__root_dir__}/all-data.tar/csv/"
 csv_pattern = r"^[1-9]+[0-9]*\.csv$"
 csv_path_test = f"{__root_dir__}/tests/files/csv/"
 stream_id_pattern = r"^([1-9]+[0-9]*)\.csv$"
+# Green Button (ESPI) XML files - the same data as the CSV files (input_format = "greenbutton" reads these instead)
+gb_xml_path = f"{__root_dir__}/all-data.tar/gb_xml/"
+gb_xml_pattern = r"^[1-9]+[0-9]*\.xml$"
+gb_xml_stream_id_pattern = r"^([1-9]+[0-9]*)\.xml$"
+# "csv" | "greenbutton"
+input_format = "csv"
+# archive source - the input files are read straight out of an archive (.tar.gz, .tgz, .tar or .zip, e.g.,
+# all-data.tar.gz) instead of the directory: the members whose file names match the pattern of input_format are
+# decompressed on their own thread, at most archive_queue_size members ahead of the processing, and never written to
+# disk (None -> the directory is read)
+archive_path = None
+archive_queue_size = 4
 
 # output paths
 output_stream_path = f"{__root_dir__}/Output/stream_level_data.csv"
+output_similarity_path = f"{__root_dir__}/Output/similar_streams.csv"
+
+# interval-level output - appended to as each stream is done. "csv" | "columnar" (binary, written in row groups of
+# output_row_group_size rows - parquet when pyarrow is installed, otherwise a directory of .npy files per row group)
+output_format = "csv"
+output_row_group_size = 2 ** 20
+
+# result store - the stream-level and interval-level results of every run are also written to a database, as a batch
+# (None -> disabled, "sqlite")
+result_sink = None
+sqlite_path = f"{__root_dir__}/Output/results.sqlite"
+# rows inserted per transaction
+sink_batch_size = 50000
+# query API (modules/query.py) - size of the in-process cache of the recently requested stream slices
+query_cache_max_bytes = 256 * 2 ** 20
+
+# processing
+# "serial" - process each file one after another, "parallel" - fan the per-stream work out to a process pool,
+# "pipelined" - reader threads parse the next files while the current ones are computed on a process pool, and the
+# interval-level rows are written as soon as each stream is done (see benchmarks/bench_pipeline.py)
+processing_mode = "serial"
+# number of worker processes for the "parallel" mode (None -> number of cores on the machine)
+max_workers = None
+# number of files handed to a worker at a time (bigger chunks -> less IPC overhead, worse load balancing) - at most 2
+# chunks per worker are submitted ahead of the results, so the files (or archive members) aren't all taken up front
+parallel_chunksize = 4
+# "pipelined" mode - number of reader threads, compute worker processes, and the size of the queues between the stages
+# (a stage waits when the next one is that many items behind - this bounds the number of parsed files held in memory)
+pipeline_readers = 2
+pipeline_workers = 2
+pipeline_queue_size = 8
+
+# file discovery - scan the sub-directories of csv_path too (e.g., files sharded into sub-directories by ID), and the
+# order the files are processed in: None (directory order - the files are processed while the directory is still being
+# listed) | "largest_first" (the listing is sorted by size first - the parallel workers then finish at about the same
+# time; the outputs are in that order)
+discovery_recursive = False
+discovery_order = None
+# skip the files that haven't changed (size and mtime) since the last run - the manifest of the processed files is
+# saved at the end of each run (the results of the skipped files are the ones of the earlier runs, e.g., in the result
+# store)
+discovery_skip_unchanged = False
+discovery_manifest_path = f"{__root_dir__}/Output/manifest.json"
+
+# sharded batch mode (python -m modules.batch) - the files are split into shards of batch_shard_size files, put on a
+# durable work queue (SQLite), and claimed by worker processes that write the partial results of each shard; a reducer
+# combines them once every shard is done. A claimed shard whose worker hasn't renewed its lease for batch_lease_seconds
+# (e.g., the worker crashed) is claimed again - up to batch_max_attempts times
+batch_queue_path = f"{__root_dir__}/batches/queue.sqlite"
+batch_partials_path = f"{__root_dir__}/batches/"
+batch_shard_size = 16
+# worker processes started by "python -m modules.batch run" (None -> number of cores on the machine)
+batch_workers = None
+batch_lease_seconds = 300
+batch_max_attempts = 3
+
+# intake
+# "memory" - the whole file is loaded into a DataFrame, "typed" - same, but the dtypes are passed to the reader (no
+# conversion copies, and dttm_utc isn't parsed since the timestamp column holds the same information), "chunked" - the
+# file is streamed in chunks of chunk_size rows; the counters and rollups are updated chunk by chunk, so peak memory
+# depends on the chunk size and not the file length
+intake_mode = "memory"
+chunk_size = 100000
+# typed intake - read "estimated" as int8 and "anomaly" as float32
+downcast_intake = False
+
+# incremental processing of append-only files (uses the chunked intake) - a checkpoint is kept for each stream, so that
+# the next run only parses the rows added since the previous one. The already processed bytes are hashed again on each
+# run (read, not parsed): a file that was changed other than by appending to it is processed from the start
+incremental = False
+checkpoint_path = f"{__root_dir__}/checkpoints/"
+
+# parsed stream cache (used by the "memory" and "typed" intakes) - files that haven't changed since the last run are
+# loaded from a binary cache instead of being re-parsed
+use_cache = False
+cache_path = f"{__root_dir__}/cache/"
+# "npy" (one .npy per column - memory-mapped when cache_mmap is set) | "parquet" | "feather" (both require pyarrow)
+cache_format = "npy"
+cache_mmap = True
+# least recently used entries are evicted beyond this size
+cache_max_bytes = 2 * 2 ** 30
+# store the content hash of each file, and compare it on every load - a file whose mtime changed but not its content is
+# still loaded from the cache; off -> size and mtime only (the file isn't read a second time to be hashed)
+cache_verify_hash = False
+
+# rollups
+# plan of the interval-level groupings (15min | hour | day | week | month) and of their statistics (count, sum, min, max,
+# mean, median, std, p<N> percentiles) - YAML or JSON; the daily and hourly groupings are used when the file is missing
+rollup_plan_path = f"{__root_dir__}/rollup_plan.yaml"
+# "flat" - each grouping is computed from the raw intervals (the same output as a groupby of the intervals),
+# "hierarchical" - groupings with a "derived_from" config (e.g., daily) are computed from the partial aggregates of a
+# finer grouping (e.g., hourly); the derived sums/means/std then can differ from "flat" in the last digits
+rollup_mode = "flat"
+# bucket the intervals by the local time of each stream's site (TIME_ZONE of the site metadata, DST included) instead of
+# UTC - the hour/day/week/month keys are then local
+local_time = False
+# site metadata - SITE_ID (the stream ID), TIME_ZONE, TZ_OFFSET (used when the time zone is unknown)
+site_meta_path = f"{__root_dir__}/all-data.tar/meta/all_sites.csv"
+# median of a derived grouping: "exact" - merge of the finer grouping's (already sorted) values, "approximate" - count
+# weighted median of the finer grouping's medians (no access to the values)
+median_mode = "exact"
+
+# ranking of the streams by their count of 0's and NaN's - only the streams with one of the top n distinct counts are
+# ranked; the ranking is bounded by n, and not by the number of streams. None -> every stream that isn't ignored is
+# ranked (the same ranks as before the ranking was bounded), and the ranking is unbounded - it grows with the streams
+rank_top_n = None
+
+# stream similarity - the top k most similar pairs of streams, based on one column of the interval-level results
+# (0 -> disabled). That column of the grouping is spilled to disk as each stream is done, and laid out as a float32
+# matrix file (number of streams * number of intervals * 4 bytes) at similarity_matrix_path, removed after the run
+similarity_top_k = 1
+# "correlation" (Pearson's) | "euclidean" (distance between the z-normalized profiles) - both over the intervals that
+# the two streams have values for
+similarity_metric = "correlation"
+similarity_grouping = "hour_interval"
+similarity_value_column = "hour_mean"
+similarity_matrix_path = f"{__root_dir__}/Output/similarity_profiles.npy"
+# pairs of streams that share fewer intervals aren't compared
+similarity_min_overlap = 24
+# number of streams compared against another block of streams at a time - memory is bounded by the two blocks of the
+# matrix (block size * number of intervals) and their scores (block size * block size), whatever the number of streams
+similarity_block_size = 1024
+
+# approximate nearest-neighbour index of the streams' 24-hour load shapes - updated with the hourly results of every run,
+# and queried with the --similar-to flag of main.py
+use_similarity_index = False
+similarity_index_path = f"{__root_dir__}/index/similarity_index.npz"
+# hash tables/bits of the random-projection index (more tables -> better recall, more bits -> faster queries)
+similarity_index_tables = 8
+similarity_index_bits = 12
+# number of buckets searched in each table (the buckets one bit away from the query's are searched when > 1)
+similarity_index_probes = 1
+
+# instrumentation - calls, wall time, rows (-> rows per second) and peak memory of each stage (file listing, intake,
+# classification, the grouping definitions and each calc), written once per run as a JSON summary (None -> not written)
+metrics_path = f"{__root_dir__}/Output/metrics.json"
+# same metrics in the Prometheus text format (e.g., for the textfile collector of the node exporter) - None -> not written
+metrics_prometheus_path = None
+# peak memory of each stage - traced with tracemalloc, which slows the run down
+metrics_trace_memory = False
+# number of slowest streams listed in the summary
+metrics_slowest_streams = 10
+# profiles of the n slowest streams, in the "serial" and "parallel" modes (0 -> disabled) - "cprofile" (stream_<id>.prof,
+# for pstats/snakeviz) | "tracemalloc" (top allocation sites, stream_<id>.txt)
+profile_slowest = 0
+profile_mode = "cprofile"
+profile_path = f"{__root_dir__}/profiles/"
 
 # logging
 # ######################################################################################################################
@@ -2,79 +2,329 @@
 # Press Double Shift to search everywhere for classes, files, tool windows, actions, and settings.
 
 
+import os
 import config
+import argparse
+import itertools
 import pandas as pd
 import datetime
-from modules import csv, smtp
-from modules.DataStream import calculate_interval_level_data, calculate_stream_level_data, get_data_stream, \
-	get_stream_id
+import tracemalloc
+from functools import partial
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from modules import ann, archive, cache, csv, metrics, pipeline, ranking, similarity, sinks, smtp, writers
+from modules.DataStream import DataStream, get_data_stream, get_data_stream_results, get_stream_id, process_data_stream
 
 
-def main():
+def get_stream_results(path: str, file_list: list[str], processing_mode: str = "serial",
+                       max_workers: int | None = None,
+                       timings: pipeline.StageTimings | None = None,
+                       profiles: metrics.StreamProfiles | None = None,
+                       rebuild_cache: bool = False) -> Iterator[tuple[pd.DataFrame, dict]]:
+	"""Yields the (stream-level, interval-level) results for each file - in the same order as file_list, regardless
+	of the processing mode, so that the merged output is identical between the serial and parallel runs. The wall time
+	(and the profile, when profiles are kept) of each stream is added to the metrics of the run.
+	rebuild_cache - every file is parsed, and its entry of the stream cache overwritten"""
+	stream_id_pattern = csv.get_input_source(config.input_format)[2]
+	tasks = ((get_stream_id(pattern=stream_id_pattern, file=file), f"{path}{file}") for file in file_list)
+	yield from get_task_results(tasks, processing_mode=processing_mode, max_workers=max_workers, timings=timings,
+	                            profiles=profiles, rebuild_cache=rebuild_cache)
+
+
+def get_task_results(tasks: Iterable[tuple[int, str]], processing_mode: str = "serial", max_workers: int | None = None,
+                     timings: pipeline.StageTimings | None = None,
+                     profiles: metrics.StreamProfiles | None = None,
+                     rebuild_cache: bool = False) -> Iterator[tuple[pd.DataFrame, dict]]:
+	"""Same as get_stream_results, for (stream_id, file_path) tasks - taken lazily (e.g., from the file discovery), so
+	the first files are processed while the next ones are still being listed, in every processing mode"""
+	if processing_mode not in ("parallel", "pipelined", "serial"):
+		raise ValueError(f"Invalid processing mode : {processing_mode}")
+
+	id_tasks, path_tasks = itertools.tee(tasks)
+	stream_ids = (stream_id for stream_id, _ in id_tasks)
+	file_paths = (file_path for _, file_path in path_tasks)
+	valid_column_names = itertools.repeat(config.valid_column_names)
+	# passed with every task (not set in config) - so that the worker processes get it under every start method
+	rebuild_cache_flags = itertools.repeat(rebuild_cache)
+	profile_mode = profiles.get_mode() if profiles is not None else None
+
+	if processing_mode == "parallel":
+		# the workers send their metrics back with each result
+		run_stream = partial(metrics.run_stream, process_data_stream, profile_mode=profile_mode, worker=True)
+		task_args = zip(stream_ids, file_paths, valid_column_names, rebuild_cache_flags)
+		chunks = iter(lambda: list(itertools.islice(task_args, config.parallel_chunksize)), [])
+
+		# the tasks are taken lazily (e.g., the members of an archive, with their contents) - at most 2 chunks per worker
+		# are submitted ahead of the consumer, instead of every task up front
+		n_workers = max_workers or os.cpu_count() or 1
+		with ProcessPoolExecutor(max_workers=max_workers) as executor:
+			in_flight = deque(executor.submit(run_chunk, run_stream, chunk)
+			                  for chunk in itertools.islice(chunks, 2 * n_workers))
+			try:
+				while len(in_flight) > 0:
+					# in the order of the tasks
+					results = in_flight.popleft().result()
+					chunk = next(chunks, None)
+					if chunk is not None:
+						in_flight.append(executor.submit(run_chunk, run_stream, chunk))
+
+					for res, report in results:
+						metrics.add_stream_report(report, profiles)
+						yield res
+			finally:
+				for future in in_flight:
+					future.cancel()
+	elif processing_mode == "pipelined":
+		# the files are parsed on the reader threads, and the streams computed on a process pool (one stream per chunk) -
+		# the workers send their metrics (and the profile of the computation) back with each result, as in "parallel" mode
+		run_stream = partial(metrics.run_stream, compute_data_stream, profile_mode=profile_mode, worker=True)
+		task_args = zip(stream_ids, file_paths, valid_column_names, rebuild_cache_flags)
+		with ProcessPoolExecutor(max_workers=config.pipeline_workers) as executor:
+			for results in pipeline.Pipeline(read=read_chunk,
+			                                 compute=partial(run_chunk, run_stream),
+			                                 n_readers=config.pipeline_readers,
+			                                 n_workers=config.pipeline_workers,
+			                                 queue_size=config.pipeline_queue_size,
+			                                 timings=timings,
+			                                 executor=executor).run(task_args):
+				for res, report in results:
+					metrics.add_stream_report(report, profiles)
+					yield res
+	else:
+		run_stream = partial(metrics.run_stream, process_data_stream, profile_mode=profile_mode)
+		for res, report in map(run_stream, stream_ids, file_paths, valid_column_names, rebuild_cache_flags):
+			metrics.add_stream_report(report, profiles)
+			yield res
+
+
+def run_chunk(run_stream: Callable, chunk: list[tuple]) -> list[tuple]:
+	"""Runs a chunk of tasks in a worker process - the results are sent back together (one round trip per chunk)"""
+	return [run_stream(*task) for task in chunk]
+
+
+def read_chunk(stream_id: int, file_path: str | archive.ArchiveMember, valid_column_names: list[str],
+               rebuild_cache: bool = False) -> list[tuple]:
+	"""Read stage of the "pipelined" mode - the parsed stream, as a chunk of one task for compute_data_stream"""
+	return [(stream_id, get_data_stream(stream_id=stream_id, file_path=file_path, valid_column_names=valid_column_names,
+	                                    rebuild_cache=rebuild_cache))]
+
+
+def compute_data_stream(stream_id: int, ds: DataStream) -> tuple[pd.DataFrame, dict]:
+	"""Compute stage of the "pipelined" mode - in a worker process"""
+	return get_data_stream_results(ds)
+
+
+def main(rebuild_cache: bool = False):
+	"""rebuild_cache - every file is parsed, and its entry of the stream cache overwritten (--rebuild-cache)"""
 	# init ---------------------------------------------------------------------------------------------------------------
-	path = config.csv_path
-	pattern = config.csv_pattern
+	path, pattern, stream_id_pattern = csv.get_input_source(config.input_format)
 	logger = config.logger
 
 	logger.info("Process Started \n\n")
 	start_time = datetime.datetime.now()
+
+	metrics.get_metrics().reset()
+	if config.metrics_trace_memory:
+		tracemalloc.start()
 	# --------------------------------------------------------------------------------------------------------------------
 
+	# files that haven't changed since the last run are skipped
+	manifest = csv.FileManifest(config.discovery_manifest_path) if config.discovery_skip_unchanged else None
+
 	try:
-		file_list = csv.get_list_of_files(path, pattern)
-	except NotADirectoryError as e:
+		if config.archive_path is not None:
+			# the files are read out of the archive - the discovery settings don't apply
+			path = config.archive_path
+			tasks = archive.iter_archive_tasks(path, pattern, stream_id_pattern=stream_id_pattern,
+			                                   queue_size=config.archive_queue_size)
+		else:
+			records = csv.iter_file_records(path, pattern, stream_id_pattern=stream_id_pattern,
+			                                recursive=config.discovery_recursive, order=config.discovery_order,
+			                                manifest=manifest)
+			tasks = ((record.stream_id, record.path) for record in records)
+
+		# the files are listed (or decompressed) while they are processed - only the first one is needed to know that
+		# there are any
+		first_task = next(tasks, None)
+	except (NotADirectoryError, FileNotFoundError, ValueError) as e:
 		return smtp.send_email_notification(level="Critical", message=repr(e))
 
-	if len(file_list) == 0:
+	if first_task is None:
 		return smtp.send_email_notification(level="Warning", message="No files found")
+	tasks = itertools.chain([first_task], tasks)
 
-	# initialize summary objects for stream/interval level data
-	stream_df = pd.DataFrame()
-	interval_df = dict()
-
-	for file in file_list:
-		stream_id = get_stream_id(pattern=config.stream_id_pattern, file=file)
+	# the stream-level rows are written as each stream is done - the ranks are filled in at the end
+	stream_writer = writers.StreamLevelWriter(config.output_stream_path)
+	# profiles compared by the similarity engine - spilled to disk as each stream is done, instead of being collected
+	profiles_spool = similarity.ProfileSpool(config.similarity_matrix_path) if config.similarity_top_k > 0 else None
+	# dense rank of the streams - updated as each stream is done
+	stream_ranking = ranking.StreamRanking(n=config.rank_top_n)
 
-		logger.info(f"Start processing Stream(ID): {stream_id}")
+	# load shape index of the streams - updated one stream at a time
+	index = get_similarity_index() if config.use_similarity_index else None
 
-		# get DataStream object for the file
-		ds = get_data_stream(stream_id=stream_id,
-		                     file_path=f"{path}{file}",
-		                     valid_column_names=config.valid_column_names)
+	# the interval-level rows are written as each stream is done, instead of being collected - {grouping_type: writer}
+	interval_writers = dict()
+	timings = pipeline.StageTimings()
+	profiles = metrics.StreamProfiles(n=config.profile_slowest, mode=config.profile_mode) \
+		if config.profile_slowest > 0 else None
 
-		logger.info(f"Getting the stream-level data and classifications for Stream(ID): {stream_id}")
+	# persistent result store - every run is written as a batch
+	sink = sinks.get_result_sink(config.result_sink, path=config.sqlite_path, batch_size=config.sink_batch_size) \
+		if config.result_sink is not None else None
 
-		# TODO - call get_stream_level_results, and assign to temp DF. Check for ignore, and then append to main df.
-		stream_df = calculate_stream_level_data(ds=ds,
-		                                        stream_df=stream_df)
+	logger.info(f"Processing the files of '{path}' in '{config.processing_mode}' mode")
+	try:
+		for stream_level_res, interval_level_res in get_task_results(tasks=tasks,
+		                                                             processing_mode=config.processing_mode,
+		                                                             max_workers=config.max_workers,
+		                                                             timings=timings,
+		                                                             profiles=profiles,
+		                                                             rebuild_cache=rebuild_cache):
+			with metrics.timer("ranking", rows=len(stream_level_res.index)):
+				stream_ranking.add_stream_level_results(stream_level_res)
+			with metrics.timer("write_stream_results", rows=len(stream_level_res.index)):
+				stream_writer.write(stream_level_res)
+				if sink is not None:
+					sink.write_stream_level_results(stream_level_res)
 
-		if ds.is_valid_stream() is not True:
-			logger.info(f"Since stream is invalid - skipping the interval-level calculations, and going to the next file")
-			continue
+			with metrics.timer("write_interval_results", rows=sum(len(res["df"].index)
+			                                                      for res in interval_level_res.values())):
+				writers.write_interval_level_results(interval_writers, interval_level_res,
+				                                     output_format=config.output_format,
+				                                     row_group_size=config.output_row_group_size)
+				if sink is not None:
+					sink.write_interval_level_results(interval_level_res)
 
-		logger.info(f"Getting the interval-level data/calculations for Stream(ID): {stream_id})")
-		calculate_interval_level_data(ds=ds,
-		                              grouping_configs=ds.get_grouping_config(),
-		                              interval_df=interval_df)
+			# only the interval keys and the value column used by the similarity engine are kept
+			if profiles_spool is not None and config.similarity_grouping in interval_level_res:
+				grouping_df = interval_level_res[config.similarity_grouping]["df"]
+				profiles_spool.add_profile(stream_id=stream_level_res["stream_id"].iloc[0],
+				                           keys=grouping_df[get_similarity_columns(grouping_df)[1:-1]],
+				                           values=grouping_df[config.similarity_value_column].to_numpy())
 
-		logger.info(f"Finished processing Stream(ID): {stream_id}")
+			if index is not None and "hour_interval" in interval_level_res:
+				index.add_interval_results(interval_level_res["hour_interval"]["df"])
+	except (OSError, ValueError) as e:
+		# e.g., an archive that fails to decompress part-way - the outputs of the streams done so far are closed, and the
+		# batch of the result store is marked as failed
+		logger.critical(f"Processing stopped after {stream_writer.get_rows()} stream(s) : {repr(e)}")
+		stream_writer.close(stream_ranking.get_ranks())
+		writers.close_writers(interval_writers)
+		if sink is not None:
+			sink.close(status="failed")
+		if profiles_spool is not None:
+			profiles_spool.remove()
+		write_metrics(profiles)
+		return smtp.send_email_notification(level="Critical", message=repr(e))
 
-	# calculate the dense rank for records that aren't being ignored
-	stream_df["rank"] = stream_df.loc[stream_df["ignore"] == False]["count of 0 and NaN"].rank(ascending=False,
-	                                                                                           method="dense").astype(
-																																																							"int32")
+	# dense rank of the records that aren't being ignored (the top config.rank_top_n ranks)
+	with metrics.timer("ranking", rows=len(stream_ranking)):
+		ranks = stream_ranking.get_ranks()
 	# store output
-	logger.info(f"Writing Stream - summary - DataFrame to CSV")
-	stream_df.to_csv(config.output_stream_path, index=False)
+	logger.info(f"Writing Stream - summary - {stream_writer.get_rows()} rows to '{stream_writer.get_path()}'")
+	with metrics.timer("write_stream_results", rows=stream_writer.get_rows()):
+		stream_writer.close(ranks)
+
+	for interval_type, writer in interval_writers.items():
+		logger.info(f"Wrote {writer.get_rows()} Interval- summary - rows of type : {interval_type} - to "
+		            f"'{writer.get_path()}'")
+	writers.close_writers(interval_writers)
 
-	for interval_type, df in interval_df.items():
-		logger.info(f"Writing Interval- summary -  DataFrame of type : {interval_type} - to CSV")
-		df["df"].to_csv(df["output_path"], index=False)
+	if sink is not None:
+		sink.write_stream_ranks(ranks)
+		sink.close()
+		logger.info(f"Batch {sink.get_batch_id()} written to the result store")
+
+	if config.processing_mode == "pipelined":
+		timings.log()
+
+	if profiles_spool is not None and len(profiles_spool) > 0:
+		# the profiles are laid out as a matrix file, and compared one block of streams at a time
+		stream_ids, matrix = profiles_spool.get_matrix()
+		similar_df = similarity.top_k_similar_pairs(stream_ids=stream_ids, matrix=matrix, k=config.similarity_top_k,
+		                                            metric=config.similarity_metric,
+		                                            block_size=config.similarity_block_size,
+		                                            min_overlap=config.similarity_min_overlap)
+		del matrix
+		profiles_spool.remove()
+		logger.info(f"Most similar streams ({config.similarity_metric}) : {similar_df.to_dict(orient='records')}")
+		similar_df.to_csv(config.output_similarity_path, index=False)
+
+	if index is not None:
+		logger.info(f"Saving the similarity index of {len(index)} streams")
+		index.save(config.similarity_index_path)
+
+	if config.use_cache:
+		# keep the stream cache within its size limit
+		cache.get_stream_cache().evict()
+
+	if manifest is not None:
+		manifest.save()
+
+	write_metrics(profiles)
 
 	logger.info("Process Ended \n\n")
 	end_time = datetime.datetime.now()
 	logger.info(f"Duration: {(end_time-start_time).total_seconds()}")
 
 
+def write_metrics(profiles: metrics.StreamProfiles | None = None) -> None:
+	"""Logs the per-stage metrics of the run, and writes the summary/Prometheus metrics and the profiles"""
+	registry = metrics.get_metrics()
+	if config.metrics_trace_memory and tracemalloc.is_tracing():
+		tracemalloc.stop()
+
+	registry.log()
+	if config.metrics_path is not None:
+		registry.write_summary(config.metrics_path)
+		config.logger.info(f"Metrics summary written to '{config.metrics_path}'")
+	if config.metrics_prometheus_path is not None:
+		registry.write_prometheus(config.metrics_prometheus_path)
+
+	if profiles is not None:
+		for path in profiles.write(config.profile_path):
+			config.logger.info(f"Profile of a slow stream written to '{path}'")
+
+
+def get_similarity_columns(df: pd.DataFrame) -> list[str]:
+	"""stream ID, interval keys, and the value column compared by the similarity engine"""
+	return ["stream_id"] + [c for c in df.columns if c.endswith("_interval")] + [config.similarity_value_column]
+
+
+def get_similarity_index() -> ann.SimilarityIndex:
+	return ann.get_index(path=config.similarity_index_path, n_tables=config.similarity_index_tables,
+	                     n_bits=config.similarity_index_bits)
+
+
+def print_similar_streams(stream_id: int, k: int) -> None:
+	index = get_similarity_index()
+	if stream_id not in index:
+		config.logger.warning(f"Stream(ID): {stream_id} isn't in the similarity index")
+		return
+
+	print(index.query_stream(stream_id, k=k, n_probes=config.similarity_index_probes).to_string(index=False))
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Stream-level and interval-level summaries of the meter data")
+	parser.add_argument("--clear-cache", action="store_true",
+	                    help="remove every entry of the parsed stream cache, and exit")
+	parser.add_argument("--rebuild-cache", action="store_true",
+	                    help="re-parse every file, and overwrite its entry in the parsed stream cache")
+	parser.add_argument("--similar-to", type=int, metavar="STREAM_ID",
+	                    help="print the streams with the most similar load shape (from the similarity index), and exit")
+	parser.add_argument("--top-k", type=int, default=10, help="number of streams printed by --similar-to")
+	return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
-	main()
+	args = parse_args()
+
+	if args.clear_cache:
+		config.logger.info(f"Removed {cache.get_stream_cache().clear()} stream cache entries")
+	elif args.similar_to is not None:
+		print_similar_streams(stream_id=args.similar_to, k=args.top_k)
+	else:
+		main(rebuild_cache=args.rebuild_cache)
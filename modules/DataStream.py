@@ -1,9 +1,21 @@
+import io
 import numpy as np
 import pandas as pd
+import os
 import re
+import config
 from typing import List
-from config import __root_dir__, logger
-from collections.abc import Callable
+from config import chunk_size, downcast_intake, intake_mode, logger, median_mode, rollup_mode, \
+	use_cache
+from collections.abc import Callable, Mapping
+from modules import archive, cache, csv, greenbutton, incremental, metrics, rollup, rollup_plan, timezones
+
+# dtypes passed to the reader by the typed intake (and the downcast overrides)
+__intake_dtypes__ = {"timestamp": "int64", "value": "float64", "estimated": "int64", "anomaly": "float64"}
+__downcast_dtypes__ = {"estimated": "int8", "anomaly": "float32"}
+
+# number of values classified at a time by classify_values (fits in the CPU cache)
+__classify_block_size__ = 2 ** 15
 
 
 class DataStream():
@@ -22,9 +34,24 @@ class DataStream():
 	__total_intervals__: int | None
 	__group_by__: List[str] | List[None]
 
-	__grouping_config__: dict
+	# shared by every stream (read-only) - see rollup_plan.get_grouping_config
+	__grouping_config__: Mapping
 	__calcs_config__: dict
 
+	# rollup levels already computed for the current data - {grouping_type: (grouping_config, Segments | Partials)}
+	__rollup_levels__: dict
+
+	# filled by the chunked intake (the full DataFrame is never held in memory):
+	# counts of the 0/NaN/1 values - {"zero": int, "nan": int, "one": int}
+	__value_counts__: dict | None
+	# interval-level results of each (complete) block of days - {grouping_type: [pd.DataFrame, ...]}
+	__chunked_results__: dict
+	# rows of the last (open) buckets, their results - {grouping_type: pd.DataFrame}, and the last complete bucket of
+	# each interval - {interval: bucket ID} (see rollup_plan.Interval)
+	__open_rows__: pd.DataFrame | None
+	__open_results__: dict
+	__last_computed_buckets__: dict | None
+
 	def __init__(self, stream_id: int, valid_column_names: List[str]):
 		self.__stream_id__ = stream_id
 
@@ -36,47 +63,34 @@ class DataStream():
 		self.__total_intervals__ = None
 		self.__file_intake_error__ = None
 		self.__group_by__ = []
-
-		# List of groupings used, and calculations that should be ran
-		# --------------------------------------------------------------------------------------------------------------------
-		self.__grouping_config__ = {
-			"day_interval": {
-				"definition": self.generate_daily_grouping,
-				"calcs": [{"column_name": "day_max", "calc_type": "max"},
-				          {"column_name": "day_min", "calc_type": "min"},
-				          {"column_name": "day_median", "calc_type": "median"},
-				          {"column_name": "day_mean", "calc_type": "mean"}],
-				"output_path": f"{__root_dir__}/Output/daily_interval_data.csv"
-			},
-			"hour_interval": {
-				"definition": self.generate_hourly_grouping,
-				"calcs": [{"column_name": "hour_max", "calc_type": "max"},
-				          {"column_name": "hour_min", "calc_type": "min"},
-				          {"column_name": "hour_median", "calc_type": "median"},
-				          {"column_name": "hour_mean", "calc_type": "mean"}],
-				"output_path": f"{__root_dir__}/Output/hourly_interval_data.csv"
-			}
-		}
-
-		# mapping of calculations to function names
-		self.__calcs_config__ = {
-			"max": {
-				"func": self.calculate_max,
-				"args": ["value", self.get_group_by]
-			},
-			"min": {
-				"func": self.calculate_min,
-				"args": ["value", self.get_group_by]
-			},
-			"mean": {
-				"func": self.calculate_mean,
-				"args": ["value", self.get_group_by]
-			},
-			"median": {
-				"func": self.calculate_median,
-				"args": ["value", self.get_group_by]
-			}
-		}
+		self.__rollup_levels__ = dict()
+		self.__value_counts__ = None
+		self.__chunked_results__ = dict()
+		self.__open_rows__ = None
+		self.__open_results__ = dict()
+		self.__last_computed_buckets__ = None
+
+		# groupings, and the calculations that are run for each of them - compiled once from the rollup plan (see
+		# rollup_plan.py), and shared by every DataStream
+		self.__grouping_config__ = rollup_plan.get_grouping_config(config.rollup_plan_path)
+
+		# mapping of calculations to the rollup kernels; all the calcs of a grouping are computed in a single pass
+		self.__calcs_config__ = rollup_plan.get_calcs_config()
+
+	def __getstate__(self) -> dict:
+		"""The shared grouping/calcs configs (and the rollup levels computed with them) aren't pickled - e.g., when the
+		stream is sent to a worker process to be computed (pipelined mode), they are compiled again there, once per
+		process"""
+		state = self.__dict__.copy()
+		for attribute in ["__grouping_config__", "__calcs_config__", "__rollup_levels__"]:
+			state.pop(attribute, None)
+		return state
+
+	def __setstate__(self, state: dict) -> None:
+		self.__dict__.update(state)
+		self.__rollup_levels__ = dict()
+		self.__grouping_config__ = rollup_plan.get_grouping_config(config.rollup_plan_path)
+		self.__calcs_config__ = rollup_plan.get_calcs_config()
 
 	# ------------------------------------------------------------------------------------------------------------------
 
@@ -94,6 +108,12 @@ class DataStream():
 	def get_grouping_config(self):
 		return self.__grouping_config__
 
+	def get_key_timestamps(self, timestamps: np.ndarray) -> np.ndarray:
+		"""Timestamps that the interval keys are computed from - UTC, or the local time of the site (config.local_time)"""
+		if not config.local_time:
+			return timestamps
+		return timezones.get_local_timestamps(self.__stream_id__, timestamps, path=config.site_meta_path)
+
 	def get_output_path(self, interval_type: str) -> str:
 		return self.__grouping_config__[interval_type]["output_path"]
 
@@ -114,6 +134,13 @@ class DataStream():
 		return self.__is_valid_stream__
 
 	def read_csv_data(self, file: str) -> bool:
+		self.__rollup_levels__ = dict()
+		self.__value_counts__ = None
+		self.__chunked_results__ = dict()
+		self.__open_rows__ = None
+		self.__open_results__ = dict()
+		self.__last_computed_buckets__ = None
+
 		try:
 			self.__df__ = pd.read_csv(file, usecols=self.__valid_column_names__, index_col=False).astype({
 				"timestamp": "int64", "dttm_utc": "datetime64[ns]", "value": "float64",
@@ -138,62 +165,332 @@ class DataStream():
 
 		return self.__is_valid_stream__
 
-	# --------------------------------------------------------------------------------------------------------------------
+	def read_greenbutton_data(self, file) -> bool:
+		"""Same as read_csv_data, for a Green Button (ESPI) XML file (path or binary file object) - the readings are
+		parsed incrementally (see greenbutton.py) into the same columns"""
+		self.__rollup_levels__ = dict()
+		self.__value_counts__ = None
+		self.__chunked_results__ = dict()
+		self.__open_rows__ = None
+		self.__open_results__ = dict()
+		self.__last_computed_buckets__ = None
 
-	# Calculation member functions
-	# --------------------------------------------------------------------------------------------------------------------
-	def calculate_max(self, operation_field: str, group_by: Callable) -> pd.DataFrame:
-		return self.__df__.groupby(group_by())[operation_field].agg(["max"])
+		try:
+			df = greenbutton.read_interval_readings(file)
+			missing = [column for column in self.__valid_column_names__ if column not in df.columns]
+			if len(missing) > 0:
+				raise ValueError(f"Columns expected but not found: {missing}")
+
+			self.__df__ = df[self.__valid_column_names__]
+			self.__total_intervals__ = len(self.__df__.index)
 
-	def calculate_min(self, operation_field: str, group_by: Callable) -> pd.DataFrame:
-		return self.__df__.groupby(group_by())[operation_field].agg(["min"])
+			if self.__total_intervals__ > 0:
+				self.__is_valid_stream__ = True
+				self.__df__.insert(0, "stream_id", self.__stream_id__)
 
-	def calculate_mean(self, operation_field: str, group_by: Callable) -> pd.DataFrame:
-		return self.__df__.groupby(group_by())[operation_field].agg(["mean"])
+		except ValueError as err:
+			self.__df__ = pd.DataFrame()
+			self.__is_valid_stream__ = False
+			self.__file_intake_error__ = err
+
+		return self.__is_valid_stream__
+
+	def set_df(self, df: pd.DataFrame) -> bool:
+		"""Uses an already parsed DataFrame (e.g., from the stream cache) instead of reading the file"""
+		self.__rollup_levels__ = dict()
+		self.__value_counts__ = None
+		self.__chunked_results__ = dict()
+		self.__open_rows__ = None
+		self.__open_results__ = dict()
+		self.__last_computed_buckets__ = None
+
+		self.__df__ = df
+		self.__total_intervals__ = len(self.__df__.index)
+		self.__is_valid_stream__ = self.__total_intervals__ > 0
+
+		return self.__is_valid_stream__
+
+	def read_csv_data_typed(self, file: str | io.BytesIO, downcast: bool = False) -> bool:
+		"""Same as read_csv_data, but the dtypes are passed to the reader, so there are no conversion copies afterwards.
+		dttm_utc isn't parsed when the timestamp column is present (the groupings only use the timestamp), and the
+		stream ID is kept as metadata (get_stream_id) instead of a repeated column. file is a path, or a binary file
+		object (e.g., a member of an archive)"""
+		self.__rollup_levels__ = dict()
+		self.__value_counts__ = None
+		self.__chunked_results__ = dict()
+		self.__open_rows__ = None
+		self.__open_results__ = dict()
+		self.__last_computed_buckets__ = None
+
+		dtypes = {**__intake_dtypes__, **(__downcast_dtypes__ if downcast else dict())}
+		usecols = self.__valid_column_names__
+		if "timestamp" in usecols:
+			usecols = [column for column in usecols if column != "dttm_utc"]
+
+		try:
+			# header only - same column validation as the in-memory intake
+			pd.read_csv(file, usecols=self.__valid_column_names__, index_col=False, nrows=0)
+			if not isinstance(file, str):
+				file.seek(0)
+
+			self.__df__ = pd.read_csv(file, usecols=usecols, index_col=False,
+			                          dtype={column: dtypes[column] for column in usecols if column in dtypes},
+			                          parse_dates=[column for column in usecols if column == "dttm_utc"])
+			self.__total_intervals__ = len(self.__df__.index)
+			self.__is_valid_stream__ = self.__total_intervals__ > 0
+
+		except ValueError as err:
+			self.__df__ = pd.DataFrame()
+			self.__is_valid_stream__ = False
+			self.__file_intake_error__ = err
+
+		return self.__is_valid_stream__
 
-	def calculate_median(self, operation_field: str, group_by: Callable) -> pd.DataFrame:
-		return self.__df__.groupby(group_by())[operation_field].agg(["median"])
+	def read_csv_data_chunked(self, file: str, chunk_size: int, checkpoint: dict | None = None,
+	                          end: int | None = None) -> bool:
+		"""Streams the file in chunks of chunk_size rows. The 0/NaN/1 counters are updated on each chunk, and the
+		interval-level results are computed for each block of rows whose buckets are complete in every grouping (e.g.,
+		complete days, or complete weeks and months) - the rows of the last (possibly incomplete) buckets of a chunk are
+		carried over to the next one.
+		Falls back to the in-memory intake if the file isn't sorted by time (rows for a day that was already computed).
+
+		checkpoint - state of a previous intake of the same (append-only) file (see get_chunked_intake_state); only the
+		             bytes after checkpoint["offset"] are read
+		end - only the bytes before this offset are read (e.g., the file is still being written to)"""
+		self.start_chunked_intake(checkpoint)
+
+		try:
+			# header only - same column validation as the in-memory intake
+			pd.read_csv(file, usecols=self.__valid_column_names__, index_col=False, nrows=0)
+
+			start = 0 if checkpoint is None else checkpoint["offset"]
+			end = os.path.getsize(file) if end is None else end
+
+			if start < end:
+				# "estimated" and "anomaly" are parsed with the same dtypes as the in-memory intake (so that the same files
+				# are rejected), then dropped - only the timestamps and values are kept
+				with csv.open_byte_range(file, start, end) as f, \
+					pd.read_csv(f, usecols=list(__intake_dtypes__), index_col=False, chunksize=chunk_size,
+					            header=0 if checkpoint is None else None,
+					            names=None if checkpoint is None else pd.read_csv(file, nrows=0).columns.tolist(),
+					            dtype=__intake_dtypes__) as reader:
+					for chunk in reader:
+						if not self.update_chunked_intake(chunk[["timestamp", "value"]]):
+							logger.warning(f"Stream(ID): {self.__stream_id__} isn't sorted by time - reading the whole file")
+							# same byte range as the chunked intake (the rows after end may still be being written)
+							with csv.open_byte_range(file, 0, end) as whole_file:
+								return self.read_csv_data(whole_file)
+
+			self.finish_chunked_intake()
+
+		except ValueError as err:
+			self.__df__ = pd.DataFrame()
+			self.__is_valid_stream__ = False
+			self.__file_intake_error__ = err
+			self.__value_counts__ = None
+			self.__chunked_results__ = dict()
+			self.__open_rows__ = None
+
+		return self.__is_valid_stream__
+
+	def start_chunked_intake(self, checkpoint: dict | None = None) -> None:
+		"""Resets the state of the chunked intake - or restores it from the checkpoint of a previous intake"""
+		self.__df__ = pd.DataFrame()
+		self.__rollup_levels__ = dict()
+		self.__open_results__ = dict()
+
+		if checkpoint is None:
+			self.__value_counts__ = {"zero": 0, "nan": 0, "one": 0}
+			self.__chunked_results__ = {grouping_type: [] for grouping_type in self.__grouping_config__}
+			self.__total_intervals__ = 0
+			self.__open_rows__ = None
+			self.__last_computed_buckets__ = None
+		else:
+			self.__value_counts__ = dict(checkpoint["value_counts"])
+			self.__chunked_results__ = {grouping_type: [checkpoint["chunked_results"][grouping_type]]
+			                            if len(checkpoint["chunked_results"][grouping_type].index) > 0 else []
+			                            for grouping_type in self.__grouping_config__}
+			self.__total_intervals__ = checkpoint["total_intervals"]
+			self.__open_rows__ = checkpoint["open_rows"]
+			self.__last_computed_buckets__ = checkpoint["last_computed_buckets"]
+
+	def update_chunked_intake(self, chunk: pd.DataFrame) -> bool:
+		"""Adds a chunk of (timestamp, value) rows; returns False if the rows aren't sorted by time"""
+		counts = classify_values(chunk["value"].to_numpy())
+		self.__total_intervals__ += counts["total"]
+		for count_type in ["zero", "nan", "one"]:
+			self.__value_counts__[count_type] += counts[count_type]
+
+		# bucket of each row in the coarsest interval of each chain of nested groupings (see get_flush_groups) - the new
+		# rows can't be in a bucket that's already been computed
+		flush_groups = self.get_flush_groups()
+		last_computed = dict(self.__last_computed_buckets__ or {})
+		for interval in flush_groups:
+			if interval in last_computed and len(chunk.index) > 0 and \
+				rollup_plan.__intervals__[interval].get_buckets(self.get_key_timestamps(chunk["timestamp"].to_numpy())).min() <= \
+				last_computed[interval]:
+				return False
+
+		if self.__open_rows__ is not None:
+			chunk = pd.concat([self.__open_rows__, chunk], ignore_index=True)
+
+		if len(chunk.index) == 0:
+			return True
+
+		# the buckets before the last one are complete (a later row is in a later bucket) - each chain computes the ones
+		# it hasn't yet, and a row stays open until every chain is done with it (weeks and months don't nest, so a row
+		# of a complete week can still be in an open month)
+		is_open = np.zeros(len(chunk.index), dtype=bool)
+		timestamps = self.get_key_timestamps(chunk["timestamp"].to_numpy())
+		for interval, grouping_types in flush_groups.items():
+			buckets = rollup_plan.__intervals__[interval].get_buckets(timestamps)
+			is_complete = buckets < buckets.max()
+			if interval in last_computed:
+				is_complete &= buckets > last_computed[interval]
+
+			if is_complete.any():
+				for grouping_type, result in self.compute_chunked_results(chunk[is_complete], grouping_types).items():
+					self.__chunked_results__[grouping_type].append(result)
+				last_computed[interval] = int(buckets[is_complete].max())
+			is_open |= buckets == buckets.max()
+
+		self.__last_computed_buckets__ = last_computed
+		self.__open_rows__ = chunk.loc[is_open, ["timestamp", "value"]].reset_index(drop=True)
+		return True
+
+	def get_flush_groups(self) -> dict:
+		"""Groupings by the coarsest interval they nest in (or are) - {interval: [grouping_type, ...]}. The chunked intake
+		computes the groupings of a chain together, once a bucket of its coarsest interval is complete (e.g., the
+		hourly and daily groupings at the end of each day)"""
+		intervals = {grouping_type: rollup_plan.get_interval(gc) for grouping_type, gc in self.__grouping_config__.items()}
+		coarsest = [interval for interval in dict.fromkeys(intervals.values())
+		            if not any(interval.nests_in(other) for other in intervals.values())]
+
+		flush_groups = {interval.get_interval(): [] for interval in coarsest}
+		for grouping_type, interval in intervals.items():
+			chain = next(c for c in coarsest if c is interval or interval.nests_in(c))
+			flush_groups[chain.get_interval()].append(grouping_type)
+		return flush_groups
+
+	def finish_chunked_intake(self) -> None:
+		"""Computes the results of the last (open) buckets. Their rows are kept, so that a later intake can carry on from
+		them (see get_chunked_intake_state)"""
+		if self.__open_rows__ is not None and len(self.__open_rows__.index) > 0:
+			last_computed = self.__last_computed_buckets__ or {}
+			for interval, grouping_types in self.get_flush_groups().items():
+				timestamps = self.get_key_timestamps(self.__open_rows__["timestamp"].to_numpy())
+				buckets = rollup_plan.__intervals__[interval].get_buckets(timestamps)
+				is_open = buckets > last_computed[interval] if interval in last_computed else np.ones(len(buckets), bool)
+				if is_open.any():
+					results = self.compute_chunked_results(self.__open_rows__[is_open], grouping_types)
+					self.__open_results__.update(results)
+
+		self.__df__ = pd.DataFrame()
+		self.__is_valid_stream__ = self.__total_intervals__ > 0
+
+	def get_chunked_intake_state(self) -> dict | None:
+		"""State of the chunked intake - counters, results of the complete buckets, and the rows of the open ones;
+		None if the data wasn't read by the chunked intake"""
+		if self.__value_counts__ is None or len(self.__chunked_results__) == 0:
+			return None
+
+		return {"value_counts": dict(self.__value_counts__),
+		        "total_intervals": self.__total_intervals__,
+		        "last_computed_buckets": self.__last_computed_buckets__,
+		        "open_rows": (self.__open_rows__ if self.__open_rows__ is not None else
+		                      pd.DataFrame({"timestamp": np.zeros(0, "int64"), "value": np.zeros(0, "float64")})),
+		        "chunked_results": {grouping_type: rollup.concat_results(results)
+		                            for grouping_type, results in self.__chunked_results__.items()}}
+
+	def compute_chunked_results(self, block: pd.DataFrame, grouping_types: list[str]) -> dict:
+		"""Interval-level results of a block of complete buckets, for the grouping types - {grouping_type: pd.DataFrame}
+		(see read_csv_data_chunked)"""
+		self.__df__ = block.reset_index(drop=True)
+		self.__rollup_levels__ = dict()
+
+		results = {grouping_type: rollup.get_results(level=self.get_rollup_level(grouping_type, grouping_config),
+		                                             calcs=self.get_calcs(grouping_config))
+		           for grouping_type, grouping_config in self.__grouping_config__.items()
+		           if grouping_type in grouping_types}
+
+		self.__rollup_levels__ = dict()
+		return results
 
 	# --------------------------------------------------------------------------------------------------------------------
 
 	# Grouping functions
 	# --------------------------------------------------------------------------------------------------------------------
+	# the interval keys are computed from the int64 epoch with integer arithmetic (days/hours since 1970-01-01 UTC - or of
+	# the site's local time, see get_key_timestamps); they are only turned back into dates when the output is written (see
+	# rollup.format_interval_keys)
 	def generate_daily_grouping(self) -> None:
-		self.__df__["dttm_utc"] = pd.to_datetime(self.__df__["dttm_utc"])
-		self.__df__["day_interval"] = self.__df__["dttm_utc"].dt.date
+		timestamps = self.get_key_timestamps(self.__df__["timestamp"].to_numpy())
+		self.__df__["day_interval"] = (timestamps // rollup.seconds_per_day).astype("int32")
 
 		self.set_group_by(["day_interval"])
 
 	def generate_hourly_grouping(self) -> None:
-		self.__df__["dttm_utc"] = pd.to_datetime(self.__df__["dttm_utc"])
-		self.__df__["day_interval"] = self.__df__["dttm_utc"].dt.date
-		self.__df__["hour_interval"] = self.__df__["dttm_utc"].dt.hour
+		hours = self.get_key_timestamps(self.__df__["timestamp"].to_numpy()) // rollup.seconds_per_hour
+		self.__df__["day_interval"] = (hours // 24).astype("int32")
+		self.__df__["hour_interval"] = (hours % 24).astype("int8")
 
 		self.set_group_by(["day_interval", "hour_interval"])
 
 	# --------------------------------------------------------------------------------------------------------------------
 
-	def get_interval_level_results(self, grouping_type: str, grouping_config: dict) -> pd.DataFrame:
-
-		result: pd.DataFrame = False
+	def get_rollup_level(self, grouping_type: str, grouping_config: dict) -> rollup.Segments | rollup.Partials:
+		"""Grouped data that the calcs of the grouping are computed from. In the "hierarchical" rollup mode, a grouping
+		with a "derived_from" config is built from the (cached) level of the finer grouping instead of the raw data"""
+		if grouping_type in self.__rollup_levels__ and self.__rollup_levels__[grouping_type][0] is grouping_config:
+			return self.__rollup_levels__[grouping_type][1]
+
+		derived_from = grouping_config.get("derived_from")
+
+		if rollup_mode == "hierarchical" and derived_from is not None:
+			child_type = derived_from["grouping_type"]
+			child = self.get_rollup_level(child_type, self.__grouping_config__[child_type])
+			# the keys of each child group - either a subset of its columns, or computed by the interval of the plan
+			keys = child.get_keys()[derived_from["group_by"]] if "group_by" in derived_from else \
+				grouping_config["definition"].derive_keys(child.get_keys())
+			level = child.rollup(keys=keys, median_mode=median_mode)
+		else:
+			# generate the column(s) that the data will be grouped by - with the interval of the plan, or by calling the
+			# configured function
+			with metrics.timer(f"definition.{grouping_type}", rows=len(self.__df__.index)):
+				definition = grouping_config["definition"]
+				if isinstance(definition, rollup_plan.Interval):
+					self.set_group_by(definition.add_keys(
+						self.__df__, timestamps=self.get_key_timestamps(self.__df__["timestamp"].to_numpy())))
+				else:
+					definition()
+			level = rollup.get_segments(df=self.__df__, group_by=self.get_group_by(), operation_field="value")
+
+		self.__rollup_levels__[grouping_type] = (grouping_config, level)
+		return level
+
+	def get_calcs(self, grouping_config: dict) -> dict[str, Callable]:
+		"""{column_name: kernel} for all the calcs of the grouping - compiled with the rollup plan"""
+		program = grouping_config.get("program")
+		if program is None:
+			program = {gc["column_name"]: self.__calcs_config__[gc["calc_type"]]["func"] for gc in grouping_config["calcs"]}
+
+		return {gc["column_name"]: metrics.timed(f"calc.{gc['calc_type']}", program[gc["column_name"]],
+		                                         rows=get_level_rows) for gc in grouping_config["calcs"]}
 
-		# call the configured function to generate the column(s) that the data will be grouped by
-		grouping_config["definition"]()
+	def get_interval_level_results(self, grouping_type: str, grouping_config: dict) -> pd.DataFrame:
 
-		for gc in grouping_config["calcs"]:
-			column_name = gc["column_name"]
-			calc_type = gc["calc_type"]
+		chunked_results = self.__chunked_results__.get(grouping_type, [])
+		if grouping_type in self.__open_results__:
+			chunked_results = chunked_results + [self.__open_results__[grouping_type]]
 
-			if result is False:
-				# call the registered function, and unpack the registered arguments
-				result = self.__calcs_config__[calc_type]["func"](*self.__calcs_config__[calc_type]["args"])
-				result = result.rename(columns={result.columns[0]: column_name})
-			else:
-				tmp = self.__calcs_config__[calc_type]["func"](*self.__calcs_config__[calc_type]["args"])
-				tmp = tmp.rename(columns={tmp.columns[0]: column_name})
-				result = result.join(tmp)
+		if len(chunked_results) > 0:
+			# chunked intake - the results were already computed, one block of days at a time
+			result = rollup.concat_results(chunked_results)
+		else:
+			# every calc of the grouping is computed from the same grouped data
+			result = rollup.get_results(level=self.get_rollup_level(grouping_type, grouping_config),
+			                            calcs=self.get_calcs(grouping_config))
 
-		result = result.reset_index()
 		result["stream_id"] = self.__stream_id__
 
 		# restructure the columns so that ID is the first column (just so that the data looks a bit better)
@@ -227,10 +524,12 @@ class DataStream():
 			stream_response["message"] = ["Empty file - Structure is correct but has no data"]
 			return pd.DataFrame(data=stream_response)
 
-		counts = self.__df__["value"].value_counts(dropna=False).reset_index()
-		count_of_zero = counts.loc[counts["index"] == 0, "value"].sum()
-		count_of_nan = counts.loc[np.isnan(counts["index"]) == True, "value"].sum()
-		count_of_one = counts.loc[counts["index"] == 1, "value"].sum()
+		# chunked intake - already counted chunk by chunk
+		counts = self.__value_counts__ if self.__value_counts__ is not None else \
+			classify_values(self.__df__["value"].to_numpy())
+		count_of_zero = counts["zero"]
+		count_of_nan = counts["nan"]
+		count_of_one = counts["one"]
 
 		stream_response["status"] = ["Processed"]
 		stream_response["% of 0 and NaN"] = [round(((count_of_nan + count_of_zero) / total_intervals), 4)]
@@ -246,15 +545,123 @@ class DataStream():
 		return pd.DataFrame(data=stream_response)
 
 
-def get_data_stream(stream_id: int, file_path: str, valid_column_names: List[str]) -> DataStream:
+def classify_values(values: np.ndarray, block_size: int = __classify_block_size__) -> dict:
+	"""Counts of the 0's, NaN's and 1's (and the total number) of the values, in a single scan - the values are processed
+	in cache-sized blocks, so each block is only loaded from memory once for all three comparisons. Works on a whole
+	stream or on a chunk of one (the counts of the chunks can be added up)"""
+	counts = {"zero": 0, "nan": 0, "one": 0, "total": len(values)}
+
+	with metrics.timer("classify", rows=len(values)):
+		for start in range(0, len(values), block_size):
+			block = values[start:start + block_size]
+			counts["zero"] += int(np.count_nonzero(block == 0))
+			counts["nan"] += int(np.count_nonzero(block != block))
+			counts["one"] += int(np.count_nonzero(block == 1))
+
+	return counts
+
+
+def get_level_rows(level: rollup.Segments | rollup.Partials) -> int:
+	"""Number of groups of a rollup level - the rows computed by a calc"""
+	return len(level.get_keys().index)
+
+
+def get_data_stream(stream_id: int, file_path: str | archive.ArchiveMember,
+                    valid_column_names: List[str], rebuild_cache: bool = False) -> DataStream:
 	ds = DataStream(stream_id, valid_column_names)
-	ds.read_csv_data(file=file_path)
+
+	with metrics.timer("intake") as timer:
+		read_data_stream(ds, file_path, rebuild_cache=rebuild_cache)
+		timer.set_rows(ds.get_total_intervals() or 0)
+
+	metrics.increment("streams_read")
+	if ds.get_file_intake_error() is not None:
+		metrics.increment("intake_errors")
 
 	return ds
 
 
+def read_data_stream(ds: DataStream, file_path: str | archive.ArchiveMember, rebuild_cache: bool = False) -> None:
+	"""Reads the file with the configured intake (or from the stream cache). Green Button files are always read whole
+	(the chunked and incremental intakes are for the CSV files), and so are the members of an archive - they are
+	already in memory, and have no path for the cache (the typed intake still applies to them).
+	rebuild_cache - the file is parsed (and its cache entry overwritten) even when it has a valid cache entry"""
+	if isinstance(file_path, archive.ArchiveMember):
+		if greenbutton.is_greenbutton_file(file_path.name):
+			ds.read_greenbutton_data(file=io.BytesIO(file_path.data))
+		elif intake_mode == "typed":
+			ds.read_csv_data_typed(file=io.BytesIO(file_path.data), downcast=downcast_intake)
+		else:
+			ds.read_csv_data(file=io.BytesIO(file_path.data))
+		return
+
+	is_greenbutton = greenbutton.is_greenbutton_file(file_path)
+
+	if config.incremental and not is_greenbutton:
+		incremental.read_csv_data_incremental(ds=ds, file=file_path, chunk_size=chunk_size,
+		                                      checkpoint_path=config.checkpoint_path)
+		return
+
+	if intake_mode == "chunked" and not is_greenbutton:
+		ds.read_csv_data_chunked(file=file_path, chunk_size=chunk_size)
+		return
+
+	# the entries are keyed by the intake that actually parses the file
+	intake = "greenbutton" if is_greenbutton else cache.get_intake_signature(intake_mode, downcast_intake)
+	if use_cache and not rebuild_cache:
+		df = cache.get_stream_cache().load(file_path, intake)
+		if df is not None:
+			ds.set_df(df)
+			return
+
+	if is_greenbutton:
+		ds.read_greenbutton_data(file=file_path)
+	elif intake_mode == "typed":
+		ds.read_csv_data_typed(file=file_path, downcast=downcast_intake)
+	else:
+		ds.read_csv_data(file=file_path)
+
+	# files that couldn't be parsed aren't cached
+	if use_cache and ds.get_file_intake_error() is None:
+		cache.get_stream_cache().store(file_path, ds.get_df(), intake)
+
+
 def get_stream_id(pattern: str, file: str) -> int:
-	return int(re.findall(pattern=pattern, string=file)[0])
+	"""Stream ID in the file name (a file of a sub-directory, e.g., "00/718.csv", has the ID of its name)"""
+	return int(re.findall(pattern=pattern, string=os.path.basename(file))[0])
+
+
+def process_data_stream(stream_id: int, file_path: str | archive.ArchiveMember,
+                        valid_column_names: List[str], rebuild_cache: bool = False) -> tuple[pd.DataFrame, dict]:
+	"""Runs all of the per-stream work for a single file. Only plain DataFrames/strings are returned (no DataStream
+	object with its callbacks) so that the results can be sent back from a worker process"""
+	logger.info(f"Start processing Stream(ID): {stream_id}")
+
+	ds = get_data_stream(stream_id=stream_id, file_path=file_path, valid_column_names=valid_column_names,
+	                     rebuild_cache=rebuild_cache)
+	return get_data_stream_results(ds)
+
+
+def get_data_stream_results(ds: DataStream) -> tuple[pd.DataFrame, dict]:
+	"""Stream-level and interval-level results of a DataStream that was already read"""
+	stream_id = ds.get_stream_id()
+
+	logger.info(f"Getting the stream-level data and classifications for Stream(ID): {stream_id}")
+	stream_level_res = ds.get_stream_level_results()
+	interval_level_res = dict()
+
+	if ds.is_valid_stream() is not True:
+		logger.info(f"Since stream is invalid - skipping the interval-level calculations, and going to the next file")
+		return stream_level_res, interval_level_res
+
+	logger.info(f"Getting the interval-level data/calculations for Stream(ID): {stream_id})")
+	for grouping_type, grouping_config in ds.get_grouping_config().items():
+		logger.info(f"Getting the data for the grouping type: {grouping_type}")
+		interval_level_res[grouping_type] = {"df": ds.get_interval_level_results(grouping_type, grouping_config),
+		                                     "output_path": ds.get_output_path(grouping_type)}
+
+	logger.info(f"Finished processing Stream(ID): {stream_id}")
+	return stream_level_res, interval_level_res
 
 
 def calculate_interval_level_data(ds: DataStream, grouping_configs: dict, interval_df: dict) -> None:
@@ -267,9 +674,10 @@ def calculate_interval_level_data(ds: DataStream, grouping_configs: dict, interv
 			interval_df[grouping_type] = {"df": pd.DataFrame(), "output_path": ds.get_output_path(grouping_type)}
 
 		interval_level_res = ds.get_interval_level_results(grouping_type, grouping_config)
-		interval_df[grouping_type]["df"] = interval_df[grouping_type]["df"].append(interval_level_res, ignore_index=True)
+		interval_df[grouping_type]["df"] = pd.concat([interval_df[grouping_type]["df"], interval_level_res],
+		                                             ignore_index=True)
 
 
 # TODO remove redundant function - call get_stream_level_results directly from ds, and pass stream_df to it
 def calculate_stream_level_data(ds: DataStream, stream_df: pd.DataFrame) -> pd.DataFrame:
-	return stream_df.append(ds.get_stream_level_results(), ignore_index=True)
+	return pd.concat([stream_df, ds.get_stream_level_results()], ignore_index=True)
@@ -0,0 +1,76 @@
+import pandas as pd
+from typing import List
+
+# buffered stream-level frames are merged into a block every this many streams - a 1-row DataFrame per stream takes a
+# lot more memory than the row itself
+__compact_size__ = 1024
+
+
+class ResultCollector():
+	""" Buffers the per-stream results, and concatenates them once - when the summary DataFrames are requested.
+	DataFrame.append copies the whole accumulated frame on every call (O(streams^2) in total), whereas the collector only
+	keeps a reference to each frame (O(streams) in total) """
+
+	# stream-level results - the merged blocks of __compact_size__ streams, the frames of the streams since the last
+	# block (one per stream), and the number of streams
+	__stream_blocks__: List[pd.DataFrame]
+	__stream_frames__: List[pd.DataFrame]
+	__n_streams__: int
+
+	# interval-level results - {grouping_type: {"frames": [pd.DataFrame, ...], "output_path": str}}
+	__interval_frames__: dict
+
+	def __init__(self):
+		self.__stream_blocks__ = []
+		self.__stream_frames__ = []
+		self.__n_streams__ = 0
+		self.__interval_frames__ = dict()
+
+	def __len__(self) -> int:
+		return self.__n_streams__
+
+	def add_stream_level_results(self, stream_level_res: pd.DataFrame) -> None:
+		self.__stream_frames__.append(stream_level_res)
+		self.__n_streams__ += 1
+
+		# only the frames since the last block are merged - the blocks are concatenated once, in get_stream_df
+		if len(self.__stream_frames__) >= __compact_size__:
+			self.__stream_blocks__.append(concat_frames(self.__stream_frames__))
+			self.__stream_frames__ = []
+
+	def add_interval_level_results(self, interval_level_res: dict) -> None:
+		"""interval_level_res is keyed by the grouping type - {grouping_type: {"df": pd.DataFrame, "output_path": str}}"""
+		for grouping_type, res in interval_level_res.items():
+			if grouping_type not in self.__interval_frames__:
+				"""each grouping_type will have its own index, and will have its own output_path; define it only when it
+				isn't present"""
+				self.__interval_frames__[grouping_type] = {"frames": [], "output_path": res["output_path"]}
+
+			self.__interval_frames__[grouping_type]["frames"].append(res["df"])
+
+	def get_stream_df(self) -> pd.DataFrame:
+		self.__stream_blocks__ = [concat_frames(self.__stream_blocks__ + self.__stream_frames__)]
+		self.__stream_frames__ = []
+		return self.__stream_blocks__[0]
+
+	def get_interval_df(self) -> dict:
+		"""Returns the interval-level results in the same structure as calculate_interval_level_data -
+		{grouping_type: {"df": pd.DataFrame, "output_path": str}}"""
+		interval_df = dict()
+
+		for grouping_type, res in self.__interval_frames__.items():
+			res["frames"] = [concat_frames(res["frames"])]
+			interval_df[grouping_type] = {"df": res["frames"][0], "output_path": res["output_path"]}
+
+		return interval_df
+
+
+def concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+	"""Single concatenation of all the buffered frames (an empty DataFrame when nothing has been collected)"""
+	if len(frames) == 0:
+		return pd.DataFrame()
+
+	if len(frames) == 1:
+		return frames[0]
+
+	return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,241 @@
+# Approximate nearest-neighbour index of the streams - "which streams are most similar to stream X" without comparing
+# X with every other stream. Each stream is summarized by a signature (its normalized 24-hour load shape), and the
+# signatures are hashed with random projections (sign of the dot product with random hyperplanes) into several hash
+# tables. Similar load shapes tend to land in the same buckets, so a query only re-ranks the streams of its buckets
+
+import os
+import numpy as np
+import pandas as pd
+from config import logger
+
+# number of values of a signature - one per hour of the day
+__signature_length__ = 24
+
+# up to this many streams, a query simply compares all of them (cheaper than the bucket lookups, and exact)
+__exact_search_size__ = 1024
+
+
+class SimilarityIndex():
+	""" Random-projection (SimHash) index of stream signatures. The signatures are unit vectors, so the dot product of
+	two signatures is the (Pearson) correlation of the load shapes. Streams are added/replaced one at a time, and the
+	index can be saved to (and loaded from) a single .npz file """
+
+	# n_tables hash tables of n_bits hyperplanes each - more tables -> better recall, more bits -> smaller buckets
+	__n_tables__: int
+	__n_bits__: int
+	__seed__: int
+	__planes__: np.ndarray
+
+	# stream ID and signature of each row - the arrays grow by doubling, only the first __size__ rows are used
+	__stream_ids__: np.ndarray
+	__signatures__: np.ndarray
+	__size__: int
+	__rows__: dict
+
+	# hash key of each row in each table, and the rows of each bucket - [{key: [row, ...]}, ...]
+	__keys__: np.ndarray
+	__buckets__: list
+	# rows of the queried buckets as arrays - [{key: np.ndarray}, ...]; an entry is dropped when its bucket changes
+	__bucket_arrays__: list
+
+	def __init__(self, n_tables: int = 8, n_bits: int = 12, seed: int = 0,
+	             signature_length: int = __signature_length__):
+		if not 0 < n_bits <= 62:
+			raise ValueError(f"Invalid number of bits per hash table : {n_bits}")
+
+		self.__n_tables__ = n_tables
+		self.__n_bits__ = n_bits
+		self.__seed__ = seed
+		self.__planes__ = np.random.default_rng(seed).normal(size=(n_tables, n_bits, signature_length))
+
+		self.__stream_ids__ = np.zeros(0, dtype="int64")
+		self.__signatures__ = np.zeros((0, signature_length))
+		self.__size__ = 0
+		self.__rows__ = dict()
+		self.__keys__ = np.zeros((0, n_tables), dtype="int64")
+		self.__buckets__ = [dict() for _ in range(n_tables)]
+		self.__bucket_arrays__ = [dict() for _ in range(n_tables)]
+
+	# Get funcs
+	# ------------------------------------------------------------------------------------------------------------------
+	def get_stream_ids(self) -> np.ndarray:
+		return self.__stream_ids__[:self.__size__]
+
+	def get_signatures(self) -> np.ndarray:
+		return self.__signatures__[:self.__size__]
+
+	def get_signature(self, stream_id: int) -> np.ndarray:
+		return self.__signatures__[self.__rows__[stream_id]]
+
+	def __len__(self) -> int:
+		return self.__size__
+
+	def __contains__(self, stream_id: int) -> bool:
+		return stream_id in self.__rows__
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def get_keys(self, signatures: np.ndarray) -> np.ndarray:
+		"""Hash key of each signature in each table - (n_signatures, n_tables)"""
+		bits = np.einsum("tbd,nd->ntb", self.__planes__, signatures) > 0
+		return bits.astype("int64") @ (1 << np.arange(self.__n_bits__, dtype="int64"))
+
+	def add(self, stream_id: int, signature: np.ndarray) -> None:
+		"""Adds the stream to the index - or replaces its signature, if it's already in it"""
+		self.add_many(np.asarray([stream_id]), signature[None, :])
+
+	def add_many(self, stream_ids: np.ndarray, signatures: np.ndarray) -> None:
+		# the hash keys of all the signatures are computed at once
+		all_keys = self.get_keys(signatures)
+
+		for stream_id, signature, keys in zip(stream_ids.tolist(), signatures, all_keys):
+			if stream_id in self.__rows__:
+				row = self.__rows__[stream_id]
+				for table, key in enumerate(self.__keys__[row].tolist()):
+					self.__buckets__[table][key].remove(row)
+					self.__bucket_arrays__[table].pop(key, None)
+			else:
+				row = self.__size__
+				if row == len(self.__stream_ids__):
+					self.grow(max(2 * row, 16))
+
+				self.__rows__[stream_id] = row
+				self.__stream_ids__[row] = stream_id
+				self.__size__ += 1
+
+			self.__signatures__[row] = signature
+			self.__keys__[row] = keys
+			for table, key in enumerate(keys.tolist()):
+				self.__buckets__[table].setdefault(key, []).append(row)
+				self.__bucket_arrays__[table].pop(key, None)
+
+	def add_data_stream(self, ds, grouping_type: str = "hour_interval", value_column: str = "hour_mean") -> bool:
+		"""Adds a processed DataStream, based on its hourly results; returns False for an invalid stream"""
+		if ds.is_valid_stream() is not True or grouping_type not in ds.get_grouping_config():
+			return False
+
+		df = ds.get_interval_level_results(grouping_type, ds.get_grouping_config()[grouping_type])
+		_, signatures = get_load_shapes(df, value_column=value_column)
+		self.add(ds.get_stream_id(), signatures[0])
+		return True
+
+	def add_interval_results(self, interval_df: pd.DataFrame, value_column: str = "hour_mean") -> int:
+		"""Adds every stream of the (hourly) interval-level results; returns the number of streams added"""
+		stream_ids, signatures = get_load_shapes(interval_df, value_column=value_column)
+		self.add_many(stream_ids, signatures)
+		return len(stream_ids)
+
+	def grow(self, capacity: int) -> None:
+		stream_ids = np.zeros(capacity, dtype="int64")
+		signatures = np.zeros((capacity, self.__signatures__.shape[1]))
+		keys = np.zeros((capacity, self.__n_tables__), dtype="int64")
+
+		stream_ids[:self.__size__] = self.get_stream_ids()
+		signatures[:self.__size__] = self.get_signatures()
+		keys[:self.__size__] = self.__keys__[:self.__size__]
+
+		self.__stream_ids__, self.__signatures__, self.__keys__ = stream_ids, signatures, keys
+
+	def get_candidates(self, signature: np.ndarray, n_probes: int = 1) -> np.ndarray:
+		"""Rows that share a bucket with the signature in any of the tables. With n_probes > 1, the buckets one bit away
+		(the bits whose hyperplanes are closest to the signature) are also searched"""
+		projections = np.einsum("tbd,d->tb", self.__planes__, signature)
+		keys = (projections > 0).astype("int64") @ (1 << np.arange(self.__n_bits__, dtype="int64"))
+		closest_bits = np.argsort(np.abs(projections), axis=1)[:, :n_probes - 1] if n_probes > 1 else \
+			np.zeros((self.__n_tables__, 0), dtype="int64")
+
+		candidates = [np.zeros(0, dtype="int64")]
+		for table, (key, bits) in enumerate(zip(keys.tolist(), closest_bits.tolist())):
+			for probe in [key] + [key ^ (1 << bit) for bit in bits]:
+				candidates.append(self.get_bucket(table, probe))
+
+		return np.unique(np.concatenate(candidates))
+
+	def get_bucket(self, table: int, key: int) -> np.ndarray:
+		"""Rows of a bucket as an array - kept until the bucket changes"""
+		bucket = self.__bucket_arrays__[table].get(key)
+		if bucket is None:
+			bucket = np.asarray(self.__buckets__[table].get(key, ()), dtype="int64")
+			self.__bucket_arrays__[table][key] = bucket
+		return bucket
+
+	def query(self, signature: np.ndarray, k: int = 10, n_probes: int = 1,
+	          exclude: int | None = None) -> pd.DataFrame:
+		"""The (approximately) k most similar streams to the signature - the candidates of its buckets are re-ranked by
+		their exact correlation (small indexes are searched exhaustively)"""
+		rows = self.get_candidates(signature, n_probes=n_probes) if self.__size__ > __exact_search_size__ else \
+			np.arange(self.__size__)
+		if exclude is not None and exclude in self.__rows__:
+			rows = rows[rows != self.__rows__[exclude]]
+
+		scores = self.__signatures__[rows] @ signature
+		if k < len(rows):
+			# only the best k candidates are sorted
+			best = np.argpartition(-scores, k - 1)[:k]
+			rows, scores = rows[best], scores[best]
+		order = np.argsort(-scores, kind="stable")
+
+		return pd.DataFrame({"stream_id": self.__stream_ids__[rows[order]], "correlation": scores[order]})
+
+	def query_stream(self, stream_id: int, k: int = 10, n_probes: int = 1) -> pd.DataFrame:
+		"""The (approximately) k most similar streams to a stream of the index"""
+		return self.query(self.get_signature(stream_id), k=k, n_probes=n_probes, exclude=stream_id)
+
+	def save(self, path: str) -> None:
+		"""Writes the index to a single .npz file (replaced atomically); the buckets are rebuilt on load"""
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+		tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+
+		try:
+			np.savez(tmp_path, stream_ids=self.get_stream_ids(), signatures=self.get_signatures(),
+			         settings=np.asarray([self.__n_tables__, self.__n_bits__, self.__seed__]))
+			os.replace(tmp_path, path)
+		except OSError as err:
+			logger.warning(f"Failed to save the similarity index to '{path}' : {repr(err)}")
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+
+def load_index(path: str) -> SimilarityIndex:
+	with np.load(path, allow_pickle=False) as npz:
+		n_tables, n_bits, seed = (int(v) for v in npz["settings"])
+		stream_ids, signatures = npz["stream_ids"], npz["signatures"]
+
+	index = SimilarityIndex(n_tables=n_tables, n_bits=n_bits, seed=seed, signature_length=signatures.shape[1])
+	index.grow(len(stream_ids))
+	index.add_many(stream_ids, signatures)
+
+	return index
+
+
+def get_index(path: str, n_tables: int = 8, n_bits: int = 12, seed: int = 0) -> SimilarityIndex:
+	"""The index saved at the path - or a new (empty) one, if there isn't a valid index file"""
+	try:
+		return load_index(path)
+	except (OSError, ValueError, KeyError) as err:
+		logger.debug(f"No valid similarity index at '{path}' : {repr(err)}")
+		return SimilarityIndex(n_tables=n_tables, n_bits=n_bits, seed=seed)
+
+
+def get_load_shapes(interval_df: pd.DataFrame, value_column: str = "hour_mean") -> tuple[np.ndarray, np.ndarray]:
+	"""Signature of each stream of the hourly results - the mean value of each hour of the day, z-normalized and scaled
+	to a unit vector (hours without any values are 0, a flat load shape is all 0's)"""
+	stream_codes, stream_ids = pd.factorize(interval_df["stream_id"], sort=True)
+	hours = interval_df["hour_interval"].to_numpy().astype("int64")
+	values = interval_df[value_column].to_numpy(dtype="float64")
+
+	has_value = ~np.isnan(values)
+	slots = stream_codes[has_value] * __signature_length__ + hours[has_value]
+	n_slots = len(stream_ids) * __signature_length__
+	sums = np.bincount(slots, weights=values[has_value], minlength=n_slots)
+	counts = np.bincount(slots, minlength=n_slots)
+
+	with np.errstate(invalid="ignore", divide="ignore"):
+		shapes = (sums / counts).reshape(len(stream_ids), __signature_length__)
+		has_hour = ~np.isnan(shapes)
+		shapes = np.where(has_hour, shapes - np.nansum(shapes, axis=1, keepdims=True) / has_hour.sum(axis=1,
+		                                                                                             keepdims=True), 0)
+		norms = np.linalg.norm(shapes, axis=1, keepdims=True)
+		signatures = np.where(norms > 0, shapes / norms, 0)
+
+	return np.asarray(stream_ids), signatures
@@ -0,0 +1,137 @@
+# Archive source - the input files are read straight out of a .tar.gz/.tgz/.tar or .zip archive (e.g., all-data.tar.gz),
+# without extracting it to disk: the members are decompressed on their own thread (zlib releases the GIL, so it overlaps
+# with the parsing of the previous members), and handed over in memory through a bounded queue
+
+import os
+import time
+import queue
+import tarfile
+import zipfile
+import posixpath
+import threading
+from typing import NamedTuple
+from collections.abc import Iterator
+from config import logger
+from modules import metrics
+from modules.csv import get_pattern
+
+__archive_extensions__ = (".tar.gz", ".tgz", ".tar", ".zip")
+
+# seconds between the checks of the stop flag, while the decompression thread is waiting on the queue
+__poll_interval__ = 0.1
+
+
+class ArchiveMember(NamedTuple):
+	""" File read out of an archive - its name in the archive (e.g., "all-data.tar/csv/718.csv") and its contents """
+	name: str
+	data: bytes
+
+
+def is_archive(path: str) -> bool:
+	return path.lower().endswith(__archive_extensions__)
+
+
+def open_archive(path: str) -> tarfile.TarFile | zipfile.ZipFile:
+	"""A tar archive is opened as a stream (its members are read in order, and only once - a .tar.gz can't be seeked
+	without decompressing it again)"""
+	if not os.path.isfile(path):
+		logger.critical(f"Invalid Archive Path : '{path}'")
+		raise FileNotFoundError(f"Invalid Archive Path : '{path}'")
+
+	try:
+		if path.lower().endswith(".zip"):
+			return zipfile.ZipFile(path)
+		return tarfile.open(path, mode="r|*")
+	except (tarfile.TarError, zipfile.BadZipFile) as err:
+		raise ValueError(f"Invalid archive '{path}' : {repr(err)}")
+
+
+def iter_archive_tasks(path: str, pattern: str, stream_id_pattern: str,
+                       queue_size: int = 4) -> Iterator[tuple[int, ArchiveMember]]:
+	"""(stream ID, member) of the archive members whose file name matches the pattern - in the order of the archive. At
+	most queue_size members are decompressed ahead of the consumer. The archive is opened (and checked) right away; an
+	archive that fails to decompress later on (e.g., a truncated .tar.gz) raises ValueError while it's iterated"""
+	if queue_size < 1:
+		raise ValueError(f"Invalid archive queue size : {queue_size}")
+	return read_members(open_archive(path), path, pattern, stream_id_pattern, queue_size)
+
+
+def read_members(archive: tarfile.TarFile | zipfile.ZipFile, path: str, pattern: str, stream_id_pattern: str,
+                 queue_size: int) -> Iterator[tuple[int, ArchiveMember]]:
+	members = queue.Queue(maxsize=queue_size)
+	stop = threading.Event()
+	# time spent decompressing (not waiting on the consumer), and number of members read
+	stats = {"seconds": 0.0, "members": 0}
+
+	def put(item) -> bool:
+		while not stop.is_set():
+			try:
+				members.put(item, timeout=__poll_interval__)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def decompress() -> None:
+		try:
+			for name, data in iter_matching_members(archive, pattern, stats):
+				if not put((name, data)):
+					return
+			put(None)
+		except Exception as err:
+			logger.error(f"Failed to read the archive '{path}' : {repr(err)}")
+			put(err)
+		finally:
+			archive.close()
+
+	thread = threading.Thread(target=decompress, name="archive-decompress", daemon=True)
+	thread.start()
+
+	stream_id_regex = get_pattern(stream_id_pattern)
+	try:
+		while True:
+			item = members.get()
+			if item is None:
+				break
+			if isinstance(item, Exception):
+				# zlib.error, EOFError, tarfile.ReadError, ... - the same error as an archive that can't be opened
+				raise ValueError(f"Invalid archive '{path}' : {repr(item)}") from item
+
+			name, data = item
+			stream_id = stream_id_regex.match(posixpath.basename(name))
+			if stream_id is None:
+				logger.warning(f"No stream ID in the archive member name '{name}' - skipped")
+				continue
+			yield int(stream_id.group(1)), ArchiveMember(name=name, data=data)
+	finally:
+		# the consumer stopped early (or failed) - the thread is let go, without reading the rest of the archive
+		stop.set()
+		thread.join()
+
+	metrics.get_metrics().add("read_archive", stats["seconds"], rows=stats["members"])
+	metrics.increment("files_listed", stats["members"])
+	logger.info(f"{stats['members']} file(s) read with the pattern '{pattern}' from the archive {path}")
+
+
+def iter_matching_members(archive: tarfile.TarFile | zipfile.ZipFile, pattern: str,
+                          stats: dict) -> Iterator[tuple[str, bytes]]:
+	"""(name, contents) of the members whose file name (without the directories) matches the pattern"""
+	regex = get_pattern(pattern)
+	start = time.perf_counter()
+
+	if isinstance(archive, zipfile.ZipFile):
+		members = ((info.filename, info) for info in archive.infolist() if not info.is_dir())
+		read = archive.read
+	else:
+		members = ((info.name, info) for info in archive if info.isfile())
+		read = lambda info: archive.extractfile(info).read()
+
+	for name, info in members:
+		if regex.match(posixpath.basename(name)) is None:
+			continue
+
+		data = read(info)
+		stats["seconds"] += time.perf_counter() - start
+		stats["members"] += 1
+		yield name, data
+		start = time.perf_counter()
@@ -0,0 +1,440 @@
+# Sharded batch mode - a producer splits the list of files into shards, and puts them on a durable work queue (SQLite).
+# Worker processes (on this machine, or on others that share the directory) claim the shards one at a time, and write
+# the mergeable partial results of each one: the stream-level rows (counters), the interval-level rollups of its streams,
+# the ranking candidates and the metrics. Once every shard is done, the reducer combines the partials into the outputs
+# and marks the batch as complete. A shard whose worker stops renewing its lease (e.g., the worker crashed) is claimed
+# again by another worker
+# usage (from the project directory): python -m modules.batch run [--workers N]    (all of the steps below)
+#                                     python -m modules.batch produce              (prints the batch ID)
+#                                     python -m modules.batch work BATCH_ID
+#                                     python -m modules.batch reduce BATCH_ID
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import sqlite3
+import argparse
+import datetime
+import multiprocessing
+import numpy as np
+import pandas as pd
+import config
+from config import logger
+from modules import csv, metrics, ranking, sinks, writers
+from modules.DataStream import get_stream_id, process_data_stream
+from modules.ResultCollector import ResultCollector
+
+# seconds between two polls of the queue - by the workers waiting for the shards claimed by others, and by the runner
+__poll_seconds__ = 1.0
+
+
+class WorkQueue():
+	""" Durable queue of the shards of each batch, in a SQLite database. A shard is "pending", "claimed" (by a worker,
+	with a lease that the worker renews after each file), "done" (with the path of its partial results) or "failed"
+	(after max_attempts claims). Claims are made in an immediate transaction, so a shard is never handed to two workers
+	at once - unless its lease expired """
+	__path__: str
+	__lease_seconds__: float
+	__max_attempts__: int
+	__connection__: sqlite3.Connection | None
+
+	def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3):
+		self.__path__ = path
+		self.__lease_seconds__ = lease_seconds
+		self.__max_attempts__ = max_attempts
+		self.__connection__ = None
+
+	# Get funcs
+	# ------------------------------------------------------------------------------------------------------------------
+	def get_path(self) -> str:
+		return self.__path__
+
+	def get_connection(self) -> sqlite3.Connection:
+		if self.__connection__ is None:
+			os.makedirs(os.path.dirname(self.__path__) or ".", exist_ok=True)
+			self.__connection__ = sinks.connect(self.__path__)
+			with self.__connection__:
+				self.__connection__.execute("CREATE TABLE IF NOT EXISTS batches (batch_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+				                            "path TEXT, created_at TEXT, finished_at TEXT, status TEXT)")
+				self.__connection__.execute("CREATE TABLE IF NOT EXISTS shards (batch_id INTEGER, shard_id INTEGER, "
+				                            "files TEXT, status TEXT, worker_id TEXT, heartbeat REAL, attempts INTEGER, "
+				                            "partial_path TEXT, error TEXT, PRIMARY KEY (batch_id, shard_id))")
+		return self.__connection__
+
+	def get_batch(self, batch_id: int) -> dict:
+		row = self.get_connection().execute("SELECT batch_id, path, created_at, finished_at, status FROM batches "
+		                                    "WHERE batch_id = ?", (batch_id,)).fetchone()
+		if row is None:
+			raise ValueError(f"Invalid batch ID : {batch_id}")
+		return dict(zip(["batch_id", "path", "created_at", "finished_at", "status"], row))
+
+	def get_shards(self, batch_id: int) -> list[dict]:
+		columns = ["batch_id", "shard_id", "files", "status", "worker_id", "heartbeat", "attempts", "partial_path", "error"]
+		rows = self.get_connection().execute(f"SELECT {', '.join(columns)} FROM shards WHERE batch_id = ? "
+		                                     f"ORDER BY shard_id", (batch_id,)).fetchall()
+		shards = [dict(zip(columns, row)) for row in rows]
+		for shard in shards:
+			shard["files"] = json.loads(shard["files"])
+		return shards
+
+	def get_progress(self, batch_id: int) -> dict:
+		"""Number of shards in each status - {"pending": int, "claimed": int, "done": int, "failed": int}"""
+		progress = {"pending": 0, "claimed": 0, "done": 0, "failed": 0}
+		for status, count in self.get_connection().execute("SELECT status, COUNT(*) FROM shards WHERE batch_id = ? "
+		                                                   "GROUP BY status", (batch_id,)):
+			progress[status] = count
+		return progress
+
+	def is_finished(self, batch_id: int) -> bool:
+		"""True once every shard is done (or failed)"""
+		progress = self.get_progress(batch_id)
+		return progress["pending"] == 0 and progress["claimed"] == 0
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def create_batch(self, path: str, file_list: list[str], shard_size: int) -> int:
+		"""Producer - a new batch, with the files split into shards of shard_size files (in the order of file_list)"""
+		if shard_size < 1:
+			raise ValueError(f"Invalid shard size : {shard_size}")
+
+		with self.get_connection() as connection:
+			cursor = connection.execute("INSERT INTO batches (path, created_at, status) VALUES (?, ?, 'running')",
+			                            (path, datetime.datetime.now().isoformat(timespec="seconds")))
+			batch_id = cursor.lastrowid
+			connection.executemany("INSERT INTO shards (batch_id, shard_id, files, status, attempts) "
+			                       "VALUES (?, ?, ?, 'pending', 0)",
+			                       [(batch_id, shard_id, json.dumps(file_list[start:start + shard_size]))
+			                        for shard_id, start in enumerate(range(0, len(file_list), shard_size))])
+		return batch_id
+
+	def claim(self, batch_id: int, worker_id: str) -> dict | None:
+		"""Claims the next pending shard of the batch (or a claimed one whose lease expired) - None if there isn't one"""
+		connection = self.get_connection()
+		now = time.time()
+		query = "SELECT shard_id, files, attempts FROM shards WHERE batch_id = ? AND (status = 'pending' OR " \
+		        "(status = 'claimed' AND heartbeat < ?)) ORDER BY shard_id LIMIT 1"
+
+		connection.execute("BEGIN IMMEDIATE")
+		try:
+			row = connection.execute(query, (batch_id, now - self.__lease_seconds__)).fetchone()
+			while row is not None and row[2] >= self.__max_attempts__:
+				# the lease of its last attempt expired - the shard isn't retried any more
+				connection.execute("UPDATE shards SET status = 'failed', error = ? WHERE batch_id = ? AND shard_id = ?",
+				                   (f"Lease expired after {row[2]} attempt(s)", batch_id, row[0]))
+				row = connection.execute(query, (batch_id, now - self.__lease_seconds__)).fetchone()
+
+			if row is not None:
+				connection.execute("UPDATE shards SET status = 'claimed', worker_id = ?, heartbeat = ?, attempts = ? "
+				                   "WHERE batch_id = ? AND shard_id = ?", (worker_id, now, row[2] + 1, batch_id, row[0]))
+			connection.commit()
+		except sqlite3.Error:
+			connection.rollback()
+			raise
+
+		if row is None:
+			return None
+		return {"batch_id": batch_id, "shard_id": row[0], "files": json.loads(row[1]), "worker_id": worker_id,
+		        "attempts": row[2] + 1}
+
+	def update_claimed(self, shard: dict, query: str, params: tuple) -> bool:
+		"""Runs the update on the shard if the worker still holds its claim - False if it was claimed by another one"""
+		with self.get_connection() as connection:
+			cursor = connection.execute(f"UPDATE shards SET {query} WHERE batch_id = ? AND shard_id = ? AND "
+			                            f"status = 'claimed' AND worker_id = ?",
+			                            params + (shard["batch_id"], shard["shard_id"], shard["worker_id"]))
+		return cursor.rowcount == 1
+
+	def renew(self, shard: dict) -> bool:
+		"""Renews the lease of the shard"""
+		return self.update_claimed(shard, "heartbeat = ?", (time.time(),))
+
+	def complete(self, shard: dict, partial_path: str) -> bool:
+		return self.update_claimed(shard, "status = 'done', partial_path = ?, error = NULL", (partial_path,))
+
+	def fail(self, shard: dict, error: str) -> bool:
+		"""Puts the shard back on the queue - or marks it as failed after max_attempts claims"""
+		status = "failed" if shard["attempts"] >= self.__max_attempts__ else "pending"
+		return self.update_claimed(shard, "status = ?, error = ?", (status, error))
+
+	def release(self, batch_id: int, worker_id: str) -> int:
+		"""Puts the shards claimed by a worker (that is known to have stopped) back on the queue, without waiting for
+		their leases to expire; returns the number of shards"""
+		with self.get_connection() as connection:
+			connection.execute("UPDATE shards SET status = 'failed', error = 'Worker stopped' WHERE batch_id = ? AND "
+			                   "worker_id = ? AND status = 'claimed' AND attempts >= ?",
+			                   (batch_id, worker_id, self.__max_attempts__))
+			cursor = connection.execute("UPDATE shards SET status = 'pending', error = 'Worker stopped' WHERE "
+			                            "batch_id = ? AND worker_id = ? AND status = 'claimed'", (batch_id, worker_id))
+		return cursor.rowcount
+
+	def set_batch_status(self, batch_id: int, status: str) -> None:
+		with self.get_connection() as connection:
+			connection.execute("UPDATE batches SET finished_at = ?, status = ? WHERE batch_id = ?",
+			                   (datetime.datetime.now().isoformat(timespec="seconds"), status, batch_id))
+
+	def close(self) -> None:
+		if self.__connection__ is not None:
+			self.__connection__.close()
+			self.__connection__ = None
+
+
+def get_queue() -> WorkQueue:
+	return WorkQueue(path=config.batch_queue_path, lease_seconds=config.batch_lease_seconds,
+	                 max_attempts=config.batch_max_attempts)
+
+
+def get_worker_id() -> str:
+	return f"{socket.gethostname()}-{os.getpid()}"
+
+
+# Partial results
+# ######################################################################################################################
+def write_partial(directory: str, stream_df: pd.DataFrame, interval_df: dict, ranking_state: list,
+                  metrics_state: dict) -> None:
+	"""Partial results of a shard - stream_level.csv, one .npz per grouping type (one array per column, so that the
+	dtypes of the interval keys are kept), and meta.json (written last - a partial without it is never read)"""
+	os.makedirs(directory, exist_ok=True)
+	stream_df.to_csv(f"{directory}stream_level.csv", index=False)
+
+	for grouping_type, res in interval_df.items():
+		np.savez(f"{directory}{grouping_type}.npz", **{str(i): res["df"][column].to_numpy()
+		                                               for i, column in enumerate(res["df"].columns)})
+
+	meta = {"columns": {grouping_type: res["df"].columns.tolist() for grouping_type, res in interval_df.items()},
+	        "output_paths": {grouping_type: res["output_path"] for grouping_type, res in interval_df.items()},
+	        "ranking": ranking_state,
+	        "metrics": metrics_state}
+	with open(f"{directory}meta.json", "w") as f:
+		json.dump(meta, f)
+
+
+def read_partial(directory: str) -> dict:
+	"""{"stream_df": pd.DataFrame, "interval_level_res": {grouping_type: {"df", "output_path"}}, "ranking", "metrics"}"""
+	with open(f"{directory}meta.json", "r") as f:
+		meta = json.load(f)
+
+	interval_level_res = dict()
+	for grouping_type, columns in meta["columns"].items():
+		with np.load(f"{directory}{grouping_type}.npz", allow_pickle=False) as npz:
+			interval_level_res[grouping_type] = {"df": pd.DataFrame({column: npz[str(i)] for i, column in enumerate(columns)}),
+			                                     "output_path": meta["output_paths"][grouping_type]}
+
+	return {"stream_df": pd.read_csv(f"{directory}stream_level.csv"),
+	        "interval_level_res": interval_level_res,
+	        "ranking": meta["ranking"],
+	        "metrics": meta["metrics"]}
+
+
+def get_partial_dir(partials_path: str, shard: dict) -> str:
+	"""Directory of the partial results of a claim of the shard - each claim has its own, so that a worker whose lease
+	expired doesn't overwrite the partial of the worker that took the shard over"""
+	return f"{partials_path}{shard['batch_id']}/shard_{shard['shard_id']:06d}.{shard['worker_id']}.{shard['attempts']}/"
+
+
+# Worker
+# ######################################################################################################################
+def process_shard(queue: WorkQueue, path: str, shard: dict, partials_path: str) -> str | None:
+	"""Processes the files of the shard, and writes its partial results; returns the directory of the partial - None
+	if the lease of the shard was lost (it was claimed by another worker)"""
+	registry = metrics.get_metrics()
+	registry.reset()
+
+	collector = ResultCollector()
+	stream_ranking = ranking.StreamRanking(n=config.rank_top_n)
+
+	stream_id_pattern = csv.get_input_source(config.input_format)[2]
+	for file in shard["files"]:
+		stream_id = get_stream_id(pattern=stream_id_pattern, file=file)
+		res, report = metrics.run_stream(process_data_stream, stream_id, f"{path}{file}", config.valid_column_names)
+		metrics.add_stream_report(report)
+
+		stream_level_res, interval_level_res = res
+		collector.add_stream_level_results(stream_level_res)
+		collector.add_interval_level_results(interval_level_res)
+		stream_ranking.add_stream_level_results(stream_level_res)
+
+		if not queue.renew(shard):
+			logger.warning(f"Lost the lease of shard {shard['shard_id']} of batch {shard['batch_id']}")
+			return None
+
+	directory = get_partial_dir(partials_path, shard)
+	write_partial(directory, stream_df=collector.get_stream_df(), interval_df=collector.get_interval_df(),
+	              ranking_state=stream_ranking.get_state(), metrics_state=registry.get_state())
+	return directory
+
+
+def run_worker(queue: WorkQueue, batch_id: int, worker_id: str | None = None, partials_path: str | None = None,
+               wait: bool = True) -> int:
+	"""Claims and processes the shards of the batch until there are none left; returns the number of shards done.
+	With wait, the worker keeps polling while other workers hold claims (their leases may expire)"""
+	worker_id = get_worker_id() if worker_id is None else worker_id
+	partials_path = config.batch_partials_path if partials_path is None else partials_path
+	path = queue.get_batch(batch_id)["path"]
+
+	n_shards = 0
+	while True:
+		shard = queue.claim(batch_id, worker_id)
+		if shard is None:
+			if not wait or queue.is_finished(batch_id):
+				return n_shards
+			time.sleep(__poll_seconds__)
+			continue
+
+		logger.info(f"Worker {worker_id} claimed shard {shard['shard_id']} of batch {batch_id} "
+		            f"({len(shard['files'])} files, attempt {shard['attempts']})")
+		try:
+			directory = process_shard(queue, path, shard, partials_path)
+		except (OSError, ValueError, sqlite3.Error) as err:
+			logger.error(f"Shard {shard['shard_id']} of batch {batch_id} failed : {repr(err)}")
+			queue.fail(shard, repr(err))
+			continue
+
+		if directory is not None and queue.complete(shard, directory):
+			n_shards += 1
+		elif directory is not None:
+			# the shard was taken over by another worker in the meantime - its partial is the one that's kept
+			shutil.rmtree(directory, ignore_errors=True)
+
+
+def work(queue_path: str, batch_id: int, worker_id: str, lease_seconds: float, max_attempts: int) -> None:
+	"""Entry point of a worker process"""
+	queue = WorkQueue(path=queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+	try:
+		run_worker(queue, batch_id, worker_id=worker_id)
+	finally:
+		queue.close()
+
+
+# Reducer
+# ######################################################################################################################
+def reduce_batch(queue: WorkQueue, batch_id: int) -> pd.DataFrame:
+	"""Combines the partial results of the shards (in shard order - the outputs are the same as the ones of a serial
+	run): the interval-level rows are streamed to the outputs (and the result store), the rankings and the metrics are
+	merged, and the stream-level results are ranked and written. Marks the batch as complete; returns the stream-level
+	results"""
+	shards = queue.get_shards(batch_id)
+	not_done = [shard["shard_id"] for shard in shards if shard["status"] != "done"]
+	if len(not_done) > 0:
+		raise ValueError(f"Batch {batch_id} isn't done - shard(s) {not_done} : {queue.get_progress(batch_id)}")
+
+	registry = metrics.get_metrics()
+	registry.reset()
+	collector = ResultCollector()
+	stream_ranking = ranking.StreamRanking(n=config.rank_top_n)
+	interval_writers = dict()
+	sink = sinks.get_result_sink(config.result_sink, path=config.sqlite_path, batch_size=config.sink_batch_size) \
+		if config.result_sink is not None else None
+
+	for shard in shards:
+		partial = read_partial(shard["partial_path"])
+		collector.add_stream_level_results(partial["stream_df"])
+		stream_ranking.merge(partial["ranking"])
+		registry.merge(partial["metrics"])
+
+		with metrics.timer("write_interval_results", rows=sum(len(res["df"].index)
+		                                                      for res in partial["interval_level_res"].values())):
+			writers.write_interval_level_results(interval_writers, partial["interval_level_res"],
+			                                     output_format=config.output_format,
+			                                     row_group_size=config.output_row_group_size)
+			if sink is not None:
+				sink.write_interval_level_results(partial["interval_level_res"])
+
+	stream_df = collector.get_stream_df()
+	with metrics.timer("ranking", rows=len(stream_df.index)):
+		stream_df["rank"] = stream_ranking.get_rank(stream_df)
+	with metrics.timer("write_stream_results", rows=len(stream_df.index)):
+		stream_df.to_csv(config.output_stream_path, index=False)
+	writers.close_writers(interval_writers)
+
+	if sink is not None:
+		sink.write_stream_level_results(stream_df)
+		sink.close()
+
+	queue.set_batch_status(batch_id, "complete")
+	logger.info(f"Batch {batch_id} complete - {len(stream_df.index)} streams in {len(shards)} shard(s)")
+	return stream_df
+
+
+# Runner
+# ######################################################################################################################
+def run_batch(path: str, file_list: list[str], n_workers: int | None = None) -> int:
+	"""Produces a batch of the files, runs n_workers worker processes until every shard is done (a worker that dies is
+	replaced, and its shards are put back on the queue), and reduces the batch; returns the batch ID"""
+	n_workers = (os.cpu_count() or 1) if n_workers is None else n_workers
+	queue = get_queue()
+	batch_id = queue.create_batch(path, file_list, shard_size=config.batch_shard_size)
+	logger.info(f"Batch {batch_id} - {len(file_list)} file(s) in {len(queue.get_shards(batch_id))} shard(s), "
+	            f"{n_workers} worker(s)")
+
+	def start_worker(i: int) -> tuple[str, multiprocessing.Process]:
+		worker_id = f"{socket.gethostname()}-{batch_id}-{i}"
+		process = multiprocessing.Process(target=work, args=(config.batch_queue_path, batch_id, worker_id,
+		                                                     config.batch_lease_seconds, config.batch_max_attempts))
+		process.start()
+		return worker_id, process
+
+	workers = [start_worker(i) for i in range(n_workers)]
+	n_started = n_workers
+	while not queue.is_finished(batch_id):
+		for i, (worker_id, process) in enumerate(workers):
+			if process.is_alive() or process.exitcode == 0:
+				continue
+
+			logger.warning(f"Worker {worker_id} stopped (exit code {process.exitcode}) - released "
+			               f"{queue.release(batch_id, worker_id)} shard(s), and starting a new worker")
+			workers[i] = start_worker(n_started)
+			n_started += 1
+		time.sleep(__poll_seconds__)
+
+	for _, process in workers:
+		process.join()
+
+	failed = [shard["shard_id"] for shard in queue.get_shards(batch_id) if shard["status"] == "failed"]
+	if len(failed) > 0:
+		queue.set_batch_status(batch_id, "failed")
+		queue.close()
+		raise ValueError(f"Batch {batch_id} failed - shard(s) {failed} failed after {config.batch_max_attempts} attempts")
+
+	reduce_batch(queue, batch_id)
+	queue.close()
+	return batch_id
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Sharded batch mode - producer, workers and reducer")
+	subparsers = parser.add_subparsers(dest="command", required=True)
+
+	run_parser = subparsers.add_parser("run", help="produce a batch, process it with worker processes, and reduce it")
+	run_parser.add_argument("--workers", type=int, default=config.batch_workers, help="number of worker processes")
+	subparsers.add_parser("produce", help="put the shards of a new batch on the queue, and print the batch ID")
+	work_parser = subparsers.add_parser("work", help="claim and process shards of the batch, until none are left")
+	work_parser.add_argument("batch_id", type=int)
+	reduce_parser = subparsers.add_parser("reduce", help="combine the partial results of the batch into the outputs")
+	reduce_parser.add_argument("batch_id", type=int)
+	return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+	args = parse_args(argv)
+
+	try:
+		if args.command in ("run", "produce"):
+			path, pattern, _ = csv.get_input_source(config.input_format)
+			file_list = csv.get_list_of_files(path, pattern, recursive=config.discovery_recursive)
+			if args.command == "run":
+				run_batch(path, file_list, n_workers=args.workers)
+			else:
+				print(get_queue().create_batch(path, file_list, shard_size=config.batch_shard_size))
+		elif args.command == "work":
+			run_worker(get_queue(), args.batch_id)
+		else:
+			reduce_batch(get_queue(), args.batch_id)
+	except (sqlite3.Error, ValueError, NotADirectoryError) as err:
+		sys.exit(f"Batch {args.command} failed : {err}")
+
+
+if __name__ == '__main__':
+	main()
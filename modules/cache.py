@@ -0,0 +1,229 @@
+# On-disk cache of parsed streams - so that files which haven't changed since the last run aren't re-parsed from text
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import config
+from config import logger
+
+# optional dependency - only needed for the parquet/feather formats
+try:
+	import pyarrow
+except ImportError:
+	pyarrow = None
+
+__formats__ = ["npy", "parquet", "feather"]
+
+
+class StreamCache():
+	""" Cache of the parsed columns of each stream; one directory per source file with a meta.json and the data.
+	An entry is valid when the path, size and mtime of the source file match, and it was written by the same intake.
+	With verify_hash, the content hash of the file is stored too, and compared on every load (an entry stays valid when
+	only the mtime changed). The total size is bounded by evicting the least recently used entries """
+	__cache_path__: str
+	__format__: str
+	__mmap__: bool
+	__max_bytes__: int
+	__verify_hash__: bool
+
+	# total size of the cache (bytes) - computed on the first store
+	__size__: int | None
+
+	def __init__(self, cache_path: str, cache_format: str = "npy", mmap: bool = True, max_bytes: int = 2 ** 31,
+	             verify_hash: bool = False):
+		if cache_format not in __formats__:
+			raise ValueError(f"Invalid cache format : {cache_format}")
+
+		if cache_format != "npy" and pyarrow is None:
+			logger.warning(f"pyarrow isn't installed - using the 'npy' cache format instead of '{cache_format}'")
+			cache_format = "npy"
+
+		self.__cache_path__ = cache_path
+		self.__format__ = cache_format
+		self.__mmap__ = mmap
+		self.__max_bytes__ = max_bytes
+		self.__verify_hash__ = verify_hash
+		self.__size__ = None
+
+	# Get funcs
+	# ------------------------------------------------------------------------------------------------------------------
+	def get_cache_path(self) -> str:
+		return self.__cache_path__
+
+	def get_format(self) -> str:
+		return self.__format__
+
+	def get_entry_path(self, file_path: str) -> str:
+		key = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+		return f"{self.__cache_path__}{key}/"
+
+	def get_size(self) -> int:
+		if self.__size__ is None:
+			self.__size__ = sum(get_directory_size(entry) for entry in self.list_entries())
+		return self.__size__
+
+	def list_entries(self) -> list[str]:
+		if not os.path.isdir(self.__cache_path__):
+			return []
+
+		return [f"{self.__cache_path__}{entry.name}/" for entry in os.scandir(self.__cache_path__)
+		        if entry.is_dir() and not entry.name.startswith(".")]
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def is_valid(self, file_path: str, meta: dict, intake: str) -> bool:
+		stat = os.stat(file_path)
+
+		if meta.get("path") != os.path.abspath(file_path) or meta.get("size") != stat.st_size:
+			return False
+
+		if meta.get("intake") != intake or meta.get("format") != self.__format__:
+			return False
+
+		if not self.__verify_hash__:
+			return meta.get("mtime_ns") == stat.st_mtime_ns
+
+		return meta.get("hash") is not None and meta.get("hash") == get_file_hash(file_path)
+
+	def load(self, file_path: str, intake: str) -> pd.DataFrame | None:
+		"""Parsed DataFrame of the file - or None when there is no valid entry for it. intake - signature of the intake
+		that would parse the file (see get_intake_signature)"""
+		entry_path = self.get_entry_path(file_path)
+		meta_path = f"{entry_path}meta.json"
+
+		try:
+			with open(meta_path, "r") as f:
+				meta = json.load(f)
+
+			if not self.is_valid(file_path, meta, intake):
+				return None
+
+			if self.__format__ == "parquet":
+				df = pd.read_parquet(f"{entry_path}data.parquet")
+			elif self.__format__ == "feather":
+				df = pd.read_feather(f"{entry_path}data.feather")
+			else:
+				# one block per column, without a copy - the memory-mapped (read-only) columns stay on disk until they are
+				# read, instead of being consolidated into in-memory blocks
+				df = pd.DataFrame({column: np.load(f"{entry_path}{i}.npy", mmap_mode="r" if self.__mmap__ else None,
+				                                   allow_pickle=False)
+				                   for i, column in enumerate(meta["columns"])}, copy=False)
+
+			# last access time - used for the LRU eviction
+			os.utime(meta_path)
+			return df
+
+		except (OSError, ValueError, KeyError) as err:
+			logger.debug(f"No valid cache entry for '{file_path}' : {repr(err)}")
+			return None
+
+	def store(self, file_path: str, df: pd.DataFrame, intake: str) -> None:
+		stat = os.stat(file_path)
+		entry_path = self.get_entry_path(file_path)
+		tmp_path = f"{entry_path[:-1]}.tmp-{os.getpid()}/"
+
+		meta = {"path": os.path.abspath(file_path),
+		        "size": stat.st_size,
+		        "mtime_ns": stat.st_mtime_ns,
+		        # the file is only read a second time (hashed) when the hash is compared on load
+		        "hash": get_file_hash(file_path) if self.__verify_hash__ else None,
+		        "intake": intake,
+		        "format": self.__format__,
+		        "columns": df.columns.tolist()}
+
+		try:
+			os.makedirs(tmp_path, exist_ok=True)
+
+			if self.__format__ == "parquet":
+				df.to_parquet(f"{tmp_path}data.parquet", index=False)
+			elif self.__format__ == "feather":
+				df.reset_index(drop=True).to_feather(f"{tmp_path}data.feather")
+			else:
+				for i, column in enumerate(meta["columns"]):
+					np.save(f"{tmp_path}{i}.npy", df[column].to_numpy(), allow_pickle=False)
+
+			# meta.json is written last - an entry without it is never loaded
+			with open(f"{tmp_path}meta.json", "w") as f:
+				json.dump(meta, f)
+
+			old_size = get_directory_size(entry_path) if os.path.isdir(entry_path) else 0
+			shutil.rmtree(entry_path, ignore_errors=True)
+			os.replace(tmp_path, entry_path)
+
+			self.__size__ = self.get_size() - old_size + get_directory_size(entry_path)
+
+		except (OSError, ValueError) as err:
+			logger.warning(f"Failed to cache '{file_path}' : {repr(err)}")
+			shutil.rmtree(tmp_path, ignore_errors=True)
+			return
+
+		if self.__size__ > self.__max_bytes__:
+			self.evict()
+
+	def evict(self, max_bytes: int | None = None) -> int:
+		"""Removes the least recently used entries until the cache fits in max_bytes; returns the number removed"""
+		max_bytes = self.__max_bytes__ if max_bytes is None else max_bytes
+
+		entries = []
+		for entry_path in self.list_entries():
+			try:
+				last_access = os.stat(f"{entry_path}meta.json").st_mtime
+			except OSError:
+				# incomplete entry (e.g., interrupted write) - removed first
+				last_access = 0
+			entries.append((last_access, get_directory_size(entry_path), entry_path))
+
+		self.__size__ = sum(size for _, size, _ in entries)
+
+		removed = 0
+		for last_access, size, entry_path in sorted(entries):
+			if self.__size__ <= max_bytes:
+				break
+
+			shutil.rmtree(entry_path, ignore_errors=True)
+			self.__size__ -= size
+			removed += 1
+
+		if removed > 0:
+			logger.info(f"Evicted {removed} stream cache entries - cache size is now {self.__size__} bytes")
+
+		return removed
+
+	def clear(self) -> int:
+		return self.evict(max_bytes=0)
+
+
+def get_directory_size(path: str) -> int:
+	return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+def get_file_hash(file_path: str, block_size: int = 2 ** 20) -> str:
+	file_hash = hashlib.blake2b(digest_size=20)
+	with open(file_path, "rb") as f:
+		while block := f.read(block_size):
+			file_hash.update(block)
+	return file_hash.hexdigest()
+
+
+def get_intake_signature(intake_mode: str, downcast: bool) -> str:
+	"""The cached columns depend on the intake that parsed the file - entries written by a different intake aren't
+	valid. The caller passes the settings it actually reads the file with"""
+	return f"{intake_mode}:{downcast}"
+
+
+__stream_cache__: StreamCache | None = None
+
+
+def get_stream_cache() -> StreamCache:
+	"""Cache instance of the process - created from the config on first use"""
+	global __stream_cache__
+	if __stream_cache__ is None:
+		__stream_cache__ = StreamCache(cache_path=config.cache_path,
+		                               cache_format=config.cache_format,
+		                               mmap=config.cache_mmap,
+		                               max_bytes=config.cache_max_bytes,
+		                               verify_hash=config.cache_verify_hash)
+	return __stream_cache__
@@ -1,20 +1,107 @@
 # named csv_local because you cannot import Pandas into a module called "csv"
 
+import io
 import os
 import re
+import json
+import time
+from typing import NamedTuple
+from collections.abc import Iterator
+from functools import lru_cache
+import config
 from config import logger as logger
+from modules import metrics
 
+# order of the discovered files - None (directory order), "largest_first"
+__orders__ = [None, "largest_first"]
 
-def get_list_of_files(path: str, pattern: str) -> list[str]:
+
+class FileRecord(NamedTuple):
+	""" File found by the discovery - its stream ID (from the file name), full path, size (bytes) and mtime (ns) """
+	stream_id: int
+	path: str
+	size: int
+	mtime: int
+
+
+class FileManifest():
+	""" Size and mtime of the files processed by the previous runs - {path: [size, mtime]}, saved as JSON. The records
+	yielded by a discovery are only added to the saved manifest once the run is done (save), so that the files of a run
+	that failed are processed again by the next one """
+	__path__: str
+	__entries__: dict
+	__pending__: dict
+
+	def __init__(self, path: str):
+		self.__path__ = path
+		self.__pending__ = dict()
+		try:
+			with open(path, "r") as f:
+				self.__entries__ = json.load(f)
+		except (OSError, ValueError):
+			self.__entries__ = dict()
+
+	def __len__(self) -> int:
+		return len(self.__entries__)
+
+	def is_unchanged(self, record: FileRecord) -> bool:
+		return self.__entries__.get(record.path) == [record.size, record.mtime]
+
+	def add(self, record: FileRecord) -> None:
+		self.__pending__[record.path] = [record.size, record.mtime]
+
+	def save(self) -> None:
+		self.__entries__.update(self.__pending__)
+		self.__pending__ = dict()
+
+		os.makedirs(os.path.dirname(self.__path__) or ".", exist_ok=True)
+		tmp_path = f"{self.__path__}.tmp-{os.getpid()}"
+		with open(tmp_path, "w") as f:
+			json.dump(self.__entries__, f)
+		os.replace(tmp_path, self.__path__)
+
+
+def get_input_source(input_format: str) -> tuple[str, str, str]:
+	"""(directory, file name pattern, stream ID pattern) of the input files of the format ("csv" | "greenbutton")"""
+	if input_format == "csv":
+		return config.csv_path, config.csv_pattern, config.stream_id_pattern
+	if input_format == "greenbutton":
+		return config.gb_xml_path, config.gb_xml_pattern, config.gb_xml_stream_id_pattern
+	raise ValueError(f"Invalid input format : {input_format}")
+
+
+@lru_cache(maxsize=None)
+def get_pattern(pattern: str) -> re.Pattern:
+	return re.compile(pattern)
+
+
+def check_directory(path: str) -> None:
 	if not os.path.isdir(path):
 		logger.critical(f"Invalid Directory Path : '{path}'")
 		raise NotADirectoryError(f"Invalid Directory Path : {path}")
 
-	file_list = []
 
-	for f in os.listdir(path):
-		if re.match(pattern, f):
-			file_list.append(f)
+def scan_files(path: str, pattern: str, recursive: bool = False, prefix: str = "") -> Iterator[tuple[str, os.DirEntry]]:
+	"""(name relative to the path, entry) of the files whose name matches the pattern - lazily, one directory entry at a
+	time (os.scandir). With recursive, the sub-directories (e.g., files sharded by ID) are scanned too"""
+	regex = get_pattern(pattern)
+	with os.scandir(path) as entries:
+		for entry in entries:
+			if entry.is_file():
+				if regex.match(entry.name):
+					yield f"{prefix}{entry.name}", entry
+			elif recursive and entry.is_dir():
+				yield from scan_files(entry.path, pattern, recursive=True, prefix=f"{prefix}{entry.name}/")
+
+
+def get_list_of_files(path: str, pattern: str, recursive: bool = False) -> list[str]:
+	"""Names (relative to the path) of the files that match the pattern"""
+	check_directory(path)
+
+	with metrics.timer("list_files") as timer:
+		file_list = [name for name, _ in scan_files(path, pattern, recursive=recursive)]
+		timer.set_rows(len(file_list))
+	metrics.increment("files_listed", len(file_list))
 
 	if len(file_list) == 0:
 		logger.warning("No files found")
@@ -22,3 +109,106 @@ def get_list_of_files(path: str, pattern: str) -> list[str]:
 		logger.info(f"{len(file_list)} file(s) found with the pattern '{pattern}' in path {path} ")
 
 	return file_list
+
+
+def iter_file_records(path: str, pattern: str, stream_id_pattern: str, recursive: bool = False, order: str | None = None,
+                      manifest: FileManifest | None = None) -> Iterator[FileRecord]:
+	"""Records of the files that match the pattern - yielded as the directory is scanned, so the files can be processed
+	before the listing is done (unless they are ordered "largest_first", which needs the whole listing - the biggest
+	files are then started first, and the parallel workers finish at about the same time). The stream ID is the first
+	group of stream_id_pattern in the file name. With a manifest, the files that haven't changed since it was saved are
+	skipped, and the others are added to it"""
+	if order not in __orders__:
+		raise ValueError(f"Invalid file order : {order}")
+	check_directory(path)
+	return discover_files(path, pattern, stream_id_pattern, recursive, order == "largest_first", manifest)
+
+
+def discover_files(path: str, pattern: str, stream_id_pattern: str, recursive: bool, largest_first: bool,
+                   manifest: FileManifest | None) -> Iterator[FileRecord]:
+	stream_id_regex = get_pattern(stream_id_pattern)
+	n_files, n_skipped, seconds = 0, 0, 0.0
+
+	def scan() -> Iterator[FileRecord]:
+		nonlocal n_files, n_skipped, seconds
+		start = time.perf_counter()
+		for _, entry in scan_files(path, pattern, recursive=recursive):
+			stream_id = stream_id_regex.match(entry.name)
+			if stream_id is None:
+				logger.warning(f"No stream ID in the file name '{entry.path}' - skipped")
+				continue
+
+			stat = entry.stat()
+			record = FileRecord(stream_id=int(stream_id.group(1)), path=entry.path, size=stat.st_size,
+			                    mtime=stat.st_mtime_ns)
+			if manifest is not None and manifest.is_unchanged(record):
+				n_skipped += 1
+				continue
+
+			n_files += 1
+			seconds += time.perf_counter() - start
+			yield record
+			start = time.perf_counter()
+		seconds += time.perf_counter() - start
+
+	records = sorted(scan(), key=lambda record: record.size, reverse=True) if largest_first else scan()
+	for record in records:
+		if manifest is not None:
+			manifest.add(record)
+		yield record
+
+	# only the time spent listing - not the time the consumer spent on the records
+	metrics.get_metrics().add("list_files", seconds, rows=n_files + n_skipped)
+	metrics.increment("files_listed", n_files)
+	logger.info(f"{n_files} file(s) found with the pattern '{pattern}' in path {path}" +
+	            (f" - {n_skipped} unchanged file(s) skipped" if n_skipped > 0 else ""))
+
+
+class ByteRangeReader(io.RawIOBase):
+	""" Read-only view of the bytes [start, end) of a file """
+
+	def __init__(self, file: str, start: int, end: int):
+		super().__init__()
+		self.__file__ = open(file, "rb")
+		self.__file__.seek(start)
+		self.__remaining__ = max(end - start, 0)
+
+	def readable(self) -> bool:
+		return True
+
+	def readinto(self, buffer) -> int:
+		size = min(len(buffer), self.__remaining__)
+		data = self.__file__.read(size)
+		buffer[:len(data)] = data
+		self.__remaining__ -= len(data)
+		return len(data)
+
+	def close(self) -> None:
+		self.__file__.close()
+		super().close()
+
+
+def open_byte_range(file: str, start: int, end: int) -> io.BufferedReader:
+	return io.BufferedReader(ByteRangeReader(file, start, end))
+
+
+def get_last_line_end(file: str, block_size: int = 2 ** 16) -> int:
+	"""Offset right after the last complete line of the file - a line that is still being written (no newline yet) is
+	only counted as complete if it has as many fields as the header"""
+	size = os.path.getsize(file)
+
+	with open(file, "rb") as f:
+		header = f.readline()
+
+		f.seek(max(size - block_size, 0))
+		tail = f.read()
+
+	if tail.endswith(b"\n"):
+		return size
+
+	last_newline = tail.rfind(b"\n")
+	last_line = tail[last_newline + 1:]
+	if last_line.count(b",") == header.count(b","):
+		return size
+
+	return size - len(last_line)
@@ -0,0 +1,107 @@
+# Green Button (ESPI) XML intake - the IntervalReadings of a file are parsed incrementally (iterparse): each reading is
+# dropped from its IntervalBlock once its values are taken, and each feed entry once it ends, so only the parsed columns
+# are held in memory (never the element tree of the file)
+
+import numpy as np
+import pandas as pd
+from array import array
+from xml.etree import ElementTree
+
+__espi__ = "{http://naesb.org/espi}"
+__atom__ = "{http://www.w3.org/2005/Atom}"
+
+__entry_tag__ = f"{__atom__}entry"
+__interval_block_tag__ = f"{__espi__}IntervalBlock"
+__interval_reading_tag__ = f"{__espi__}IntervalReading"
+__reading_type_tag__ = f"{__espi__}ReadingType"
+__time_period_tag__ = f"{__espi__}timePeriod"
+__start_tag__ = f"{__espi__}start"
+__duration_tag__ = f"{__espi__}duration"
+__value_tag__ = f"{__espi__}value"
+__reading_quality_tag__ = f"{__espi__}ReadingQuality"
+__quality_tag__ = f"{__espi__}quality"
+__power_of_ten_tag__ = f"{__espi__}powerOfTenMultiplier"
+__uom_tag__ = f"{__espi__}uom"
+
+# ReadingType.uom of Wh - the values are converted to kWh (the unit of the CSV files)
+__uom_wh__ = 72
+# ReadingQuality.quality codes of the estimated readings (estimated using a reference day / linear interpolation)
+__estimated_qualities__ = {"8", "9"}
+
+
+def is_greenbutton_file(file_path: str) -> bool:
+	return file_path.lower().endswith(".xml")
+
+
+def read_interval_readings(file) -> pd.DataFrame:
+	"""Readings of a Green Button file (path or binary file object), with the columns of the CSV files: timestamp,
+	dttm_utc, value, estimated and anomaly (always NaN - ESPI has no such flag).
+	timestamp is the end of each reading's timePeriod (the CSV files are stamped with the end of the interval), the
+	values are scaled by the powerOfTenMultiplier of the ReadingType (and Wh -> kWh), and a reading without a value is
+	NaN. The readings are sorted by time if the blocks aren't in order. Expects a single ReadingType per file (as in the
+	data set). Raises ValueError if the file isn't well-formed"""
+	timestamps, values, estimated = array("q"), array("d"), array("b")
+	power_of_ten, uom = 0, None
+
+	try:
+		context = ElementTree.iterparse(file, events=("start", "end"))
+		_, root = next(context)
+		block = root
+
+		for event, elem in context:
+			tag = elem.tag
+			if event == "start":
+				if tag == __interval_block_tag__:
+					block = elem
+				continue
+
+			if tag == __interval_reading_tag__:
+				start, duration, value, quality = 0, 0, np.nan, 0
+				for child in elem:
+					child_tag = child.tag
+					if child_tag == __time_period_tag__:
+						for period in child:
+							if period.tag == __start_tag__:
+								start = int(period.text)
+							elif period.tag == __duration_tag__:
+								duration = int(period.text)
+					elif child_tag == __value_tag__:
+						value = float(child.text)
+					elif child_tag == __reading_quality_tag__:
+						quality = child.findtext(__quality_tag__) in __estimated_qualities__
+
+				timestamps.append(start + duration)
+				values.append(value)
+				estimated.append(quality)
+				# the readings (and the interval) that were already taken are dropped from the block
+				block.clear()
+			elif tag == __reading_type_tag__:
+				power_of_ten = int(elem.findtext(__power_of_ten_tag__) or 0)
+				uom = int(elem.findtext(__uom_tag__) or 0)
+			elif tag == __entry_tag__:
+				root.clear()
+				block = root
+	except ElementTree.ParseError as err:
+		raise ValueError(f"Invalid Green Button file : {err}")
+
+	timestamp = np.frombuffer(timestamps, dtype="int64").copy()
+	value = get_scaled_values(np.frombuffer(values, dtype="float64"), power_of_ten, uom)
+	df = pd.DataFrame({"timestamp": timestamp,
+	                   "dttm_utc": pd.to_datetime(timestamp, unit="s"),
+	                   "value": value,
+	                   "estimated": np.frombuffer(estimated, dtype="int8").astype("int64"),
+	                   "anomaly": np.full(len(timestamp), np.nan)})
+
+	if len(timestamp) > 1 and np.any(np.diff(timestamp) < 0):
+		df = df.iloc[np.argsort(timestamp, kind="stable")].reset_index(drop=True)
+	return df
+
+
+def get_scaled_values(values: np.ndarray, power_of_ten: int, uom: int | None) -> np.ndarray:
+	"""values * 10^power_of_ten (in kWh for Wh readings) - a negative exponent divides by the power of ten, so that
+	e.g. 352046 Wh * 10^-1 is exactly 35.2046 kWh"""
+	exponent = power_of_ten - 3 if uom == __uom_wh__ else power_of_ten
+	if exponent < 0:
+		return values / 10 ** -exponent
+	return values * 10 ** exponent if exponent > 0 else values.copy()
+
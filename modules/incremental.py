@@ -0,0 +1,152 @@
+# Incremental processing of append-only meter files - each run only parses the rows added since the previous run.
+# A checkpoint is kept for each stream with the byte offset that was read up to, the hash of the bytes before it, the
+# running 0/NaN/1 counters, the results of the complete buckets (e.g., days), and the rows of the open (last) ones
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+import config
+from config import logger
+from modules import csv
+
+# size of the blocks read to hash the already processed part of a file
+__hash_block_size__ = 2 ** 20
+
+
+def get_checkpoint_dir(checkpoint_path: str, stream_id: int) -> str:
+	return f"{checkpoint_path}{stream_id}/"
+
+
+def get_prefix_hash():
+	return hashlib.blake2b(digest_size=20)
+
+
+def update_hash(file_hash, file: str, start: int, end: int):
+	"""Adds the bytes [start, end) of the file to the hash - the hash of the processed part of the file is carried on
+	with the appended bytes, so each byte is only hashed once per run"""
+	with open(file, "rb") as f:
+		f.seek(start)
+		remaining = end - start
+		while remaining > 0 and (block := f.read(min(__hash_block_size__, remaining))):
+			file_hash.update(block)
+			remaining -= len(block)
+	return file_hash
+
+
+def get_grouping_signature(grouping_config: dict) -> str:
+	"""The checkpointed results depend on the groupings/calcs - a checkpoint written with other settings isn't valid"""
+	signature = {grouping_type: {"interval": gc.get("interval"), "calcs": gc["calcs"],
+	                             "derived_from": gc.get("derived_from")} for grouping_type, gc in grouping_config.items()}
+	signature["settings"] = {"rollup_mode": config.rollup_mode, "median_mode": config.median_mode,
+	                         "local_time": config.local_time}
+	return json.dumps(signature, sort_keys=True)
+
+
+def load_checkpoint(checkpoint_dir: str, file: str, grouping_config: dict) -> dict | None:
+	"""State of the previous run for the file (see DataStream.get_chunked_intake_state) - or None if there isn't a
+	checkpoint, or if the file was changed other than by appending to it: the bytes before the checkpointed offset are
+	hashed again (a sequential read, much cheaper than parsing them), so an edit anywhere in the processed part is
+	detected. The checkpoint also has that hash ("prefix_hash"), to be carried on with the appended bytes"""
+	try:
+		with open(f"{checkpoint_dir}meta.json", "r") as f:
+			meta = json.load(f)
+
+		if meta["path"] != os.path.abspath(file) or meta["signature"] != get_grouping_signature(grouping_config):
+			return None
+
+		prefix_hash = None
+		if os.path.getsize(file) >= meta["offset"]:
+			prefix_hash = update_hash(get_prefix_hash(), file, 0, meta["offset"])
+		if prefix_hash is None or prefix_hash.hexdigest() != meta["prefix_hash"]:
+			logger.info(f"'{file}' was modified (not only appended to) since the last run - processing the whole file")
+			return None
+
+		with np.load(f"{checkpoint_dir}open_rows.npz", allow_pickle=False) as npz:
+			open_rows = pd.DataFrame({"timestamp": npz["timestamp"], "value": npz["value"]})
+
+		chunked_results = dict()
+		for grouping_type, columns in meta["columns"].items():
+			with np.load(f"{checkpoint_dir}{grouping_type}.npz", allow_pickle=False) as npz:
+				chunked_results[grouping_type] = pd.DataFrame({column: npz[str(i)] for i, column in enumerate(columns)})
+
+		return {"offset": meta["offset"],
+		        "prefix_hash": prefix_hash,
+		        "value_counts": meta["value_counts"],
+		        "total_intervals": meta["total_intervals"],
+		        "last_computed_buckets": meta["last_computed_buckets"],
+		        "open_rows": open_rows,
+		        "chunked_results": chunked_results}
+
+	except (OSError, ValueError, KeyError) as err:
+		logger.debug(f"No valid checkpoint for '{file}' : {repr(err)}")
+		return None
+
+
+def save_checkpoint(checkpoint_dir: str, file: str, offset: int, prefix_hash: str, grouping_config: dict,
+                    state: dict) -> None:
+	"""prefix_hash - hex digest of the bytes of the file before the offset"""
+	tmp_dir = f"{checkpoint_dir[:-1]}.tmp-{os.getpid()}/"
+
+	meta = {"path": os.path.abspath(file),
+	        "offset": offset,
+	        "prefix_hash": prefix_hash,
+	        "signature": get_grouping_signature(grouping_config),
+	        "value_counts": state["value_counts"],
+	        "total_intervals": state["total_intervals"],
+	        "last_computed_buckets": state["last_computed_buckets"],
+	        "columns": {grouping_type: df.columns.tolist() for grouping_type, df in state["chunked_results"].items()}}
+
+	try:
+		os.makedirs(tmp_dir, exist_ok=True)
+
+		np.savez(f"{tmp_dir}open_rows.npz", timestamp=state["open_rows"]["timestamp"].to_numpy(),
+		         value=state["open_rows"]["value"].to_numpy())
+		for grouping_type, df in state["chunked_results"].items():
+			np.savez(f"{tmp_dir}{grouping_type}.npz", **{str(i): df[column].to_numpy()
+			                                             for i, column in enumerate(df.columns)})
+
+		# meta.json is written last - a checkpoint without it is never loaded
+		with open(f"{tmp_dir}meta.json", "w") as f:
+			json.dump(meta, f)
+
+		remove_checkpoint(checkpoint_dir)
+		os.replace(tmp_dir, checkpoint_dir)
+
+	except (OSError, ValueError) as err:
+		logger.warning(f"Failed to save the checkpoint for '{file}' : {repr(err)}")
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def remove_checkpoint(checkpoint_dir: str) -> None:
+	shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+def read_csv_data_incremental(ds, file: str, chunk_size: int, checkpoint_path: str) -> bool:
+	"""Chunked intake of the DataStream, that carries on from the checkpoint of the previous run (if there is a valid
+	one), and then saves a new checkpoint. The results are the same as the ones of a full intake of the file"""
+	checkpoint_dir = get_checkpoint_dir(checkpoint_path, ds.get_stream_id())
+	grouping_config = ds.get_grouping_config()
+
+	# rows that are still being written are left for the next run
+	end = csv.get_last_line_end(file)
+
+	checkpoint = load_checkpoint(checkpoint_dir, file, grouping_config)
+	if checkpoint is not None:
+		logger.info(f"Resuming Stream(ID): {ds.get_stream_id()} from byte {checkpoint['offset']} (of {end})")
+
+	ds.read_csv_data_chunked(file=file, chunk_size=chunk_size, checkpoint=checkpoint, end=end)
+
+	state = ds.get_chunked_intake_state()
+	if state is None:
+		# the file couldn't be read, or it wasn't read by the chunked intake (not sorted by time)
+		remove_checkpoint(checkpoint_dir)
+	else:
+		start, prefix_hash = (0, get_prefix_hash()) if checkpoint is None else \
+			(checkpoint["offset"], checkpoint["prefix_hash"])
+		prefix_hash = update_hash(prefix_hash, file, start, end).hexdigest()
+		save_checkpoint(checkpoint_dir, file, end, prefix_hash, grouping_config, state)
+
+	return ds.is_valid_stream()
@@ -0,0 +1,367 @@
+# Instrumentation of a run - timers and counters around the stages of the per-stream work (file listing, intake,
+# classification, the grouping definitions and the calcs). For each stage: number of calls, wall time, rows processed
+# (-> rows per second), and peak memory (when tracemalloc is tracing). The metrics are exported once per run, as a JSON
+# summary and optionally in the Prometheus text format; the slowest streams can also be profiled (cProfile/tracemalloc)
+
+import os
+import io
+import time
+import json
+import heapq
+import marshal
+import cProfile
+import threading
+import tracemalloc
+from collections.abc import Callable
+from config import logger, metrics_slowest_streams
+
+__profile_modes__ = ["cprofile", "tracemalloc"]
+
+# number of allocation sites listed by a tracemalloc profile
+__tracemalloc_top__ = 25
+
+
+class Timer():
+	""" Times a block of code as a stage of the metrics - the rows processed can be given up front, or set once they are
+	known (set_rows) """
+	__metrics__: "Metrics"
+	__stage__: str
+	__rows__: int
+	__start__: float
+
+	def __init__(self, metrics: "Metrics", stage: str, rows: int = 0):
+		self.__metrics__ = metrics
+		self.__stage__ = stage
+		self.__rows__ = rows
+		self.__start__ = 0.0
+
+	def set_rows(self, rows: int) -> None:
+		self.__rows__ = rows
+
+	def __enter__(self) -> "Timer":
+		self.__metrics__.start_memory()
+		self.__start__ = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback) -> None:
+		seconds = time.perf_counter() - self.__start__
+		self.__metrics__.add(self.__stage__, seconds=seconds, rows=self.__rows__,
+		                     peak_bytes=self.__metrics__.stop_memory())
+
+
+class Metrics():
+	""" Thread-safe registry of the stage timings and the counters of a run. The state of a registry can be merged into
+	another one (e.g., the metrics of a worker process into the ones of the main process) """
+
+	# {stage: {"calls": int, "seconds": float, "max_seconds": float, "rows": int, "peak_bytes": int | None}}
+	__stages__: dict
+	# {name: int}
+	__counters__: dict
+	# slowest streams - min-heap of (seconds, stream_id), bounded by __n_slowest__
+	__slowest__: list
+	__n_slowest__: int
+	__lock__: threading.Lock
+
+	# memory of the stages being timed, per thread - [[memory at the start, highest peak seen], ...] (innermost last)
+	__local__: threading.local
+
+	def __init__(self, n_slowest: int = 10):
+		self.__n_slowest__ = n_slowest
+		self.__lock__ = threading.Lock()
+		self.__local__ = threading.local()
+		self.reset()
+
+	def reset(self) -> None:
+		with self.__lock__:
+			self.__stages__ = dict()
+			self.__counters__ = dict()
+			self.__slowest__ = []
+
+	def timer(self, stage: str, rows: int = 0) -> Timer:
+		return Timer(self, stage, rows=rows)
+
+	def add(self, stage: str, seconds: float, rows: int = 0, calls: int = 1, peak_bytes: int | None = None) -> None:
+		with self.__lock__:
+			metrics = self.__stages__.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "rows": 0,
+			                                             "peak_bytes": None})
+			metrics["calls"] += calls
+			metrics["seconds"] += seconds
+			metrics["max_seconds"] = max(metrics["max_seconds"], seconds if calls == 1 else 0.0)
+			metrics["rows"] += rows
+			if peak_bytes is not None:
+				metrics["peak_bytes"] = max(metrics["peak_bytes"] or 0, peak_bytes)
+
+	def increment(self, counter: str, value: int = 1) -> None:
+		with self.__lock__:
+			self.__counters__[counter] = self.__counters__.get(counter, 0) + value
+
+	def add_stream(self, stream_id: int, seconds: float) -> None:
+		"""Wall time of the whole per-stream work - only the slowest streams are kept"""
+		with self.__lock__:
+			if len(self.__slowest__) < self.__n_slowest__:
+				heapq.heappush(self.__slowest__, (seconds, stream_id))
+			elif self.__n_slowest__ > 0 and seconds > self.__slowest__[0][0]:
+				heapq.heapreplace(self.__slowest__, (seconds, stream_id))
+
+	# Peak memory
+	# ------------------------------------------------------------------------------------------------------------------
+	# tracemalloc only has one (process-wide) peak, so it's reset when a stage starts; the peak of the enclosing stages
+	# is carried over on the stack. With several threads (pipelined mode), the peaks include the other threads' memory
+	def get_memory_stack(self) -> list:
+		if not hasattr(self.__local__, "stack"):
+			self.__local__.stack = []
+		return self.__local__.stack
+
+	def start_memory(self) -> None:
+		if not tracemalloc.is_tracing():
+			return
+
+		current, peak = tracemalloc.get_traced_memory()
+		stack = self.get_memory_stack()
+		if len(stack) > 0:
+			stack[-1][1] = max(stack[-1][1], peak)
+		tracemalloc.reset_peak()
+		stack.append([current, current])
+
+	def stop_memory(self) -> int | None:
+		"""Peak memory (bytes) allocated by the stage over what was allocated when it started"""
+		stack = self.get_memory_stack()
+		if not tracemalloc.is_tracing() or len(stack) == 0:
+			return None
+
+		start, highest = stack.pop()
+		peak = max(highest, tracemalloc.get_traced_memory()[1])
+		if len(stack) > 0:
+			stack[-1][1] = max(stack[-1][1], peak)
+		return peak - start
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def get_state(self) -> dict:
+		with self.__lock__:
+			return {"stages": {stage: dict(metrics) for stage, metrics in self.__stages__.items()},
+			        "counters": dict(self.__counters__),
+			        "slowest": list(self.__slowest__)}
+
+	def merge(self, state: dict) -> None:
+		"""Adds the state of another registry (see get_state)"""
+		for stage, metrics in state["stages"].items():
+			self.add(stage, seconds=metrics["seconds"], rows=metrics["rows"], calls=metrics["calls"],
+			         peak_bytes=metrics["peak_bytes"])
+			with self.__lock__:
+				self.__stages__[stage]["max_seconds"] = max(self.__stages__[stage]["max_seconds"], metrics["max_seconds"])
+		for counter, value in state["counters"].items():
+			self.increment(counter, value)
+		for seconds, stream_id in state["slowest"]:
+			self.add_stream(stream_id, seconds)
+
+	def get_summary(self) -> dict:
+		"""Per-stage calls, wall time (total/mean/max), rows, rows per second and peak memory (MB), the counters, and the
+		slowest streams (slowest first)"""
+		state = self.get_state()
+
+		stages = dict()
+		for stage, metrics in state["stages"].items():
+			stages[stage] = {"calls": metrics["calls"],
+			                 "seconds": metrics["seconds"],
+			                 "mean_seconds": metrics["seconds"] / metrics["calls"] if metrics["calls"] > 0 else None,
+			                 "max_seconds": metrics["max_seconds"],
+			                 "rows": metrics["rows"],
+			                 "rows_per_second": metrics["rows"] / metrics["seconds"] if metrics["seconds"] > 0 else None,
+			                 "peak_memory_mb": metrics["peak_bytes"] / 2 ** 20 if metrics["peak_bytes"] is not None
+			                 else None}
+
+		return {"stages": stages,
+		        "counters": state["counters"],
+		        "slowest_streams": [{"stream_id": stream_id, "seconds": seconds}
+		                            for seconds, stream_id in sorted(state["slowest"], reverse=True)]}
+
+	def log(self) -> None:
+		for stage, metrics in self.get_summary()["stages"].items():
+			rows_per_second = f"{metrics['rows_per_second']:.0f} rows/s" if metrics["rows_per_second"] is not None and \
+				metrics["rows"] > 0 else "-"
+			peak = f"{metrics['peak_memory_mb']:.1f}MB peak" if metrics["peak_memory_mb"] is not None else "-"
+			logger.info(f"Stage '{stage}' : {metrics['calls']} call(s), {metrics['seconds']:.3f}s, {rows_per_second}, "
+			            f"{peak}")
+
+	def write_summary(self, path: str) -> None:
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+		with open(path, "w") as f:
+			json.dump(self.get_summary(), f, indent=2)
+
+	def write_prometheus(self, path: str, prefix: str = "enel") -> None:
+		"""Prometheus text format - e.g., for the textfile collector of the node exporter. Written to a temporary file
+		first, so a scrape never sees a partial file"""
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+		with open(f"{path}.tmp", "w") as f:
+			f.write(get_prometheus_text(self.get_state(), prefix=prefix))
+		os.replace(f"{path}.tmp", path)
+
+
+class StreamProfiles():
+	""" Profiles of the slowest streams - every stream is profiled, and only the n slowest profiles are kept (cProfile
+	stats, or the top allocation sites of tracemalloc) until they are written """
+	__n__: int
+	__mode__: str
+	# min-heap of (seconds, stream_id, profile)
+	__profiles__: list
+
+	def __init__(self, n: int, mode: str = "cprofile"):
+		if mode not in __profile_modes__:
+			raise ValueError(f"Invalid profile mode : {mode}")
+
+		self.__n__ = n
+		self.__mode__ = mode
+		self.__profiles__ = []
+
+	def get_mode(self) -> str:
+		return self.__mode__
+
+	def add(self, stream_id: int, seconds: float, profile: bytes | str) -> None:
+		if len(self.__profiles__) < self.__n__:
+			heapq.heappush(self.__profiles__, (seconds, stream_id, profile))
+		elif self.__n__ > 0 and seconds > self.__profiles__[0][0]:
+			heapq.heapreplace(self.__profiles__, (seconds, stream_id, profile))
+
+	def write(self, path: str) -> list[str]:
+		"""One file per stream - stream_<id>.prof (cProfile, e.g., for pstats/snakeviz) or stream_<id>.txt
+		(tracemalloc); returns the paths, slowest first"""
+		os.makedirs(path, exist_ok=True)
+
+		paths = []
+		for seconds, stream_id, profile in sorted(self.__profiles__, key=lambda p: p[0], reverse=True):
+			if self.__mode__ == "cprofile":
+				file_path = f"{path}stream_{stream_id}.prof"
+				with open(file_path, "wb") as f:
+					f.write(profile)
+			else:
+				file_path = f"{path}stream_{stream_id}.txt"
+				with open(file_path, "w") as f:
+					f.write(f"Stream(ID): {stream_id} - {seconds:.3f}s\n{profile}")
+			paths.append(file_path)
+
+		return paths
+
+
+def profile_call(func: Callable, args: tuple, mode: str) -> tuple:
+	"""func(*args), and its profile - marshalled cProfile stats (the .prof format), or the top allocation sites"""
+	if mode == "cprofile":
+		profiler = cProfile.Profile()
+		res = profiler.runcall(func, *args)
+		profiler.create_stats()
+		return res, marshal.dumps(profiler.stats)
+
+	started = not tracemalloc.is_tracing()
+	if started:
+		tracemalloc.start()
+	# the peak is tracked on the registry's stack - the stages timed inside func reset the process-wide peak
+	registry = get_metrics()
+	try:
+		before = tracemalloc.take_snapshot()
+		registry.start_memory()
+		try:
+			res = func(*args)
+		finally:
+			peak = registry.stop_memory()
+		snapshot = tracemalloc.take_snapshot()
+	finally:
+		if started:
+			tracemalloc.stop()
+
+	# memory still held once the stream is done (e.g., its results), by allocation site - without the import machinery
+	# and tracemalloc itself
+	filters = [tracemalloc.Filter(False, "<frozen *>"), tracemalloc.Filter(False, tracemalloc.__file__)]
+	text = io.StringIO()
+	text.write(f"peak traced memory: {peak / 2 ** 20:.1f}MB\n")
+	for stat in snapshot.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")[:__tracemalloc_top__]:
+		text.write(f"{stat}\n")
+	return res, text.getvalue()
+
+
+def run_stream(func: Callable, stream_id: int, *args, profile_mode: str | None = None,
+               worker: bool = False) -> tuple:
+	"""Runs the per-stream work func(stream_id, *args) - returns its result and a report of the run: {"stream_id",
+	"seconds", "profile", "metrics"}. In a worker process (worker=True), the registry is reset first, and its state is
+	sent back in the report (to be merged into the main process' registry)"""
+	registry = get_metrics()
+	if worker:
+		registry.reset()
+
+	start = time.perf_counter()
+	if profile_mode is None:
+		res, profile = func(stream_id, *args), None
+	else:
+		res, profile = profile_call(func, (stream_id, *args), profile_mode)
+	seconds = time.perf_counter() - start
+
+	return res, {"stream_id": stream_id,
+	             "seconds": seconds,
+	             "profile": profile,
+	             "metrics": registry.get_state() if worker else None}
+
+
+def add_stream_report(report: dict, profiles: StreamProfiles | None = None) -> None:
+	registry = get_metrics()
+	if report["metrics"] is not None:
+		registry.merge(report["metrics"])
+	registry.add_stream(report["stream_id"], report["seconds"])
+
+	if profiles is not None and report["profile"] is not None:
+		profiles.add(report["stream_id"], report["seconds"], report["profile"])
+
+
+def escape_label(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def get_prometheus_text(state: dict, prefix: str = "enel") -> str:
+	lines = []
+
+	def add_metric(name: str, metric_type: str, description: str, samples: list) -> None:
+		lines.append(f"# HELP {prefix}_{name} {description}")
+		lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+		for labels, value in samples:
+			label_text = ",".join(f'{key}="{escape_label(str(label))}"' for key, label in labels.items())
+			lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+	stages = state["stages"]
+	add_metric("stage_calls_total", "counter", "Number of times the stage ran",
+	           [({"stage": stage}, metrics["calls"]) for stage, metrics in stages.items()])
+	add_metric("stage_seconds_total", "counter", "Wall time spent in the stage",
+	           [({"stage": stage}, repr(metrics["seconds"])) for stage, metrics in stages.items()])
+	add_metric("stage_max_seconds", "gauge", "Longest single run of the stage",
+	           [({"stage": stage}, repr(metrics["max_seconds"])) for stage, metrics in stages.items()])
+	add_metric("stage_rows_total", "counter", "Rows processed by the stage",
+	           [({"stage": stage}, metrics["rows"]) for stage, metrics in stages.items()])
+	add_metric("stage_peak_memory_bytes", "gauge", "Peak memory allocated by the stage (tracemalloc)",
+	           [({"stage": stage}, metrics["peak_bytes"]) for stage, metrics in stages.items()
+	            if metrics["peak_bytes"] is not None])
+	add_metric("events_total", "counter", "Counters of the run",
+	           [({"name": counter}, value) for counter, value in state["counters"].items()])
+
+	return "\n".join(lines) + "\n"
+
+
+# registry of the process - each worker process has its own (see run_stream)
+__metrics__ = Metrics(n_slowest=metrics_slowest_streams)
+
+
+def get_metrics() -> Metrics:
+	return __metrics__
+
+
+def timer(stage: str, rows: int = 0) -> Timer:
+	return __metrics__.timer(stage, rows=rows)
+
+
+def timed(stage: str, func: Callable, rows: Callable | None = None) -> Callable:
+	"""func, timed as a stage on each call - rows(*args) is the number of rows processed by a call"""
+	def timed_func(*args, **kwargs):
+		with __metrics__.timer(stage, rows=rows(*args) if rows is not None else 0):
+			return func(*args, **kwargs)
+	return timed_func
+
+
+def increment(counter: str, value: int = 1) -> None:
+	__metrics__.increment(counter, value)
+
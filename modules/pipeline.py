@@ -0,0 +1,241 @@
+# Pipelined processing of the streams - reader threads parse the next files while the compute workers are busy with the
+# current ones, and the consumer (the writer stage) gets the results as soon as they are ready. The compute work can run
+# on a process pool (the compute threads then only hand the items over, and wait), so it isn't serialized by the GIL.
+# The stages are connected by bounded queues: a stage that gets too far ahead of the next one waits (backpressure), so
+# memory stays bounded
+
+import time
+import queue
+import threading
+from typing import NamedTuple
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor
+from config import logger
+
+# seconds between the checks of the stop flag, while a stage is waiting on a queue
+__poll_interval__ = 0.1
+
+
+class StageFailure(NamedTuple):
+	""" Exception raised by a stage on an item - it takes the place of the item, and the next stages pass it on
+	untouched, so that the consumer re-raises the original exception """
+	stage: str
+	error: Exception
+
+
+class StageTimings():
+	""" Number of items, busy time (doing the work) and waiting time (blocked on the queues - either starved by the
+	previous stage, or held back by the next one) of each stage - summed over the threads of the stage """
+
+	# {stage: {"items": int, "busy": float, "wait": float}}
+	__stages__: dict
+	__lock__: threading.Lock
+
+	def __init__(self):
+		self.__stages__ = dict()
+		self.__lock__ = threading.Lock()
+
+	def add(self, stage: str, busy: float = 0, wait: float = 0, items: int = 0) -> None:
+		with self.__lock__:
+			timings = self.__stages__.setdefault(stage, {"items": 0, "busy": 0.0, "wait": 0.0})
+			timings["items"] += items
+			timings["busy"] += busy
+			timings["wait"] += wait
+
+	def get_summary(self) -> dict:
+		with self.__lock__:
+			return {stage: dict(timings) for stage, timings in self.__stages__.items()}
+
+	def log(self) -> None:
+		for stage, timings in self.get_summary().items():
+			logger.info(f"Pipeline stage '{stage}' : {timings['items']} item(s), busy {timings['busy']:.3f}s, "
+			            f"waiting {timings['wait']:.3f}s")
+
+
+class Pipeline():
+	""" read(*task) runs on the reader threads, compute(read result) on the compute workers - or, with an executor (e.g.,
+	a ProcessPoolExecutor), on the executor, with the compute threads waiting for it (n_workers items are computed at
+	once). The results are yielded in the same order as the tasks, regardless of the order in which they were finished """
+	__read__: Callable
+	__compute__: Callable
+	__executor__: Executor | None
+	__n_readers__: int
+	__n_workers__: int
+	__queue_size__: int
+	__timings__: StageTimings
+
+	# set when the consumer stops early, or when a stage fails - every thread then exits
+	__stop__: threading.Event
+
+	def __init__(self, read: Callable, compute: Callable, n_readers: int = 2, n_workers: int = 2,
+	             queue_size: int = 8, timings: StageTimings | None = None, executor: Executor | None = None):
+		if n_readers < 1 or n_workers < 1 or queue_size < 1:
+			raise ValueError(f"Invalid pipeline settings : readers={n_readers}, workers={n_workers}, "
+			                 f"queue_size={queue_size}")
+
+		self.__read__ = read
+		self.__compute__ = compute
+		self.__executor__ = executor
+		self.__n_readers__ = n_readers
+		self.__n_workers__ = n_workers
+		self.__queue_size__ = queue_size
+		self.__timings__ = timings if timings is not None else StageTimings()
+		self.__stop__ = threading.Event()
+
+	def get_timings(self) -> StageTimings:
+		return self.__timings__
+
+	def compute(self, item):
+		"""compute(item) - on the executor when there is one (the items and the results are pickled, for a process
+		pool), the calling thread waits for it without holding the GIL"""
+		if self.__executor__ is None:
+			return self.__compute__(item)
+		return self.__executor__.submit(self.__compute__, item).result()
+
+	def put(self, q: queue.Queue, item) -> bool:
+		"""Blocks while the queue is full; returns False if the pipeline was stopped in the meantime"""
+		while not self.__stop__.is_set():
+			try:
+				q.put(item, timeout=__poll_interval__)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def acquire(self, window: threading.Semaphore) -> bool:
+		while not self.__stop__.is_set():
+			if window.acquire(timeout=__poll_interval__):
+				return True
+		return False
+
+	def get(self, q: queue.Queue):
+		"""Blocks while the queue is empty; returns None if the pipeline was stopped in the meantime"""
+		while not self.__stop__.is_set():
+			try:
+				return q.get(timeout=__poll_interval__)
+			except queue.Empty:
+				continue
+		return None
+
+	def run_stage(self, stage: str, func: Callable, source: queue.Queue, target: queue.Queue, unpack: bool,
+	              window: threading.Semaphore | None = None) -> None:
+		"""Takes (position, item) from the source, and puts (position, func(item)) on the target - until the source
+		is exhausted (None). An exception is passed on to the consumer (as a StageFailure), instead of a result - and the
+		failure of a previous stage isn't given to func, but passed on as is"""
+		while True:
+			start = time.perf_counter()
+			task = self.get(source) if window is None or self.acquire(window) else None
+			waited = time.perf_counter() - start
+
+			if task is None:
+				self.__timings__.add(stage, wait=waited)
+				return
+
+			position, item = task
+			start = time.perf_counter()
+			if isinstance(item, StageFailure):
+				res = item
+			else:
+				try:
+					res = func(*item) if unpack else func(item)
+				except Exception as err:
+					logger.error(f"Pipeline stage '{stage}' failed on item {position} : {repr(err)}")
+					res = StageFailure(stage=stage, error=err)
+			busy = time.perf_counter() - start
+
+			start = time.perf_counter()
+			self.put(target, (position, res))
+			self.__timings__.add(stage, busy=busy, wait=waited + time.perf_counter() - start, items=1)
+
+	def run_threads(self, stage: str, n_threads: int, func: Callable, source: queue.Queue, target: queue.Queue,
+	                unpack: bool, n_sentinels: int,
+	                window: threading.Semaphore | None = None) -> list[threading.Thread]:
+		"""Starts the threads of a stage; the last one to finish tells the next stage that there is nothing left"""
+		remaining = [n_threads]
+		lock = threading.Lock()
+
+		def worker():
+			self.run_stage(stage, func, source, target, unpack, window)
+			with lock:
+				remaining[0] -= 1
+				last = remaining[0] == 0
+			if last:
+				for _ in range(n_sentinels):
+					self.put(target, None)
+
+		threads = [threading.Thread(target=worker, name=f"pipeline-{stage}-{i}", daemon=True) for i in range(n_threads)]
+		for thread in threads:
+			thread.start()
+		return threads
+
+	def feed(self, tasks: Iterable[tuple], target: queue.Queue) -> None:
+		"""Puts (position, task) on the target as the tasks are taken from the iterable (e.g., as the files are listed),
+		then tells the readers that there is nothing left. An exception raised by the iterable takes the place of the
+		next task (as a StageFailure), and ends the tasks"""
+		position = 0
+		try:
+			for task in tasks:
+				if not self.put(target, (position, task)):
+					return
+				position += 1
+		except Exception as err:
+			logger.error(f"Pipeline tasks failed after item {position} : {repr(err)}")
+			if not self.put(target, (position, StageFailure(stage="tasks", error=err))):
+				return
+
+		for _ in range(self.__n_readers__):
+			self.put(target, None)
+
+	def run(self, tasks: Iterable[tuple]) -> Iterator:
+		"""The tasks are taken lazily (on a thread of their own) - only as far ahead of the consumer as the window
+		allows, so an iterator of tasks that produces them in memory (e.g., the members of an archive) isn't drained"""
+		self.__stop__.clear()
+
+		tasks_queue = queue.Queue(maxsize=self.__queue_size__)
+		read_queue = queue.Queue(maxsize=self.__queue_size__)
+		results_queue = queue.Queue(maxsize=self.__queue_size__)
+
+		# items that may be in the pipeline at once - a reader only takes a task when a result ahead of it was consumed.
+		# The queues alone don't bound it, since the results finished ahead of a slow one are held until it's done
+		window = threading.Semaphore(2 * self.__queue_size__ + self.__n_readers__ + self.__n_workers__)
+
+		threads = [threading.Thread(target=self.feed, args=(tasks, tasks_queue), name="pipeline-tasks", daemon=True)]
+		threads[0].start()
+		threads += self.run_threads("read", self.__n_readers__, self.__read__, tasks_queue, read_queue, unpack=True,
+		                            n_sentinels=self.__n_workers__, window=window)
+		threads += self.run_threads("compute", self.__n_workers__, self.compute, read_queue, results_queue,
+		                            unpack=False, n_sentinels=1)
+
+		# results that were finished before the ones ahead of them - {position: result}
+		pending = dict()
+		position = 0
+		try:
+			while True:
+				start = time.perf_counter()
+				while position not in pending:
+					done = self.get(results_queue)
+					if done is None:
+						break
+					pending[done[0]] = done[1]
+
+				# the stages are done - every result was put on the queue before the end of the results
+				if position not in pending:
+					if len(pending) > 0:
+						raise RuntimeError("The pipeline stopped before all the tasks were done")
+					return
+				res = pending.pop(position)
+				waited = time.perf_counter() - start
+
+				if isinstance(res, StageFailure):
+					raise res.error
+
+				# the time the consumer spends on a result is the busy time of the writer stage
+				start = time.perf_counter()
+				yield res
+				self.__timings__.add("write", busy=time.perf_counter() - start, wait=waited, items=1)
+				window.release()
+				position += 1
+		finally:
+			self.__stop__.set()
+			for thread in threads:
+				thread.join()
@@ -0,0 +1,218 @@
+# Query API over the result store - hourly/daily statistics of a stream for a time range, without re-reading the output
+# CSVs. The rows of recently requested streams are kept in an in-process LRU cache
+# usage (from the project directory): python -m modules.query 718 --grouping day_interval --start 2012-03-01
+#                                     --end 2012-03-31 --columns day_max
+
+import sys
+import time
+import sqlite3
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+import config
+from collections import OrderedDict
+from modules import rollup, sinks
+
+
+class QueryCache():
+	""" LRU cache of DataFrames, bounded by their total size (bytes) - the least recently used entries are evicted
+	first. Entries bigger than the whole cache aren't kept """
+	__max_bytes__: int
+	__entries__: OrderedDict
+	__size__: int
+
+	__hits__: int
+	__misses__: int
+	__evictions__: int
+
+	def __init__(self, max_bytes: int = 2 ** 28):
+		self.__max_bytes__ = max_bytes
+		self.__entries__ = OrderedDict()
+		self.__size__ = 0
+		self.__hits__ = 0
+		self.__misses__ = 0
+		self.__evictions__ = 0
+
+	def __len__(self) -> int:
+		return len(self.__entries__)
+
+	def get_size(self) -> int:
+		return self.__size__
+
+	def get(self, key: tuple) -> pd.DataFrame | None:
+		entry = self.__entries__.get(key)
+		if entry is None:
+			self.__misses__ += 1
+			return None
+
+		self.__hits__ += 1
+		self.__entries__.move_to_end(key)
+		return entry[0]
+
+	def put(self, key: tuple, df: pd.DataFrame) -> None:
+		size = int(df.memory_usage(index=True, deep=True).sum())
+		if key in self.__entries__:
+			self.__size__ -= self.__entries__.pop(key)[1]
+
+		if size > self.__max_bytes__:
+			return
+
+		self.__entries__[key] = (df, size)
+		self.__size__ += size
+
+		while self.__size__ > self.__max_bytes__:
+			_, (_, evicted_size) = self.__entries__.popitem(last=False)
+			self.__size__ -= evicted_size
+			self.__evictions__ += 1
+
+	def clear(self) -> None:
+		self.__entries__.clear()
+		self.__size__ = 0
+
+	def get_metrics(self) -> dict:
+		lookups = self.__hits__ + self.__misses__
+		return {"hits": self.__hits__,
+		        "misses": self.__misses__,
+		        "hit_rate": self.__hits__ / lookups if lookups > 0 else None,
+		        "evictions": self.__evictions__,
+		        "entries": len(self.__entries__),
+		        "bytes": self.__size__}
+
+
+class ResultQuery():
+	""" Reads the interval-level results of a stream from the SQLite result store (see sinks.SqliteSink). The rows of a
+	(grouping type, stream, batch) are read with a single indexed lookup and cached; the time range is then selected
+	from the cached slice, so other ranges of the same stream are cache hits too """
+	__path__: str
+	__connection__: sqlite3.Connection | None
+	__cache__: QueryCache
+
+	# latency of the queries (seconds) - {"hit" | "miss": {"count": int, "total": float, "max": float}}
+	__latency__: dict
+
+	def __init__(self, path: str, cache_max_bytes: int = 2 ** 28):
+		self.__path__ = path
+		self.__connection__ = None
+		self.__cache__ = QueryCache(max_bytes=cache_max_bytes)
+		self.__latency__ = {outcome: {"count": 0, "total": 0.0, "max": 0.0} for outcome in ("hit", "miss")}
+
+	def get_connection(self) -> sqlite3.Connection:
+		if self.__connection__ is None:
+			# read-only - a missing store is an error, instead of an empty database being created
+			self.__connection__ = sqlite3.connect(f"file:{self.__path__}?mode=ro", uri=True)
+		return self.__connection__
+
+	def get_cache(self) -> QueryCache:
+		return self.__cache__
+
+	def get_stream_slice(self, grouping_type: str, stream_id: int, batch_id: int) -> tuple[pd.DataFrame, bool]:
+		"""All the rows of the stream for the grouping (sorted by the interval keys), and whether it was a cache hit"""
+		key = (grouping_type, stream_id, batch_id)
+		df = self.__cache__.get(key)
+		if df is not None:
+			return df, True
+
+		if grouping_type not in get_grouping_types(self.get_connection()):
+			raise ValueError(f"Invalid grouping type : {grouping_type}")
+
+		df = pd.read_sql_query(f'SELECT * FROM "{grouping_type}" WHERE stream_id = ? AND batch_id = ?',
+		                       self.get_connection(), params=(stream_id, batch_id))
+		df = df.drop(columns=["batch_id"])
+		df = df.sort_values([c for c in df.columns if c.endswith("_interval")], kind="stable", ignore_index=True)
+
+		self.__cache__.put(key, df)
+		return df, False
+
+	def get_interval_results(self, stream_id: int, grouping_type: str = "day_interval",
+	                         start: str | datetime.date | None = None, end: str | datetime.date | None = None,
+	                         columns: list[str] | None = None, batch_id: int | None = None) -> pd.DataFrame:
+		"""Statistics of the stream from the start date to the end date (both included; weeks and months by their first
+		day) - from the latest complete batch, unless a batch ID is given"""
+		start_time = time.perf_counter()
+
+		if batch_id is None:
+			batch_id = sinks.get_latest_batch_id(self.get_connection())
+			if batch_id is None:
+				raise ValueError(f"No complete batch in the result store '{self.__path__}'")
+
+		df, hit = self.get_stream_slice(grouping_type, stream_id, batch_id)
+
+		# the slice is sorted by day (or week/month) - the range is a contiguous block of it
+		# (an empty slice has no integer keys)
+		days = next(iter(rollup.get_interval_days(df).values()), np.zeros(0, dtype="int64"))
+		first = np.searchsorted(days, get_day_key(start), side="left") if start is not None else 0
+		last = np.searchsorted(days, get_day_key(end), side="right") if end is not None else len(days)
+		res = df.iloc[first:last]
+
+		if columns is not None:
+			unknown = [c for c in columns if c not in res.columns]
+			if len(unknown) > 0:
+				raise ValueError(f"Invalid column(s) for the grouping type {grouping_type} : {unknown}")
+			res = res[[c for c in res.columns if c == "stream_id" or c.endswith("_interval")] + list(columns)]
+
+		res = rollup.format_interval_keys(res.reset_index(drop=True))
+		self.add_latency("hit" if hit else "miss", time.perf_counter() - start_time)
+		return res
+
+	def add_latency(self, outcome: str, seconds: float) -> None:
+		latency = self.__latency__[outcome]
+		latency["count"] += 1
+		latency["total"] += seconds
+		latency["max"] = max(latency["max"], seconds)
+
+	def get_metrics(self) -> dict:
+		"""Cache hits/misses/evictions/size, and the mean/max latency (ms) of the queries served from the cache (hit) and
+		from the store (miss)"""
+		metrics = self.__cache__.get_metrics()
+		for outcome, latency in self.__latency__.items():
+			metrics[f"{outcome}_latency_mean_ms"] = latency["total"] / latency["count"] * 1000 \
+				if latency["count"] > 0 else None
+			metrics[f"{outcome}_latency_max_ms"] = latency["max"] * 1000
+		return metrics
+
+	def close(self) -> None:
+		if self.__connection__ is not None:
+			self.__connection__.close()
+			self.__connection__ = None
+
+
+def get_day_key(day: str | datetime.date) -> int:
+	"""Days since 1970-01-01 - the day key used by the rollups and the result store"""
+	return int(pd.Timestamp(day).normalize().value // (rollup.seconds_per_day * 10 ** 9))
+
+
+def get_grouping_types(connection: sqlite3.Connection) -> list[str]:
+	return [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND "
+	                                             "name GLOB '*_interval'")]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="hour_*/day_* statistics of a stream, from the result store")
+	parser.add_argument("stream_id", type=int)
+	parser.add_argument("--grouping", default="day_interval", help="grouping type of the rollup plan (e.g., hour_interval)")
+	parser.add_argument("--start", help="first day (YYYY-MM-DD)")
+	parser.add_argument("--end", help="last day (YYYY-MM-DD), included")
+	parser.add_argument("--columns", nargs="+", help="statistics to show (e.g., day_max day_mean) - all by default")
+	parser.add_argument("--batch-id", type=int, help="batch of the results - the latest complete one by default")
+	parser.add_argument("--store", default=config.sqlite_path, help="path of the SQLite result store")
+	return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+	args = parse_args(argv)
+	query = ResultQuery(path=args.store, cache_max_bytes=config.query_cache_max_bytes)
+
+	try:
+		df = query.get_interval_results(stream_id=args.stream_id, grouping_type=args.grouping, start=args.start,
+		                                end=args.end, columns=args.columns, batch_id=args.batch_id)
+	except (sqlite3.Error, ValueError) as err:
+		sys.exit(f"Query failed : {err}")
+	finally:
+		query.close()
+
+	print(df.to_string(index=False))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,77 @@
+# Ranking of the streams by their count of 0's and NaN's - maintained as the stream-level results come in, and bounded
+# to the top n ranks: only the n highest distinct counts (and the streams that have them) are kept, in a min-heap, so
+# the ranking doesn't grow with the number of streams. Rankings of separate workers can be merged
+
+import heapq
+import pandas as pd
+
+
+class StreamRanking():
+	""" Dense rank (highest count first) of the streams that aren't ignored - the same ranks as
+	Series.rank(method="dense", ascending=False) for the streams ranked 1 to n (n=None -> every stream is ranked, so
+	the ranking grows with the number of streams).
+	The heap holds the distinct counts (smallest on top, evicted first when there are more than n of them) """
+	__n__: int | None
+	__heap__: list
+	# stream IDs with each of the counts in the heap - {count: [stream_id, ...]}, and their total
+	__streams__: dict
+	__n_streams__: int
+
+	def __init__(self, n: int | None = None):
+		if n is not None and n < 1:
+			raise ValueError(f"Invalid number of ranks : {n}")
+
+		self.__n__ = n
+		self.__heap__ = []
+		self.__streams__ = dict()
+		self.__n_streams__ = 0
+
+	def __len__(self) -> int:
+		"""Number of ranked streams"""
+		return self.__n_streams__
+
+	def get_n(self) -> int | None:
+		return self.__n__
+
+	def add(self, stream_id: int, count: int, stream_ids: list | None = None) -> None:
+		"""Adds a stream (or all the streams of stream_ids) with the count"""
+		stream_ids = [stream_id] if stream_ids is None else stream_ids
+		if count in self.__streams__:
+			self.__streams__[count].extend(stream_ids)
+			self.__n_streams__ += len(stream_ids)
+			return
+
+		if self.__n__ is not None and len(self.__heap__) >= self.__n__:
+			if count <= self.__heap__[0]:
+				return
+			self.__n_streams__ -= len(self.__streams__.pop(heapq.heapreplace(self.__heap__, count)))
+		else:
+			heapq.heappush(self.__heap__, count)
+		self.__streams__[count] = list(stream_ids)
+		self.__n_streams__ += len(stream_ids)
+
+	def add_stream_level_results(self, stream_level_res: pd.DataFrame) -> None:
+		"""Adds the streams of stream-level results that aren't ignored"""
+		ranked = stream_level_res.loc[stream_level_res["ignore"] == False]
+		for stream_id, count in zip(ranked["stream_id"].tolist(), ranked["count of 0 and NaN"].tolist()):
+			self.add(stream_id, count)
+
+	def get_state(self) -> list[tuple]:
+		"""[(count, [stream_id, ...]), ...] - picklable, e.g., to be sent back by a worker and merged"""
+		return [(count, list(stream_ids)) for count, stream_ids in self.__streams__.items()]
+
+	def merge(self, other: "StreamRanking | list[tuple]") -> None:
+		"""Adds the streams of another ranking (or of its state) - the result is the same as if all the streams had
+		been added to this one, as long as the other ranking kept at least as many ranks"""
+		for count, stream_ids in (other.get_state() if isinstance(other, StreamRanking) else other):
+			self.add(None, count, stream_ids=stream_ids)
+
+	def get_ranks(self) -> dict:
+		"""{stream_id: rank}"""
+		return {stream_id: rank for rank, count in enumerate(sorted(self.__streams__, reverse=True), start=1)
+		        for stream_id in self.__streams__[count]}
+
+	def get_rank(self, stream_df: pd.DataFrame) -> pd.Series:
+		"""Rank column of the stream-level results - only the ranked streams have a rank"""
+		rank = stream_df["stream_id"].map(self.get_ranks())
+		return rank[rank.notna()].astype("int32")
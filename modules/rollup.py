@@ -0,0 +1,394 @@
+# Single pass rollup engine - every configured statistic of a grouping is computed from one sort of the data.
+# Coarser groupings (e.g., daily from hourly) can be built from the partial aggregates of a finer grouping, instead of
+# going back over the raw intervals
+
+import numpy as np
+import pandas as pd
+from typing import List
+from collections.abc import Callable
+
+seconds_per_hour = 3600
+seconds_per_day = 86400
+
+
+class Segments():
+	""" Values of the operation field - sorted by group, and by value within each group - along with the position of
+	every group in the sorted array. Each statistic is then a vectorized lookup/reduction over the segments,
+	instead of a separate groupby over the whole DataFrame """
+
+	# one row per group, with the group-by columns
+	__keys__: pd.DataFrame
+
+	# values sorted by (group, value); NaN's are sorted to the end of their group
+	__values__: np.ndarray
+	# rank of each value of __values__ among all the values (NaN's last) - used to merge the sorted groups into the
+	# groups of a coarser grouping (see Partials.get_segments)
+	__ranks__: np.ndarray
+
+	# start position, number of rows, and number of non-NaN values of each group in __values__
+	__starts__: np.ndarray
+	__sizes__: np.ndarray
+	__counts__: np.ndarray
+
+	# partial aggregates - computed when first requested (__m2__ - sum of the squared deviations from the mean). The sums
+	# of the raw intervals are computed up front, in the order of the rows (see get_row_order_sums)
+	__sums__: np.ndarray | None
+	__m2__: np.ndarray | None
+
+	def __init__(self, keys: pd.DataFrame, values: np.ndarray, codes: np.ndarray, ranks: np.ndarray | None = None):
+		"""keys - one row per group; values - along with the group (row of keys) that each value belongs to.
+		ranks - rank of each value among all the values, when the values are already made of sorted runs (the groups of
+		a finer grouping)"""
+		self.__keys__ = keys.reset_index(drop=True)
+
+		n_values = len(values)
+		raw_values = ranks is None
+		if ranks is None:
+			# sorted by value (NaN's last), then - stable - by group: the same order as np.lexsort((values, codes)), and
+			# the rank of every value comes with it
+			by_value = np.argsort(values, kind="stable")
+			order = by_value[np.argsort(codes[by_value], kind="stable")]
+			ranks = np.empty(n_values, dtype="int64")
+			ranks[by_value] = np.arange(n_values)
+		else:
+			# (group, rank) as a single integer key - the runs are already sorted, so the stable sort (timsort) only
+			# merges them, instead of sorting the values again
+			order = np.argsort(codes.astype("int64") * n_values + ranks, kind="stable")
+		self.__values__ = values[order]
+		self.__ranks__ = ranks[order]
+
+		n_groups = len(self.__keys__.index)
+		self.__sizes__ = np.bincount(codes, minlength=n_groups)
+		self.__starts__ = np.cumsum(self.__sizes__) - self.__sizes__
+		self.__counts__ = np.bincount(codes[~np.isnan(values)], minlength=n_groups)
+		self.__sums__ = get_row_order_sums(values, codes, n_groups) if raw_values else None
+		self.__m2__ = None
+
+	# Get funcs
+	# ------------------------------------------------------------------------------------------------------------------
+	def get_keys(self) -> pd.DataFrame:
+		return self.__keys__
+
+	def get_values(self) -> np.ndarray:
+		return self.__values__
+
+	def get_ranks(self) -> np.ndarray:
+		return self.__ranks__
+
+	def get_starts(self) -> np.ndarray:
+		return self.__starts__
+
+	def get_sizes(self) -> np.ndarray:
+		return self.__sizes__
+
+	def get_counts(self) -> np.ndarray:
+		return self.__counts__
+
+	def get_groups(self) -> np.ndarray:
+		"""Group of each value of __values__"""
+		return np.repeat(np.arange(len(self.__sizes__)), self.__sizes__)
+
+	def get_sums(self) -> np.ndarray:
+		if self.__sums__ is None:
+			# NaN's are skipped - a group without any values sums up to 0 (same as pandas)
+			values = np.where(np.isnan(self.__values__), 0, self.__values__)
+			self.__sums__ = np.bincount(self.get_groups(), weights=values, minlength=len(self.__sizes__))
+		return self.__sums__
+
+	def get_m2(self) -> np.ndarray:
+		if self.__m2__ is None:
+			groups = self.get_groups()
+			deviations = self.__values__ - get_means(self.get_sums(), self.__counts__)[groups]
+			deviations = np.where(np.isnan(deviations), 0, deviations)
+			self.__m2__ = np.bincount(groups, weights=deviations * deviations, minlength=len(self.__sizes__))
+		return self.__m2__
+
+	def get_mins(self) -> np.ndarray:
+		return self.get_values_at(self.__starts__)
+
+	def get_maxs(self) -> np.ndarray:
+		return self.get_values_at(self.__starts__ + self.__counts__ - 1)
+
+	def get_medians(self) -> np.ndarray:
+		lower = self.get_values_at(self.__starts__ + (self.__counts__ - 1) // 2)
+		upper = self.get_values_at(self.__starts__ + self.__counts__ // 2)
+		return (lower + upper) / 2
+
+	def get_quantiles(self, q: float) -> np.ndarray:
+		"""q-th quantile (0 <= q <= 1) of each group - linear interpolation between the closest ranks (same as pandas)"""
+		positions = (self.__counts__ - 1) * q
+		lower_positions = np.floor(positions).astype("int64")
+		lower = self.get_values_at(self.__starts__ + lower_positions)
+		upper = self.get_values_at(self.__starts__ + np.ceil(positions).astype("int64"))
+		return lower + (upper - lower) * (positions - lower_positions)
+
+	def get_values_at(self, positions: np.ndarray) -> np.ndarray:
+		"""Value at the given position of each group (NaN for the groups without any values)"""
+		res = np.full(len(self.__counts__), np.nan)
+		has_values = self.__counts__ > 0
+		res[has_values] = self.__values__[positions[has_values]]
+		return res
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def rollup(self, keys: pd.DataFrame, median_mode: str = "exact") -> "Partials":
+		"""Coarser grouping built from the groups of this one - keys has one row per group of this grouping"""
+		return Partials(keys=keys, child=self, median_mode=median_mode)
+
+
+class Partials():
+	""" Grouping built from the partial aggregates (count, sum, min, max, squared deviations, median) of a finer
+	grouping. Everything but the median/percentiles can be derived exactly from the partials. The median is either:
+		exact - the values of the finer grouping (already sorted within each of its groups) are merged by the
+		        coarser group
+		approximate - count weighted median of the medians of the finer grouping (no access to the values)
+	Percentiles are always exact - they share the merged values with the exact median """
+
+	__keys__: pd.DataFrame
+	__counts__: np.ndarray
+	__sums__: np.ndarray
+	__mins__: np.ndarray
+	__maxs__: np.ndarray
+	__m2__: np.ndarray | None
+
+	# finer grouping, and the group (row of __keys__) that each of its groups belongs to
+	__child__: "Segments | Partials"
+	__codes__: np.ndarray
+
+	# "exact" | "approximate"
+	__median_mode__: str
+
+	# segments of the values - only built when the exact median is requested
+	__segments__: Segments | None
+
+	def __init__(self, keys: pd.DataFrame, child: "Segments | Partials", median_mode: str = "exact"):
+		if median_mode not in ("exact", "approximate"):
+			raise ValueError(f"Invalid median mode : {median_mode}")
+
+		self.__keys__, self.__codes__ = factorize_keys(keys, list(keys.columns))
+		self.__child__ = child
+		self.__median_mode__ = median_mode
+		self.__segments__ = None
+		self.__m2__ = None
+
+		n_groups = len(self.__keys__.index)
+		self.__counts__ = np.bincount(self.__codes__, weights=child.get_counts(), minlength=n_groups).astype("int64")
+		self.__sums__ = np.bincount(self.__codes__, weights=child.get_sums(), minlength=n_groups)
+
+		# fmin/fmax skip the NaN's of the child groups without any values
+		if n_groups > 0:
+			order = np.argsort(self.__codes__, kind="stable")
+			sizes = np.bincount(self.__codes__, minlength=n_groups)
+			starts = np.cumsum(sizes) - sizes
+			self.__mins__ = np.fmin.reduceat(child.get_mins()[order], starts)
+			self.__maxs__ = np.fmax.reduceat(child.get_maxs()[order], starts)
+		else:
+			self.__mins__ = np.zeros(0)
+			self.__maxs__ = np.zeros(0)
+
+	# Get funcs
+	# ------------------------------------------------------------------------------------------------------------------
+	def get_keys(self) -> pd.DataFrame:
+		return self.__keys__
+
+	def get_counts(self) -> np.ndarray:
+		return self.__counts__
+
+	def get_sums(self) -> np.ndarray:
+		return self.__sums__
+
+	def get_mins(self) -> np.ndarray:
+		return self.__mins__
+
+	def get_maxs(self) -> np.ndarray:
+		return self.__maxs__
+
+	def get_m2(self) -> np.ndarray:
+		"""Squared deviations of the child groups, plus their offset from the mean of the coarser group (parallel
+		variance formula)"""
+		if self.__m2__ is None:
+			child_counts = self.__child__.get_counts()
+			deviations = get_means(self.__child__.get_sums(), child_counts) - \
+				get_means(self.__sums__, self.__counts__)[self.__codes__]
+			m2 = np.where(child_counts > 0, self.__child__.get_m2() + child_counts * deviations * deviations, 0)
+			self.__m2__ = np.bincount(self.__codes__, weights=m2, minlength=len(self.__keys__.index))
+		return self.__m2__
+
+	def get_segments(self) -> Segments:
+		if self.__segments__ is None:
+			child_segments = self.__child__ if isinstance(self.__child__, Segments) else self.__child__.get_segments()
+			codes = np.repeat(self.__codes__, child_segments.get_sizes())
+			self.__segments__ = Segments(keys=self.__keys__, values=child_segments.get_values(), codes=codes,
+			                             ranks=child_segments.get_ranks())
+		return self.__segments__
+
+	def get_medians(self) -> np.ndarray:
+		if self.__median_mode__ == "exact":
+			return self.get_segments().get_medians()
+
+		return weighted_median(values=self.__child__.get_medians(), weights=self.__child__.get_counts(),
+		                       codes=self.__codes__, n_groups=len(self.__keys__.index))
+
+	def get_quantiles(self, q: float) -> np.ndarray:
+		return self.get_segments().get_quantiles(q)
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def rollup(self, keys: pd.DataFrame, median_mode: str = "exact") -> "Partials":
+		return Partials(keys=keys, child=self, median_mode=median_mode)
+
+
+def factorize_keys(df: pd.DataFrame, group_by: List[str]) -> tuple[pd.DataFrame, np.ndarray]:
+	"""Unique (sorted) combinations of the group-by columns, and the group code of each row. Rows with a missing key are
+	given the code -1 (they are dropped - same as pandas groupby)"""
+	if len(group_by) == 0:
+		return pd.DataFrame(index=[0]), np.zeros(len(df.index), dtype="int64")
+
+	codes, uniques = [], []
+	for column in group_by:
+		column_codes, column_uniques = pd.factorize(df[column], sort=True)
+		codes.append(column_codes)
+		uniques.append(column_uniques)
+
+	has_key = np.logical_and.reduce([c >= 0 for c in codes])
+	dims = [max(len(u), 1) for u in uniques]
+	combined = np.where(has_key, np.ravel_multi_index([np.maximum(c, 0) for c in codes], dims), -1)
+	group_codes, group_uniques = pd.factorize(combined, sort=True)
+
+	keep = group_uniques >= 0
+	if not keep.all():
+		# only the -1 (missing key) is dropped; since -1 sorts first, every other code shifts down by one
+		group_codes = group_codes - 1
+		group_uniques = group_uniques[keep]
+
+	keys = pd.DataFrame({column: column_uniques.take(c) for column, column_uniques, c in
+	                     zip(group_by, uniques, np.unravel_index(group_uniques, dims))})
+	return keys, group_codes
+
+
+def get_segments(df: pd.DataFrame, group_by: List[str], operation_field: str) -> Segments:
+	keys, codes = factorize_keys(df, group_by)
+	values = df[operation_field].to_numpy(dtype="float64")
+
+	has_key = codes >= 0
+	return Segments(keys=keys, values=values[has_key], codes=codes[has_key])
+
+
+def get_row_order_sums(values: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+	"""Sum of the values of each group (NaN's skipped) - pandas' groupby sum: compensated (Kahan) summation of each
+	group's values in the order of the rows. The sums and means then have the same last digits as a groupby over the
+	raw intervals, which a plain sum of the values sorted by group doesn't give"""
+	sums = pd.Series(values).groupby(codes, sort=True).sum()
+	return sums.reindex(np.arange(n_groups), fill_value=0).to_numpy(dtype="float64")
+
+
+def get_means(sums: np.ndarray, counts: np.ndarray) -> np.ndarray:
+	"""Mean of each group (NaN for the groups without any values)"""
+	with np.errstate(invalid="ignore", divide="ignore"):
+		return np.where(counts > 0, sums / counts, np.nan)
+
+
+def weighted_median(values: np.ndarray, weights: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+	"""Weighted median of the values within each group (NaN for the groups without any weight)"""
+	order = np.lexsort((values, codes))
+	values, weights, codes = values[order], weights[order], codes[order]
+
+	# cumulative weight within each group
+	cum_weights = np.cumsum(weights)
+	group_totals = np.bincount(codes, weights=weights, minlength=n_groups)
+	group_offsets = np.cumsum(group_totals) - group_totals
+	cum_weights = cum_weights - group_offsets[codes]
+
+	# first value of each group where the cumulative weight reaches half of the group's total
+	reached = (weights > 0) & (cum_weights * 2 >= group_totals[codes])
+	groups, first = np.unique(codes[reached], return_index=True)
+
+	res = np.full(n_groups, np.nan)
+	res[groups] = values[np.flatnonzero(reached)[first]]
+	return res
+
+
+# Calculation kernels - each takes a grouping (Segments or Partials) and returns one value per group
+# ----------------------------------------------------------------------------------------------------------------------
+def calculate_count(level: Segments | Partials) -> np.ndarray:
+	return level.get_counts()
+
+
+def calculate_sum(level: Segments | Partials) -> np.ndarray:
+	return level.get_sums()
+
+
+def calculate_min(level: Segments | Partials) -> np.ndarray:
+	return level.get_mins()
+
+
+def calculate_max(level: Segments | Partials) -> np.ndarray:
+	return level.get_maxs()
+
+
+def calculate_mean(level: Segments | Partials) -> np.ndarray:
+	return get_means(level.get_sums(), level.get_counts())
+
+
+def calculate_median(level: Segments | Partials) -> np.ndarray:
+	return level.get_medians()
+
+
+def calculate_std(level: Segments | Partials) -> np.ndarray:
+	"""Sample standard deviation (ddof=1, same as pandas) - NaN for the groups with less than 2 values"""
+	counts = level.get_counts()
+	with np.errstate(invalid="ignore", divide="ignore"):
+		return np.where(counts > 1, np.sqrt(level.get_m2() / (counts - 1)), np.nan)
+
+
+def calculate_percentile(level: Segments | Partials, q: float) -> np.ndarray:
+	"""q-th quantile (0 <= q <= 1) - e.g., 0.95 for the 95th percentile"""
+	return level.get_quantiles(q)
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+
+def get_results(level: Segments | Partials, calcs: dict[str, Callable]) -> pd.DataFrame:
+	"""Group-by columns followed by one column per calc ({column_name: kernel})"""
+	result = level.get_keys().copy()
+	for column_name, func in calcs.items():
+		result[column_name] = func(level)
+
+	return result
+
+
+def concat_results(results: List[pd.DataFrame]) -> pd.DataFrame:
+	"""Results of consecutive blocks of the same grouping (e.g., chunks of a stream)"""
+	if len(results) == 0:
+		return pd.DataFrame()
+
+	if len(results) == 1:
+		return results[0]
+
+	return pd.concat(results, ignore_index=True)
+
+
+def compute_rollup(df: pd.DataFrame, group_by: List[str], operation_field: str,
+                   calcs: dict[str, Callable]) -> pd.DataFrame:
+	"""Computes all the calcs ({column_name: kernel}) for the grouping in a single pass over the data"""
+	return get_results(get_segments(df=df, group_by=group_by, operation_field=operation_field), calcs)
+
+
+def format_interval_keys(df: pd.DataFrame) -> pd.DataFrame:
+	"""Turns the integer day keys (days since 1970-01-01 UTC - also the weeks, by their Monday) and month keys (months
+	since 1970-01) back into dates - only needed when writing the output"""
+	for column, days in get_interval_days(df).items():
+		df = df.assign(**{column: pd.to_datetime(days, unit="D").date})
+
+	return df
+
+
+def get_interval_days(df: pd.DataFrame) -> dict:
+	"""Days since 1970-01-01 of the integer day/week/month keys of the DataFrame - {column: np.ndarray}"""
+	days = dict()
+	for column in ["day_interval", "week_interval", "month_interval"]:
+		if column in df.columns and pd.api.types.is_integer_dtype(df[column]):
+			keys = df[column].to_numpy().astype("int64")
+			days[column] = keys if column != "month_interval" else \
+				keys.astype("datetime64[M]").astype("datetime64[D]").astype("int64")
+	return days
@@ -0,0 +1,243 @@
+# Declarative rollup plan - the interval-level groupings (15-minute, hourly, daily, weekly, monthly) and the statistics
+# computed for each of them, read from a YAML/JSON file (config.rollup_plan_path). The plan is compiled once per process
+# into the grouping config that every DataStream shares: the interval key functions, the kernel of each statistic, and
+# the grouping that each coarser grouping is derived from (so that a new interval/statistic doesn't add a pass over the
+# raw intervals)
+
+import os
+import re
+import json
+import yaml
+import numpy as np
+import pandas as pd
+from types import MappingProxyType
+from functools import partial
+from collections.abc import Callable
+from config import __root_dir__
+from modules import rollup
+
+# statistics of a plan, and their kernels - percentiles (p<N>, e.g., p95) use the "percentile" kernel
+__calcs_config__ = {
+	"max": {"func": rollup.calculate_max},
+	"min": {"func": rollup.calculate_min},
+	"mean": {"func": rollup.calculate_mean},
+	"median": {"func": rollup.calculate_median},
+	"sum": {"func": rollup.calculate_sum},
+	"count": {"func": rollup.calculate_count},
+	"std": {"func": rollup.calculate_std},
+	"percentile": {"func": rollup.calculate_percentile}
+}
+
+__percentile_pattern__ = re.compile(r"^p(\d+(?:\.\d+)?)$")
+
+# plan used when there isn't a plan file - the daily and hourly groupings
+__default_plan__ = {
+	"groupings": {
+		"day_interval": {"interval": "day",
+		                 "statistics": ["max", "min", "median", "mean", "sum"],
+		                 "output": "Output/daily_interval_data.csv"},
+		"hour_interval": {"interval": "hour",
+		                  "statistics": ["max", "min", "median", "mean", "sum"],
+		                  "output": "Output/hourly_interval_data.csv"}
+	}
+}
+
+
+class Interval():
+	""" Interval of a grouping - the integer key columns of each row (computed from the int64 epoch, the same way as
+	the daily/hourly keys), and a bucket ID that increases with time (used by the chunked intake to know which
+	buckets are complete). Intervals nest in the coarser ones they fit in, e.g., hour in day, day in week/month """
+	__interval__: str
+	__prefix__: str
+	__nests_in__: set
+
+	def __init__(self, interval: str, prefix: str, nests_in: set):
+		self.__interval__ = interval
+		self.__prefix__ = prefix
+		self.__nests_in__ = nests_in
+
+	def get_interval(self) -> str:
+		return self.__interval__
+
+	def get_prefix(self) -> str:
+		"""Prefix of the statistic columns (e.g., day -> day_max)"""
+		return self.__prefix__
+
+	def nests_in(self, other: "Interval") -> bool:
+		return other.get_interval() in self.__nests_in__
+
+	def get_keys(self, timestamps: np.ndarray) -> dict:
+		"""Key columns of each timestamp - {column: np.ndarray}"""
+		days = (timestamps // rollup.seconds_per_day).astype("int32")
+
+		if self.__interval__ == "15min":
+			return {"day_interval": days,
+			        "hour_interval": ((timestamps // rollup.seconds_per_hour) % 24).astype("int8"),
+			        "minute_interval": ((timestamps // 900) % 4 * 15).astype("int8")}
+		if self.__interval__ == "hour":
+			return {"day_interval": days, "hour_interval": ((timestamps // rollup.seconds_per_hour) % 24).astype("int8")}
+		if self.__interval__ == "day":
+			return {"day_interval": days}
+		if self.__interval__ == "week":
+			# day key of the Monday starting the week (1970-01-01 was a Thursday)
+			return {"week_interval": (days - (days + 3) % 7).astype("int32")}
+		return {"month_interval": get_months(days)}
+
+	def get_buckets(self, timestamps: np.ndarray) -> np.ndarray:
+		if self.__interval__ == "15min":
+			return timestamps // 900
+		if self.__interval__ == "hour":
+			return timestamps // rollup.seconds_per_hour
+		if self.__interval__ == "day":
+			return timestamps // rollup.seconds_per_day
+		if self.__interval__ == "week":
+			return (timestamps // rollup.seconds_per_day + 3) // 7
+		return get_months(timestamps // rollup.seconds_per_day).astype("int64")
+
+	def add_keys(self, df: pd.DataFrame, timestamps: np.ndarray | None = None) -> list[str]:
+		"""Adds the key columns to the DataFrame (from its timestamp column, or from the given timestamps - e.g., in local
+		time); returns the group-by columns"""
+		keys = self.get_keys(df["timestamp"].to_numpy() if timestamps is None else timestamps)
+		for column, values in keys.items():
+			df[column] = values
+		return list(keys)
+
+	def derive_keys(self, child_keys: pd.DataFrame) -> pd.DataFrame:
+		"""Keys of this interval for each group of a finer (nested) grouping"""
+		return pd.DataFrame(self.get_keys(get_start_timestamps(child_keys)))
+
+
+__intervals__ = {
+	"15min": Interval("15min", "quarter_hour", {"hour", "day", "week", "month"}),
+	"hour": Interval("hour", "hour", {"day", "week", "month"}),
+	"day": Interval("day", "day", {"week", "month"}),
+	"week": Interval("week", "week", set()),
+	"month": Interval("month", "month", set())
+}
+
+
+def get_months(days: np.ndarray) -> np.ndarray:
+	"""Months since 1970-01 of the day keys"""
+	return days.astype("int64").astype("datetime64[D]").astype("datetime64[M]").astype("int32")
+
+
+def get_start_timestamps(keys: pd.DataFrame) -> np.ndarray:
+	"""Epoch of the start of each group, from its key columns"""
+	if "month_interval" in keys.columns:
+		days = keys["month_interval"].to_numpy().astype("int64").astype("datetime64[M]").astype("datetime64[D]")
+		return days.astype("int64") * rollup.seconds_per_day
+	if "week_interval" in keys.columns:
+		return keys["week_interval"].to_numpy().astype("int64") * rollup.seconds_per_day
+
+	timestamps = keys["day_interval"].to_numpy().astype("int64") * rollup.seconds_per_day
+	if "hour_interval" in keys.columns:
+		timestamps = timestamps + keys["hour_interval"].to_numpy().astype("int64") * rollup.seconds_per_hour
+	if "minute_interval" in keys.columns:
+		timestamps = timestamps + keys["minute_interval"].to_numpy().astype("int64") * 60
+	return timestamps
+
+
+def get_interval(grouping_config: dict) -> Interval:
+	"""Interval of a grouping - groupings that aren't from a plan (e.g., a config with a definition callback) are daily"""
+	return __intervals__[grouping_config.get("interval", "day")]
+
+
+def get_calc(statistic: str | dict, prefix: str) -> dict:
+	"""{"column_name", "calc_type"[, "q"]} of a statistic of the plan - either a name (e.g., "max", "p95"), or
+	{"statistic": name, "column": column name}"""
+	column = None
+	if isinstance(statistic, dict):
+		column = statistic.get("column")
+		statistic = statistic.get("statistic")
+
+	if not isinstance(statistic, str):
+		raise ValueError(f"Invalid statistic : {statistic}")
+
+	percentile = __percentile_pattern__.match(statistic)
+	if percentile is not None:
+		q = float(percentile.group(1))
+		if not 0 <= q <= 100:
+			raise ValueError(f"Invalid percentile : {statistic}")
+		return {"column_name": column or f"{prefix}_{statistic.replace('.', '_')}", "calc_type": "percentile",
+		        "q": q / 100}
+
+	if statistic not in __calcs_config__ or statistic == "percentile":
+		raise ValueError(f"Invalid statistic : {statistic}")
+
+	return {"column_name": column or f"{prefix}_{statistic}", "calc_type": statistic}
+
+
+def get_kernel(calc: dict) -> Callable:
+	func = __calcs_config__[calc["calc_type"]]["func"]
+	return partial(func, q=calc["q"]) if "q" in calc else func
+
+
+def compile_plan(plan: dict) -> dict:
+	"""Grouping config of the plan - {grouping_type: {"definition": Interval, "interval", "derived_from", "calcs",
+	"program": {column_name: kernel}, "output_path"}}. Each grouping is derived from the coarsest of the other
+	groupings that nests in it (e.g., day from hour, and month from day) - the raw intervals are only grouped once
+	per chain of nested groupings"""
+	groupings = plan.get("groupings") if isinstance(plan, dict) else None
+	if not isinstance(groupings, dict) or len(groupings) == 0:
+		raise ValueError("Invalid rollup plan : no groupings")
+
+	grouping_config = dict()
+	for grouping_type, grouping in groupings.items():
+		interval = grouping.get("interval")
+		if interval not in __intervals__:
+			raise ValueError(f"Invalid interval for the grouping {grouping_type} : {interval}")
+		definition = __intervals__[interval]
+		prefix = grouping.get("prefix", definition.get_prefix())
+
+		calcs = [get_calc(statistic, prefix) for statistic in grouping.get("statistics", [])]
+		if len(calcs) == 0:
+			raise ValueError(f"Invalid rollup plan : no statistics for the grouping {grouping_type}")
+		columns = [calc["column_name"] for calc in calcs]
+		if len(set(columns)) != len(columns):
+			raise ValueError(f"Invalid rollup plan : duplicate columns for the grouping {grouping_type}")
+
+		output = grouping.get("output", f"Output/{grouping_type}_data.csv")
+		grouping_config[grouping_type] = {
+			"definition": definition,
+			"interval": interval,
+			"calcs": calcs,
+			"program": {calc["column_name"]: get_kernel(calc) for calc in calcs},
+			"output_path": output if os.path.isabs(output) else f"{__root_dir__}/{output}"
+		}
+
+	for grouping_type, gc in grouping_config.items():
+		children = [child_type for child_type, child in grouping_config.items()
+		            if child["definition"].nests_in(gc["definition"])]
+		# the coarsest of them - the one that none of the others nest in
+		children = [child_type for child_type in children if not any(
+			grouping_config[child_type]["definition"].nests_in(grouping_config[other]["definition"])
+			for other in children)]
+		if len(children) > 0:
+			gc["derived_from"] = {"grouping_type": children[0]}
+
+	return grouping_config
+
+
+def load_plan(path: str) -> dict:
+	"""Plan file - JSON (.json), or YAML"""
+	with open(path, "r") as f:
+		return json.load(f) if path.endswith(".json") else yaml.safe_load(f)
+
+
+# compiled plans, by path - every DataStream of the process shares them
+__compiled_plans__ = dict()
+
+
+def get_grouping_config(path: str | None = None) -> MappingProxyType:
+	"""Compiled grouping config of the plan at the path (the default plan when there isn't one) - compiled once, and
+	shared by every DataStream of the process. It's returned read-only (the config and each grouping's config are
+	MappingProxyType's), so that a stream can't change the config of the others"""
+	if path not in __compiled_plans__:
+		plan = load_plan(path) if path is not None and os.path.exists(path) else __default_plan__
+		__compiled_plans__[path] = MappingProxyType({grouping_type: MappingProxyType(gc)
+		                                             for grouping_type, gc in compile_plan(plan).items()})
+	return __compiled_plans__[path]
+
+
+def get_calcs_config() -> dict:
+	return __calcs_config__
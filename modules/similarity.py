@@ -0,0 +1,256 @@
+# Stream similarity (README - extra credit) - two streams are similar when their load profiles (e.g., the hourly means)
+# move together over the same time period. The profiles are spilled to disk as each stream is done (ProfileSpool), and
+# laid out as a matrix file on a shared time grid (one row per stream, one column per interval). All the pairs are then
+# compared with matrix products - one tile of block size * block size pairs at a time, with the two blocks of rows read
+# from the matrix file - so memory is bounded by the block size, and not by the number of streams
+
+import io
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+from modules import rollup
+
+__metrics__ = ["correlation", "euclidean"]
+
+
+class ProfileSpool():
+	""" Profiles of the streams (one value per interval of a grouping), spilled to a file as each stream is done - only
+	the grid of the intervals seen so far, and the offset of each stream in the spill, are held in memory. get_matrix
+	then lays the profiles out as a float32 .npy matrix (one row per stream, one column per interval), memory-mapped """
+	__path__: str
+
+	# interval keys -> column of the matrix (in the order the intervals were first seen)
+	__intervals__: pd.MultiIndex | None
+
+	# stream IDs (rows of the matrix), the row of each stream ID, and the byte offset/number of values of each row in
+	# the spill (the interval codes, then the values)
+	__stream_ids__: List[int]
+	__rows__: dict
+	__offsets__: List[int]
+	__sizes__: List[int]
+	__spill__: io.BufferedWriter | None
+
+	def __init__(self, path: str):
+		"""path - of the matrix (.npy); the profiles are spilled to path + ".partial" until get_matrix"""
+		self.__path__ = path
+		self.__intervals__ = None
+		self.__stream_ids__ = []
+		self.__rows__ = dict()
+		self.__offsets__ = []
+		self.__sizes__ = []
+		self.__spill__ = None
+
+	def __len__(self) -> int:
+		return len(self.__stream_ids__)
+
+	def get_path(self) -> str:
+		return self.__path__
+
+	def add_profile(self, stream_id: int, keys: pd.DataFrame, values: np.ndarray) -> None:
+		"""keys - the interval keys (e.g., day_interval, hour_interval) of each value; intervals without a value are
+		skipped. A stream that was already added is replaced"""
+		values = np.asarray(values, dtype="float64")
+		has_value = ~np.isnan(values)
+		keys = pd.MultiIndex.from_frame(keys[has_value])
+		values = values[has_value].astype("float32")
+
+		if self.__intervals__ is None:
+			self.__intervals__ = keys.unique()
+		else:
+			new_intervals = keys[self.__intervals__.get_indexer(keys) < 0].unique()
+			if len(new_intervals) > 0:
+				self.__intervals__ = self.__intervals__.append(new_intervals)
+		codes = self.__intervals__.get_indexer(keys).astype("int32")
+
+		if self.__spill__ is None:
+			os.makedirs(os.path.dirname(self.__path__) or ".", exist_ok=True)
+			self.__spill__ = open(f"{self.__path__}.partial", "wb")
+		offset = self.__spill__.tell()
+		self.__spill__.write(codes.tobytes())
+		self.__spill__.write(values.tobytes())
+
+		if stream_id in self.__rows__:
+			row = self.__rows__[stream_id]
+			self.__offsets__[row], self.__sizes__[row] = offset, len(codes)
+		else:
+			self.__rows__[stream_id] = len(self.__stream_ids__)
+			self.__stream_ids__.append(stream_id)
+			self.__offsets__.append(offset)
+			self.__sizes__.append(len(codes))
+
+	def get_matrix(self) -> tuple[np.ndarray, np.ndarray]:
+		"""Stream IDs, and the memory-mapped matrix of their profiles - NaN where a stream has no value for an interval.
+		The columns are in the order of the interval keys; the matrix is written one row at a time from the spill"""
+		n_streams = len(self.__stream_ids__)
+		n_intervals = len(self.__intervals__) if self.__intervals__ is not None else 0
+		if n_streams == 0 or n_intervals == 0:
+			self.close()
+			return np.asarray(self.__stream_ids__, dtype="int64"), np.full((n_streams, 0), np.nan, dtype="float32")
+
+		self.__spill__.close()
+		columns = np.empty(n_intervals, dtype="int64")
+		columns[self.__intervals__.argsort()] = np.arange(n_intervals)
+
+		matrix = np.lib.format.open_memmap(self.__path__, mode="w+", dtype="float32", shape=(n_streams, n_intervals))
+		with open(f"{self.__path__}.partial", "rb") as f:
+			for row, (offset, size) in enumerate(zip(self.__offsets__, self.__sizes__)):
+				f.seek(offset)
+				codes = np.fromfile(f, dtype="int32", count=size)
+				matrix[row] = np.nan
+				matrix[row, columns[codes]] = np.fromfile(f, dtype="float32", count=size)
+		matrix.flush()
+		os.remove(f"{self.__path__}.partial")
+
+		return np.asarray(self.__stream_ids__, dtype="int64"), matrix
+
+	def close(self) -> None:
+		"""Removes the spill - the matrix file is kept until remove"""
+		if self.__spill__ is not None:
+			self.__spill__.close()
+			self.__spill__ = None
+		if os.path.exists(f"{self.__path__}.partial"):
+			os.remove(f"{self.__path__}.partial")
+
+	def remove(self) -> None:
+		"""Removes the spill and the matrix file"""
+		self.close()
+		if os.path.exists(self.__path__):
+			os.remove(self.__path__)
+
+
+def build_matrix(interval_df: pd.DataFrame, value_column: str, key_columns: List[str],
+                 dtype: str = "float64") -> tuple[np.ndarray, np.ndarray]:
+	"""Aligns the interval-level results of all the streams on a shared time grid - returns the stream IDs, and a matrix
+	with one row per stream and one column per interval (NaN where a stream has no value for the interval)"""
+	stream_codes, stream_ids = pd.factorize(interval_df["stream_id"], sort=True)
+	_, slot_codes = rollup.factorize_keys(interval_df, key_columns)
+
+	matrix = np.full((len(stream_ids), slot_codes.max() + 1 if len(slot_codes) > 0 else 0), np.nan, dtype=dtype)
+	matrix[stream_codes, slot_codes] = interval_df[value_column].to_numpy()
+
+	return np.asarray(stream_ids), matrix
+
+
+def normalize(matrix: np.ndarray, overwrite: bool = False) -> np.ndarray:
+	"""z-score of each row over the intervals it has values for; the missing intervals are set to 0 (the row mean), so
+	they don't contribute to the products. Rows without any variation are all 0. With overwrite, the matrix is
+	normalized in place (no copy of it is made)"""
+	z = matrix if overwrite else matrix.copy()
+	with np.errstate(invalid="ignore", divide="ignore"):
+		mean = np.nanmean(z, axis=1, keepdims=True)
+		std = np.nanstd(z, axis=1, keepdims=True)
+		z -= mean
+		z /= std
+
+	z[~np.isfinite(z)] = 0
+	return z
+
+
+def get_block(matrix: np.ndarray, start: int, stop: int) -> tuple[np.ndarray, np.ndarray]:
+	"""Rows start:stop of the matrix (e.g., read from the matrix file) - z-normalized (float64), and the mask of the
+	intervals they have values for"""
+	block = np.array(matrix[start:stop], dtype="float64")
+	mask = np.isfinite(block).astype("float64")
+	return normalize(block, overwrite=True), mask
+
+
+def get_pair_scores(block_1: tuple[np.ndarray, np.ndarray], block_2: tuple[np.ndarray, np.ndarray], metric: str,
+                    min_overlap: int) -> np.ndarray:
+	"""Scores of every pair of rows of the two blocks (see get_block), over the intervals both rows have values for -
+	the pairwise counts and sums come from products of the masks and the values. Pairs that share fewer than min_overlap
+	intervals (or, for the correlation, with no variation over them) are -inf"""
+	z_1, mask_1 = block_1
+	z_2, mask_2 = block_2
+	n_intervals = z_1.shape[1]
+
+	products = z_1 @ z_2.T
+	if mask_1.all() and mask_2.all():
+		# no missing intervals - the sums are over the whole rows
+		counts = np.full(products.shape, n_intervals, dtype="float64")
+		sums_1, sums_2 = z_1.sum(axis=1)[:, None], z_2.sum(axis=1)[None, :]
+		squares_1, squares_2 = np.einsum("ij,ij->i", z_1, z_1)[:, None], np.einsum("ij,ij->i", z_2, z_2)[None, :]
+	else:
+		# the counts are exact in float32 (whole numbers up to 2 ** 24), and that product is twice as fast
+		counts = (mask_1.astype("float32") @ mask_2.T.astype("float32")).astype("float64")
+		sums_1, sums_2 = z_1 @ mask_2.T, mask_1 @ z_2.T
+		squares_1, squares_2 = (z_1 * z_1) @ mask_2.T, mask_1 @ (z_2 * z_2).T
+
+	with np.errstate(invalid="ignore", divide="ignore"):
+		if metric == "correlation":
+			# Pearson correlation over the shared intervals (z-normalizing each row first doesn't change it, and keeps
+			# the sums small)
+			covariances = products - sums_1 * sums_2 / counts
+			variances = (squares_1 - sums_1 ** 2 / counts) * (squares_2 - sums_2 ** 2 / counts)
+			scores = np.clip(covariances / np.sqrt(variances), -1, 1)
+			scores[~(variances > 0)] = -np.inf
+		else:
+			# negative distance (so that a higher score is always more similar) over the shared intervals - scaled to
+			# the whole grid, so that pairs with different overlaps are comparable
+			distances = np.maximum(squares_1 + squares_2 - 2 * products, 0) * n_intervals / counts
+			scores = -np.sqrt(distances)
+
+	scores[~(counts >= max(min_overlap, 1))] = -np.inf
+	return scores
+
+
+def top_k_similar_pairs(stream_ids: np.ndarray, matrix: np.ndarray, k: int = 1, metric: str = "correlation",
+                        block_size: int = 1024, min_overlap: int = 2) -> pd.DataFrame:
+	"""The k most similar pairs of streams (rows of the matrix - e.g., the memory-mapped matrix of a ProfileSpool); all
+	pairs are compared, block_size * block_size pairs at a time, only reading the two blocks of rows of each tile.
+	metric:
+		correlation - Pearson correlation of the profiles over the intervals both streams have values for (higher is
+		              more similar)
+		euclidean - distance between the z-normalized profiles over the same intervals (lower is more similar)
+	min_overlap - pairs that share fewer intervals aren't compared. The matrix isn't modified"""
+	if metric not in __metrics__:
+		raise ValueError(f"Invalid similarity metric : {metric}")
+
+	n_streams = matrix.shape[0]
+
+	best_scores = np.zeros(0)
+	best_pairs = np.zeros((0, 2), dtype="int64")
+
+	for start in range(0, n_streams, block_size):
+		stop = min(start + block_size, n_streams)
+		rows = get_block(matrix, start, stop)
+
+		# block of rows vs the blocks from it on - every pair is only compared once
+		for column_start in range(start, n_streams, block_size):
+			column_stop = min(column_start + block_size, n_streams)
+			columns = rows if column_start == start else get_block(matrix, column_start, column_stop)
+			scores = get_pair_scores(rows, columns, metric=metric, min_overlap=min_overlap)
+
+			# only the pairs above the diagonal (a stream isn't compared with itself)
+			if column_start == start:
+				scores[np.arange(stop - start)[:, None] >= np.arange(column_stop - column_start)[None, :]] = -np.inf
+
+			# best k pairs of the tile
+			scores = scores.ravel()
+			candidates = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+			candidates = candidates[np.isfinite(scores[candidates])]
+			pair_rows, pair_columns = np.divmod(candidates, column_stop - column_start)
+
+			# merged with the best pairs so far
+			best_scores = np.concatenate((best_scores, scores[candidates]))
+			best_pairs = np.concatenate((best_pairs, np.stack((pair_rows + start, pair_columns + column_start), axis=1)))
+			if len(best_scores) > k:
+				keep = np.argpartition(-best_scores, k - 1)[:k]
+				best_scores, best_pairs = best_scores[keep], best_pairs[keep]
+
+	order = np.lexsort((best_pairs[:, 1], best_pairs[:, 0], -best_scores))
+	best_scores, best_pairs = best_scores[order], best_pairs[order]
+
+	return pd.DataFrame({"stream_id_1": stream_ids[best_pairs[:, 0]],
+	                     "stream_id_2": stream_ids[best_pairs[:, 1]],
+	                     metric if metric == "correlation" else "distance": (best_scores if metric == "correlation"
+	                                                                          else -best_scores)})
+
+
+def find_similar_streams(interval_df: pd.DataFrame, value_column: str, key_columns: List[str], k: int = 1,
+                         metric: str = "correlation", block_size: int = 1024, min_overlap: int = 2) -> pd.DataFrame:
+	"""The k most similar pairs of streams, based on the given interval-level results (e.g., hour_mean) - the aligned
+	matrix (number of streams * number of intervals) is built in memory; see ProfileSpool for a matrix on disk"""
+	stream_ids, matrix = build_matrix(interval_df=interval_df, value_column=value_column, key_columns=key_columns)
+	return top_k_similar_pairs(stream_ids=stream_ids, matrix=matrix, k=k, metric=metric, block_size=block_size,
+	                           min_overlap=min_overlap)
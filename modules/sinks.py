@@ -0,0 +1,204 @@
+# Result sinks - persistent stores of the stream-level and interval-level results, next to the output files. The sink
+# gets the results of each stream as they are computed; every run is written as a batch (with its own batch ID)
+
+import os
+import sqlite3
+import datetime
+from abc import ABC, abstractmethod
+import pandas as pd
+from config import logger
+
+__sink_types__ = ["sqlite"]
+
+# stream-level columns - the column names of the output CSV aren't valid SQL identifiers
+__stream_level_columns__ = {"stream_id": "stream_id",
+                            "status": "status",
+                            "message": "message",
+                            "rank": "rank",
+                            "% of 0 and NaN": "pct_zero_and_nan",
+                            "% of 0": "pct_zero",
+                            "% of NaN": "pct_nan",
+                            "count of 0 and NaN": "count_zero_and_nan",
+                            "count of 0's": "count_zero",
+                            "count of NaN": "count_nan",
+                            "ignore": "ignore"}
+
+
+class ResultSink(ABC):
+	""" Interface of a result sink - a run opens a batch, writes the results of the streams as they are computed, and
+	closes the batch once all the streams are done """
+
+	@abstractmethod
+	def get_batch_id(self) -> int | None:
+		...
+
+	@abstractmethod
+	def write_interval_level_results(self, interval_level_res: dict) -> None:
+		"""interval_level_res is keyed by the grouping type - {grouping_type: {"df": pd.DataFrame, "output_path": str}}"""
+
+	@abstractmethod
+	def write_stream_level_results(self, stream_df: pd.DataFrame) -> None:
+		...
+
+	@abstractmethod
+	def write_stream_ranks(self, ranks: dict) -> None:
+		"""ranks - {stream_id: rank} of the stream-level results written so far (e.g., as each stream was done)"""
+
+	@abstractmethod
+	def close(self, status: str = "complete") -> None:
+		...
+
+
+class SqliteSink(ResultSink):
+	""" SQLite store - one table for the stream-level results, one per grouping type for the interval-level results
+	(day keys as days since 1970-01-01 UTC, the same integer keys as the rollups), and a batches table. Rows are
+	buffered, and inserted batch_size at a time with executemany inside a transaction. The interval tables are indexed
+	on (stream_id, <interval keys>, batch_id). A column that the table of an earlier run doesn't have (e.g., a statistic
+	added to the rollup plan) is added to it - NULL for the earlier batches """
+	__path__: str
+	__batch_size__: int
+	__connection__: sqlite3.Connection | None
+	__batch_id__: int | None
+
+	# {table: {"columns": [column, ...], "rows": [tuple, ...]}}
+	__buffers__: dict
+
+	def __init__(self, path: str, batch_size: int = 50000):
+		self.__path__ = path
+		self.__batch_size__ = batch_size
+		self.__connection__ = None
+		self.__batch_id__ = None
+		self.__buffers__ = dict()
+
+	# Get funcs
+	# ------------------------------------------------------------------------------------------------------------------
+	def get_path(self) -> str:
+		return self.__path__
+
+	def get_batch_id(self) -> int | None:
+		return self.__batch_id__
+
+	def get_connection(self) -> sqlite3.Connection:
+		if self.__connection__ is None:
+			self.open()
+		return self.__connection__
+
+	# ------------------------------------------------------------------------------------------------------------------
+
+	def open(self) -> None:
+		"""Connects to the database, and starts a new batch"""
+		os.makedirs(os.path.dirname(self.__path__) or ".", exist_ok=True)
+		self.__connection__ = connect(self.__path__)
+
+		with self.__connection__:
+			self.__connection__.execute("CREATE TABLE IF NOT EXISTS batches (batch_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+			                            "started_at TEXT, finished_at TEXT, status TEXT)")
+			cursor = self.__connection__.execute("INSERT INTO batches (started_at, status) VALUES (?, 'running')",
+			                                     (datetime.datetime.now().isoformat(timespec="seconds"),))
+			self.__batch_id__ = cursor.lastrowid
+
+		logger.info(f"Writing the results to '{self.__path__}' as batch {self.__batch_id__}")
+
+	def write_interval_level_results(self, interval_level_res: dict) -> None:
+		for grouping_type, res in interval_level_res.items():
+			self.write_rows(table=grouping_type, df=res["df"],
+			                keys=["stream_id"] + [c for c in res["df"].columns if c.endswith("_interval")])
+
+	def write_stream_level_results(self, stream_df: pd.DataFrame) -> None:
+		df = stream_df.rename(columns=__stream_level_columns__)
+		df["ignore"] = df["ignore"].astype("int8")
+		self.write_rows(table="stream_level", df=df, keys=["stream_id"])
+
+	def write_stream_ranks(self, ranks: dict) -> None:
+		if "stream_level" not in self.__buffers__:
+			return
+
+		self.flush("stream_level")
+		with self.get_connection() as connection:
+			connection.executemany('UPDATE "stream_level" SET "rank" = ? WHERE batch_id = ? AND stream_id = ?',
+			                       [(float(rank), self.__batch_id__, stream_id) for stream_id, rank in ranks.items()])
+
+	def write_rows(self, table: str, df: pd.DataFrame, keys: list[str]) -> None:
+		if table not in self.__buffers__:
+			self.create_table(table, df, keys)
+			self.__buffers__[table] = {"columns": df.columns.tolist(), "rows": []}
+
+		buffer = self.__buffers__[table]
+		# tolist gives python scalars (sqlite3 can't bind numpy types), and NaN's are stored as NULL's
+		buffer["rows"].extend(zip([self.__batch_id__] * len(df.index), *[df[c].tolist() for c in buffer["columns"]]))
+
+		if len(buffer["rows"]) >= self.__batch_size__:
+			self.flush(table)
+
+	def create_table(self, table: str, df: pd.DataFrame, keys: list[str]) -> None:
+		"""Creates the table if it doesn't exist yet - otherwise, adds the columns of df that it's missing"""
+		columns = ", ".join(f'"{column}" {get_sql_type(df[column])}' for column in df.columns)
+		index_columns = ", ".join(f'"{column}"' for column in keys + ["batch_id"])
+
+		with self.get_connection() as connection:
+			connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (batch_id INTEGER NOT NULL, {columns})')
+
+			existing = {row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')}
+			for column in df.columns:
+				if column not in existing:
+					logger.info(f"Adding the column '{column}' to the table '{table}' of '{self.__path__}'")
+					connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {get_sql_type(df[column])}')
+
+			connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_keys" ON "{table}" ({index_columns})')
+
+	def flush(self, table: str | None = None) -> None:
+		"""Inserts the buffered rows (of one table, or of all of them) in a single transaction"""
+		for name, buffer in self.__buffers__.items():
+			if (table is not None and name != table) or len(buffer["rows"]) == 0:
+				continue
+
+			columns = ", ".join(["batch_id"] + [f'"{column}"' for column in buffer["columns"]])
+			placeholders = ", ".join(["?"] * (len(buffer["columns"]) + 1))
+			with self.get_connection() as connection:
+				connection.executemany(f'INSERT INTO "{name}" ({columns}) VALUES ({placeholders})', buffer["rows"])
+			buffer["rows"] = []
+
+	def close(self, status: str = "complete") -> None:
+		"""Writes what's left, and marks the batch as complete (or with the given status)"""
+		if self.__connection__ is None:
+			return
+
+		self.flush()
+		with self.__connection__:
+			self.__connection__.execute("UPDATE batches SET finished_at = ?, status = ? WHERE batch_id = ?",
+			                            (datetime.datetime.now().isoformat(timespec="seconds"), status,
+			                             self.__batch_id__))
+		self.__connection__.close()
+		self.__connection__ = None
+
+
+def connect(path: str) -> sqlite3.Connection:
+	connection = sqlite3.connect(path)
+	# WAL - readers (e.g., the query API) aren't blocked by a run that's writing
+	connection.execute("PRAGMA journal_mode=WAL")
+	connection.execute("PRAGMA synchronous=NORMAL")
+	return connection
+
+
+def get_sql_type(column: pd.Series) -> str:
+	if pd.api.types.is_bool_dtype(column) or pd.api.types.is_integer_dtype(column):
+		return "INTEGER"
+	if pd.api.types.is_float_dtype(column):
+		return "REAL"
+	return "TEXT"
+
+
+def get_latest_batch_id(connection: sqlite3.Connection) -> int | None:
+	"""ID of the last complete batch (None when there isn't one)"""
+	try:
+		row = connection.execute("SELECT MAX(batch_id) FROM batches WHERE status = 'complete'").fetchone()
+	except sqlite3.OperationalError:
+		return None
+	return row[0]
+
+
+def get_result_sink(sink_type: str, path: str, batch_size: int = 50000) -> ResultSink:
+	if sink_type not in __sink_types__:
+		raise ValueError(f"Invalid result sink : {sink_type}")
+
+	return SqliteSink(path=path, batch_size=batch_size)
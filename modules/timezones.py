@@ -0,0 +1,128 @@
+# Site-local time - the UTC offset of each stream's site (TIME_ZONE of the site metadata, all_sites.csv), so that the
+# rollups can bucket the intervals by local hour/day/week/month, DST included. The offsets of a site are computed once,
+# as the table of its time zone's transitions, and the timestamps are looked up in it with a binary search - there is no
+# per-row time zone conversion
+
+import numpy as np
+import pandas as pd
+from config import logger
+from modules import rollup
+
+# resolution of the transitions - every offset change of the time zones in the data set happens on a quarter hour
+__transition_step__ = "15min"
+
+
+class OffsetTable():
+	""" UTC offsets (seconds) of a time zone, from first_year to last_year (included) - the offset of each transition,
+	starting with the offset at the start of first_year. A fixed offset is a table with a single transition """
+	__time_zone__: str | None
+	__first_year__: int
+	__last_year__: int
+	__transitions__: np.ndarray
+	__offsets__: np.ndarray
+
+	def __init__(self, time_zone: str | None, first_year: int, last_year: int, fixed_offset: int = 0):
+		self.__time_zone__ = time_zone
+		self.__first_year__ = first_year
+		self.__last_year__ = last_year
+
+		if time_zone is None:
+			self.__transitions__ = np.zeros(1, dtype="int64")
+			self.__offsets__ = np.array([fixed_offset], dtype="int64")
+			return
+
+		times = pd.date_range(f"{first_year}-01-01", f"{last_year + 1}-01-01", freq=__transition_step__, tz="UTC")[:-1]
+		offsets = (times.tz_convert(time_zone).tz_localize(None) - times.tz_localize(None)).asi8 // 10 ** 9
+		is_transition = np.concatenate([[True], offsets[1:] != offsets[:-1]])
+
+		self.__transitions__ = times.asi8[is_transition] // 10 ** 9
+		self.__offsets__ = offsets[is_transition]
+
+	def get_time_zone(self) -> str | None:
+		return self.__time_zone__
+
+	def get_years(self) -> tuple[int, int]:
+		return self.__first_year__, self.__last_year__
+
+	def covers(self, first_year: int, last_year: int) -> bool:
+		return self.__time_zone__ is None or (self.__first_year__ <= first_year and last_year <= self.__last_year__)
+
+	def get_offsets(self, timestamps: np.ndarray) -> np.ndarray:
+		"""UTC offset (seconds) of each timestamp"""
+		positions = np.searchsorted(self.__transitions__, timestamps, side="right") - 1
+		return self.__offsets__[np.maximum(positions, 0)]
+
+
+# site metadata, by path - {site_id: {"time_zone": str | None, "tz_offset": int (seconds) | None}}
+__sites__ = dict()
+
+# offset table of each site - built on its first lookup, and rebuilt (wider) when a lookup is outside of its years
+__offset_tables__ = dict()
+
+
+def parse_tz_offset(tz_offset: str) -> int | None:
+	"""Seconds of a "[+-]HH:MM" offset"""
+	try:
+		sign = -1 if tz_offset.strip().startswith("-") else 1
+		hours, minutes = tz_offset.strip().lstrip("+-").split(":")
+		return sign * (int(hours) * rollup.seconds_per_hour + int(minutes) * 60)
+	except (AttributeError, ValueError):
+		return None
+
+
+def load_sites(path: str) -> dict:
+	"""Time zone (and fixed offset) of each site of the metadata file - read once"""
+	if path not in __sites__:
+		try:
+			meta = pd.read_csv(path, usecols=["SITE_ID", "TIME_ZONE", "TZ_OFFSET"], dtype={"SITE_ID": "int64"})
+		except (OSError, ValueError) as err:
+			logger.warning(f"Couldn't read the site metadata '{path}' - the rollups stay in UTC : {repr(err)}")
+			meta = pd.DataFrame({"SITE_ID": [], "TIME_ZONE": [], "TZ_OFFSET": []})
+
+		__sites__[path] = {int(site_id): {"time_zone": time_zone if isinstance(time_zone, str) else None,
+		                                  "tz_offset": parse_tz_offset(tz_offset)}
+		                   for site_id, time_zone, tz_offset in zip(meta["SITE_ID"], meta["TIME_ZONE"], meta["TZ_OFFSET"])}
+	return __sites__[path]
+
+
+def get_offset_table(site_id: int, path: str, first_year: int, last_year: int) -> OffsetTable:
+	"""Offset table of the site, covering the years - cached. Sites with an unknown time zone use their fixed TZ_OFFSET,
+	and sites that aren't in the metadata stay in UTC"""
+	table = __offset_tables__.get((path, site_id))
+	if table is not None and table.covers(first_year, last_year):
+		return table
+
+	site = load_sites(path).get(site_id)
+	if site is None:
+		logger.warning(f"Stream(ID): {site_id} isn't in the site metadata - its rollups stay in UTC")
+		table = OffsetTable(None, first_year, last_year)
+	elif site["time_zone"] is not None:
+		if table is not None:
+			first_year, last_year = min(first_year, table.get_years()[0]), max(last_year, table.get_years()[1])
+		try:
+			table = OffsetTable(site["time_zone"], first_year, last_year)
+		except (KeyError, ValueError) as err:
+			logger.warning(f"Invalid time zone for the site {site_id} - using its fixed offset : {repr(err)}")
+			table = OffsetTable(None, first_year, last_year, fixed_offset=site["tz_offset"] or 0)
+	else:
+		table = OffsetTable(None, first_year, last_year, fixed_offset=site["tz_offset"] or 0)
+
+	__offset_tables__[(path, site_id)] = table
+	return table
+
+
+def get_years(timestamps: np.ndarray) -> tuple[int, int]:
+	"""First and last (UTC) year of the timestamps, with a year of margin on both sides (the next chunks of a stream are
+	then still covered by its table)"""
+	years = np.array([timestamps.min(), timestamps.max()]).astype("datetime64[s]").astype("datetime64[Y]").astype(int)
+	return int(years[0]) + 1970 - 1, int(years[1]) + 1970 + 1
+
+
+def get_local_timestamps(site_id: int, timestamps: np.ndarray, path: str) -> np.ndarray:
+	"""Timestamps shifted to the local (wall clock) time of the site - the interval keys computed from them are the
+	local hours/days"""
+	if len(timestamps) == 0:
+		return timestamps
+
+	table = get_offset_table(site_id, path, *get_years(timestamps))
+	return timestamps + table.get_offsets(timestamps)
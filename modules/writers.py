@@ -0,0 +1,256 @@
+# Streaming output writers - the interval-level results of each stream are appended to the output file as soon as they
+# are ready, instead of being concatenated and written once all the streams are done; memory doesn't grow with the
+# number of streams
+
+import os
+import csv
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from modules import rollup
+
+# optional dependency - only needed for the parquet variant of the columnar format
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
+
+__formats__ = ["csv", "columnar"]
+
+# stream-level columns that are NaN for the streams that weren't processed - written as floats for every stream, as in
+# the concatenated results
+__stream_level_float_columns__ = ["rank", "% of 0 and NaN", "% of 0", "% of NaN", "count of 0 and NaN", "count of 0's",
+                                  "count of NaN"]
+
+
+class CsvWriter():
+	""" Appends DataFrames (with the same columns) to a CSV file - the output is the same as the one of writing the
+	concatenated frames at once. The file is truncated on the first write """
+	__path__: str
+	__file__: object | None
+	__rows__: int
+
+	def __init__(self, path: str):
+		self.__path__ = path
+		self.__file__ = None
+		self.__rows__ = 0
+
+	def get_path(self) -> str:
+		return self.__path__
+
+	def get_rows(self) -> int:
+		return self.__rows__
+
+	def write(self, df: pd.DataFrame) -> None:
+		header = self.__file__ is None
+		if header:
+			os.makedirs(os.path.dirname(self.__path__) or ".", exist_ok=True)
+			self.__file__ = open(self.__path__, "w", newline="")
+
+		rollup.format_interval_keys(df).to_csv(self.__file__, header=header, index=False)
+		self.__rows__ += len(df.index)
+
+	def close(self) -> None:
+		if self.__file__ is not None:
+			self.__file__.close()
+			self.__file__ = None
+
+
+class ColumnarWriter():
+	""" Binary columnar output, written in row groups - the frames are buffered until there are row_group_size rows,
+	so memory is bounded by the row group size. Written as parquet when pyarrow is installed; otherwise as a directory
+	with one sub-directory per row group (one .npy per column), and a meta.json with the columns and the row groups.
+	The day keys are stored as dates (datetime64) """
+	__path__: str
+	__row_group_size__: int
+	__parquet__: bool
+
+	# frames of the row group being filled, and its number of rows
+	__buffer__: list
+	__buffered_rows__: int
+
+	__rows__: int
+	__row_groups__: list
+	__columns__: list | None
+	__parquet_writer__: object | None
+
+	def __init__(self, path: str, row_group_size: int = 2 ** 20):
+		self.__parquet__ = pyarrow is not None
+		self.__path__ = get_columnar_path(path)
+		self.__row_group_size__ = row_group_size
+		self.__buffer__ = []
+		self.__buffered_rows__ = 0
+		self.__rows__ = 0
+		self.__row_groups__ = []
+		self.__columns__ = None
+		self.__parquet_writer__ = None
+
+	def get_path(self) -> str:
+		return self.__path__
+
+	def get_rows(self) -> int:
+		return self.__rows__
+
+	def get_row_groups(self) -> list:
+		"""number of rows of each row group written so far"""
+		return self.__row_groups__
+
+	def write(self, df: pd.DataFrame) -> None:
+		self.__buffer__.append(df)
+		self.__buffered_rows__ += len(df.index)
+		self.__rows__ += len(df.index)
+
+		if self.__buffered_rows__ >= self.__row_group_size__:
+			self.flush()
+
+	def flush(self) -> None:
+		"""Writes the buffered frames as a row group"""
+		if self.__buffered_rows__ == 0:
+			return
+
+		df = get_columnar_frame(pd.concat(self.__buffer__, ignore_index=True))
+		self.__buffer__, self.__buffered_rows__ = [], 0
+
+		if self.__columns__ is None:
+			# first row group - anything left from a previous run is replaced
+			self.__columns__ = df.columns.tolist()
+			remove_output(self.__path__)
+			os.makedirs(self.__path__ if not self.__parquet__ else os.path.dirname(self.__path__) or ".", exist_ok=True)
+
+		if self.__parquet__:
+			table = pyarrow.Table.from_pandas(df, preserve_index=False)
+			if self.__parquet_writer__ is None:
+				self.__parquet_writer__ = pyarrow.parquet.ParquetWriter(self.__path__, table.schema)
+			self.__parquet_writer__.write_table(table, row_group_size=len(df.index))
+		else:
+			row_group_path = f"{self.__path__}{len(self.__row_groups__)}/"
+			os.makedirs(row_group_path, exist_ok=True)
+			for i, column in enumerate(self.__columns__):
+				np.save(f"{row_group_path}{i}.npy", df[column].to_numpy(), allow_pickle=False)
+
+		self.__row_groups__.append(len(df.index))
+		if not self.__parquet__:
+			self.write_meta()
+
+	def write_meta(self) -> None:
+		# meta.json is written after each row group - a reader never sees a row group that isn't complete
+		with open(f"{self.__path__}meta.json.tmp", "w") as f:
+			json.dump({"columns": self.__columns__, "row_groups": self.__row_groups__}, f)
+		os.replace(f"{self.__path__}meta.json.tmp", f"{self.__path__}meta.json")
+
+	def close(self) -> None:
+		self.flush()
+		if self.__parquet_writer__ is not None:
+			self.__parquet_writer__.close()
+			self.__parquet_writer__ = None
+
+
+class StreamLevelWriter():
+	""" Stream-level results - appended to a spool file next to the output as each stream is done, since the ranks are
+	only known once all the streams are. close(ranks) writes the output: the spooled rows, one line at a time, with the
+	rank of the ranked streams filled in - so memory is bounded by the ranks, and not by the number of streams """
+	__path__: str
+	__spool__: CsvWriter
+
+	def __init__(self, path: str):
+		self.__path__ = path
+		self.__spool__ = CsvWriter(f"{path}.partial")
+
+	def get_path(self) -> str:
+		return self.__path__
+
+	def get_rows(self) -> int:
+		return self.__spool__.get_rows()
+
+	def write(self, df: pd.DataFrame) -> None:
+		self.__spool__.write(df.astype({column: "float64" for column in __stream_level_float_columns__
+		                                if column in df.columns}))
+
+	def close(self, ranks: dict) -> None:
+		"""ranks - {stream_id: rank} (the streams that aren't in it have no rank)"""
+		self.__spool__.close()
+		spool_path = self.__spool__.get_path()
+		if not os.path.exists(spool_path):
+			return
+
+		# the same CSV dialect as DataFrame.to_csv
+		with open(spool_path, "r", newline="") as spool, open(self.__path__, "w", newline="") as f:
+			reader, writer = csv.reader(spool), csv.writer(f, lineterminator=os.linesep)
+			header = next(reader)
+			writer.writerow(header)
+			id_column, rank_column = header.index("stream_id"), header.index("rank")
+
+			for row in reader:
+				rank = ranks.get(int(row[id_column]))
+				row[rank_column] = "" if rank is None else repr(float(rank))
+				writer.writerow(row)
+		os.remove(spool_path)
+
+
+def get_columnar_path(path: str) -> str:
+	"""Output path of the columnar format - the .csv extension of the configured path is replaced"""
+	base = os.path.splitext(path)[0]
+	return f"{base}.parquet" if pyarrow is not None else f"{base}.columnar/"
+
+
+def get_columnar_frame(df: pd.DataFrame) -> pd.DataFrame:
+	"""The integer day/week/month keys as dates"""
+	for column, days in rollup.get_interval_days(df).items():
+		df = df.assign(**{column: days.astype("datetime64[D]")})
+	return df
+
+
+def remove_output(path: str) -> None:
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	elif os.path.exists(path):
+		os.remove(path)
+
+
+def iter_columnar(path: str, columns: list | None = None):
+	"""Yields the row groups of a columnar output (written by ColumnarWriter) as DataFrames"""
+	if not os.path.isdir(path):
+		parquet_file = pyarrow.parquet.ParquetFile(path)
+		for i in range(parquet_file.num_row_groups):
+			yield parquet_file.read_row_group(i, columns=columns).to_pandas()
+		return
+
+	with open(f"{path}meta.json", "r") as f:
+		meta = json.load(f)
+
+	columns = meta["columns"] if columns is None else columns
+	for row_group in range(len(meta["row_groups"])):
+		yield pd.DataFrame({column: np.load(f"{path}{row_group}/{meta['columns'].index(column)}.npy",
+		                                    allow_pickle=False) for column in columns})
+
+
+def read_columnar(path: str, columns: list | None = None) -> pd.DataFrame:
+	frames = list(iter_columnar(path, columns=columns))
+	return pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame(columns=columns)
+
+
+def get_writer(path: str, output_format: str = "csv", row_group_size: int = 2 ** 20) -> CsvWriter | ColumnarWriter:
+	if output_format not in __formats__:
+		raise ValueError(f"Invalid output format : {output_format}")
+
+	if output_format == "columnar":
+		return ColumnarWriter(path, row_group_size=row_group_size)
+	return CsvWriter(path)
+
+
+def write_interval_level_results(writers: dict, interval_level_res: dict, output_format: str = "csv",
+                                 row_group_size: int = 2 ** 20) -> None:
+	"""Appends the interval-level results of a stream to the writer of each grouping type (created on first use) -
+	interval_level_res is keyed by the grouping type - {grouping_type: {"df": pd.DataFrame, "output_path": str}}"""
+	for grouping_type, res in interval_level_res.items():
+		if grouping_type not in writers:
+			writers[grouping_type] = get_writer(res["output_path"], output_format=output_format,
+			                                    row_group_size=row_group_size)
+		writers[grouping_type].write(res["df"])
+
+
+def close_writers(writers: dict) -> None:
+	for writer in writers.values():
+		writer.close()
@@ -353,6 +353,36 @@ def test_calculate_interval_level_data(global_vars):
 				}
 			},
 			"expected_result": np.array([50.9609333333, 42.6859, 39.7368])
+		},
+
+		# Sums
+		{
+			"id": 9,
+			"desc": "This is a test of the sum function for the daily grouping",
+			"config": {
+				"interval": {
+					"definition": ds.generate_daily_grouping,
+					"calcs": [
+						{"column_name": "daily_sum", "calc_type": "sum"}
+					],
+					"output_path": "doesnt matter...."
+				}
+			},
+			"expected_result": np.array([238.2546, 119.2104])
+		},
+		{
+			"id": 10,
+			"desc": "This is a test of the sum function for the hourly grouping",
+			"config": {
+				"interval": {
+					"definition": ds.generate_hourly_grouping,
+					"calcs": [
+						{"column_name": "hourly_sum", "calc_type": "sum"}
+					],
+					"output_path": "doesnt matter...."
+				}
+			},
+			"expected_result": np.array([152.8828, 85.3718, 119.2104])
 		}
 	]
 
@@ -378,3 +408,191 @@ def test_calculate_interval_level_data(global_vars):
 		print(expected_result)
 
 		assert np.array_equal(result, expected_result) == True
+
+
+__rollup_test_files__ = [("csv_local_test/718.csv", 718), ("csv_local_test/1.csv", 1), ("csv_local_test/2.csv", 2),
+                         ("calculate_interval_level_data_test/1.csv", 1), ("get_data_stream_test/2.csv", 2)] + \
+                        [(f"calculate_stream_level_data_test/{i}.csv", i) for i in range(2, 7)]
+
+
+@pytest.mark.parametrize("file, stream_id", __rollup_test_files__, ids=[file for file, _ in __rollup_test_files__])
+def test_hierarchical_rollup_matches_flat(global_vars, monkeypatch, file, stream_id):
+	"""Flat rollups are the same - to the last digit - as a groupby of the raw intervals; the daily rollups built from
+	the hourly partials (hierarchical) have the same keys and order statistics, and the same sums/means up to rounding"""
+	path = f"{global_vars['path']}{file}"
+
+	def get_results(mode):
+		monkeypatch.setattr(DataStream, "rollup_mode", mode)
+		ds = DataStream.get_data_stream(stream_id=stream_id, file_path=path,
+		                                valid_column_names=global_vars["valid_column_names"])
+		grouping_config = ds.get_grouping_config()
+		results = {grouping_type: ds.get_interval_level_results(grouping_type, grouping_config[grouping_type])
+		           for grouping_type in ["hour_interval", "day_interval"]}
+		return ds.get_df(), results
+
+	df, flat = get_results("flat")
+	_, hierarchical = get_results("hierarchical")
+
+	for grouping_type, group_by, prefix in [("hour_interval", ["day_interval", "hour_interval"], "hour"),
+	                                        ("day_interval", ["day_interval"], "day")]:
+		expected = df.groupby(group_by)["value"].agg(["mean", "sum"]).reset_index()
+		assert flat[grouping_type][group_by].equals(expected[group_by]) == True
+		assert np.array_equal(flat[grouping_type][f"{prefix}_mean"].values, expected["mean"].values, equal_nan=True) == True
+		assert np.array_equal(flat[grouping_type][f"{prefix}_sum"].values, expected["sum"].values, equal_nan=True) == True
+
+		assert flat[grouping_type].columns.tolist() == hierarchical[grouping_type].columns.tolist()
+		assert flat[grouping_type][group_by].equals(hierarchical[grouping_type][group_by]) == True
+		for column in [f"{prefix}_max", f"{prefix}_min", f"{prefix}_median"]:
+			assert np.array_equal(flat[grouping_type][column].values, hierarchical[grouping_type][column].values,
+			                      equal_nan=True) == True
+		for column in [f"{prefix}_mean", f"{prefix}_sum"]:
+			assert np.allclose(flat[grouping_type][column].values, hierarchical[grouping_type][column].values,
+			                   equal_nan=True) == True
+
+
+def test_interval_keys_from_epoch(global_vars):
+	"""The interval keys are compact integers computed from the timestamp column"""
+	path = f"{global_vars['path']}calculate_interval_level_data_test/1.csv"
+	ds = DataStream.get_data_stream(stream_id=1, file_path=path, valid_column_names=global_vars["valid_column_names"])
+
+	ds.generate_hourly_grouping()
+	df = ds.get_df()
+
+	assert df["day_interval"].dtype == "int32"
+	assert df["hour_interval"].dtype == "int8"
+	assert ds.get_group_by() == ["day_interval", "hour_interval"]
+
+	expected = pd.to_datetime(df["dttm_utc"])
+	assert (pd.to_datetime(df["day_interval"].astype("int64"), unit="D").dt.date == expected.dt.date).all() == True
+	assert (df["hour_interval"] == expected.dt.hour).all() == True
+
+
+def get_results_by_intake(file_path: str, stream_id: int, valid_column_names: list, chunk_size: int | None,
+                          typed: bool = False, downcast: bool = False):
+	"""stream-level and interval-level results using the in-memory (chunk_size=None), typed or chunked intake"""
+	ds = DataStream.DataStream(stream_id, valid_column_names)
+	if typed:
+		ds.read_csv_data_typed(file=file_path, downcast=downcast)
+	elif chunk_size is None:
+		ds.read_csv_data(file=file_path)
+	else:
+		ds.read_csv_data_chunked(file=file_path, chunk_size=chunk_size)
+
+	stream_level_res = ds.get_stream_level_results()
+	interval_level_res = dict()
+	if ds.is_valid_stream():
+		for grouping_type, grouping_config in ds.get_grouping_config().items():
+			interval_level_res[grouping_type] = ds.get_interval_level_results(grouping_type, grouping_config)
+
+	return stream_level_res, interval_level_res
+
+
+def assert_same_results(res, expected):
+	assert res[0].drop("message", axis=1).equals(expected[0].drop("message", axis=1)) == True
+	assert res[1].keys() == expected[1].keys()
+
+	for grouping_type, df in expected[1].items():
+		assert res[1][grouping_type].columns.tolist() == df.columns.tolist()
+		assert len(res[1][grouping_type].index) == len(df.index)
+		for column in df.columns:
+			assert np.allclose(res[1][grouping_type][column].values.astype("float64"),
+			                   df[column].values.astype("float64"), equal_nan=True) == True
+
+
+__chunked_test_files__ = [("csv_local_test/718.csv", 718), ("calculate_interval_level_data_test/1.csv", 1),
+                           ("read_csv_data_chunked_test/9.csv", 9)] + \
+                          [(f"calculate_stream_level_data_test/{i}.csv", i) for i in range(2, 9)]
+
+
+@pytest.mark.parametrize("file, stream_id", __chunked_test_files__, ids=[file for file, _ in __chunked_test_files__])
+def test_read_csv_data_chunked(global_vars, file, stream_id):
+	"""The chunked intake should give the same results as the in-memory one - regardless of the chunk size"""
+	file_path = f"{global_vars['path']}{file}"
+	expected = get_results_by_intake(file_path, stream_id, global_vars["valid_column_names"], None)
+
+	for chunk_size in [1, 7, 50, 100000]:
+		res = get_results_by_intake(file_path, stream_id, global_vars["valid_column_names"], chunk_size)
+		assert_same_results(res, expected)
+
+
+def test_read_csv_data_chunked_memory(global_vars):
+	"""The full file shouldn't be kept in memory after a chunked intake"""
+	ds = DataStream.DataStream(718, global_vars["valid_column_names"])
+
+	assert ds.read_csv_data_chunked(file=f"{global_vars['path']}csv_local_test/718.csv", chunk_size=50) == True
+	assert ds.get_total_intervals() == 575
+	assert len(ds.get_df().index) == 0
+
+
+def test_read_csv_data_chunked_column_dtypes(global_vars, tmp_path):
+	"""The chunked intake rejects the same files as the in-memory one - "estimated"/"anomaly" included"""
+	path = f"{tmp_path}/10.csv"
+	with open(path, "w") as f:
+		f.write("timestamp,dttm_utc,value,estimated,anomaly\n"
+		        "1325466900,2012-01-02 01:15:00,41.2875,abc,\n"
+		        "1325467200,2012-01-02 01:20:00,50.9794,0,\n")
+
+	assert DataStream.DataStream(10, global_vars["valid_column_names"]).read_csv_data(file=path) == False
+	ds = DataStream.DataStream(10, global_vars["valid_column_names"])
+	assert ds.read_csv_data_chunked(file=path, chunk_size=7) == False
+	assert ds.get_file_intake_error() is not None
+
+
+def test_read_csv_data_chunked_unsorted_end(global_vars, tmp_path):
+	"""The in-memory fallback for an unsorted file only reads the rows before end, like the chunked intake"""
+	path = f"{tmp_path}/11.csv"
+	rows = ["timestamp,dttm_utc,value,estimated,anomaly\n",
+	        "1325466900,2012-01-02 01:15:00,41.2875,0,\n",
+	        "1325553300,2012-01-03 01:15:00,50.9794,0,\n",
+	        "1325467200,2012-01-02 01:20:00,12.5,0,\n"]
+	with open(path, "w") as f:
+		f.write("".join(rows) + "1325553600,2012-01-03 01:20")
+	end = len("".join(rows).encode())
+
+	ds = DataStream.DataStream(11, global_vars["valid_column_names"])
+	assert ds.read_csv_data_chunked(file=path, chunk_size=1, end=end) == True
+	assert ds.get_total_intervals() == 3
+	assert ds.get_df()["timestamp"].tolist() == [1325466900, 1325553300, 1325467200]
+
+
+__typed_test_files__ = [("csv_local_test/718.csv", 718), ("calculate_interval_level_data_test/1.csv", 1)] + \
+                        [(f"calculate_stream_level_data_test/{i}.csv", i) for i in range(2, 9)]
+
+
+@pytest.mark.parametrize("file, stream_id", __typed_test_files__, ids=[file for file, _ in __typed_test_files__])
+def test_read_csv_data_typed(global_vars, file, stream_id):
+	"""The typed intake should give the same results as the in-memory one"""
+	file_path = f"{global_vars['path']}{file}"
+	expected = get_results_by_intake(file_path, stream_id, global_vars["valid_column_names"], None)
+
+	for downcast in [False, True]:
+		res = get_results_by_intake(file_path, stream_id, global_vars["valid_column_names"], None, typed=True,
+		                            downcast=downcast)
+		assert_same_results(res, expected)
+
+
+def test_read_csv_data_typed_columns(global_vars):
+	"""No stream_id/dttm_utc columns, and the dtypes come straight from the reader"""
+	path = f"{global_vars['path']}get_data_stream_test/2.csv"
+	ds = DataStream.DataStream(2, global_vars["valid_column_names"])
+
+	assert ds.read_csv_data_typed(file=path, downcast=True) == True
+	df = ds.get_df()
+
+	assert df.columns.tolist() == ["timestamp", "value", "estimated", "anomaly"]
+	assert df.dtypes.astype(str).tolist() == ["int64", "float64", "int8", "float32"]
+	assert ds.get_stream_id() == 2
+	assert df["value"].tolist() == [7.2386, 6.6226, 6.9306, 7.0846]
+
+
+def test_classify_values():
+	values = np.array([0, 1, np.nan, 2.5, -0.0, 1, np.nan, np.nan, 0.5])
+
+	expected = {"zero": 2, "nan": 3, "one": 2, "total": 9}
+	assert DataStream.classify_values(values) == expected
+
+	# same counts regardless of the block size (i.e., the counts of chunks can be added up)
+	for block_size in [1, 2, 4, 100]:
+		assert DataStream.classify_values(values, block_size=block_size) == expected
+
+	assert DataStream.classify_values(np.array([])) == {"zero": 0, "nan": 0, "one": 0, "total": 0}
@@ -0,0 +1,77 @@
+import pytest
+import pandas as pd
+from modules import DataStream
+from modules.ResultCollector import ResultCollector
+
+
+@pytest.fixture
+def global_vars():
+	import config
+	return {"path": config.csv_path_test,
+	        "file_pattern": config.stream_id_pattern,
+	        "valid_column_names": config.valid_column_names}
+
+
+def test_empty_collector():
+	collector = ResultCollector()
+
+	assert len(collector) == 0
+	assert collector.get_stream_df().empty == True
+	assert collector.get_interval_df() == dict()
+
+
+def test_collector_matches_calculate_functions(global_vars):
+	"""The collector should produce the same summary objects as the calculate_*_level_data functions"""
+	stream_df = pd.DataFrame()
+	interval_df = dict()
+	collector = ResultCollector()
+
+	for stream_id in [2, 3, 4, 7, 8]:
+		path = f"{global_vars['path']}calculate_stream_level_data_test/{stream_id}.csv"
+
+		ds = DataStream.get_data_stream(stream_id=stream_id, file_path=path,
+		                                valid_column_names=global_vars["valid_column_names"])
+		stream_df = DataStream.calculate_stream_level_data(ds=ds, stream_df=stream_df)
+
+		stream_level_res, interval_level_res = DataStream.process_data_stream(
+			stream_id=stream_id, file_path=path, valid_column_names=global_vars["valid_column_names"])
+		collector.add_stream_level_results(stream_level_res)
+		collector.add_interval_level_results(interval_level_res)
+
+		if ds.is_valid_stream():
+			DataStream.calculate_interval_level_data(ds=ds, grouping_configs=ds.get_grouping_config(),
+			                                         interval_df=interval_df)
+
+	assert len(collector) == 5
+	assert collector.get_stream_df().equals(stream_df) == True
+
+	collected_interval_df = collector.get_interval_df()
+	assert collected_interval_df.keys() == interval_df.keys()
+	for grouping_type in interval_df:
+		assert collected_interval_df[grouping_type]["df"].equals(interval_df[grouping_type]["df"]) == True
+		assert collected_interval_df[grouping_type]["output_path"] == interval_df[grouping_type]["output_path"]
+
+	# results can be requested more than once
+	assert collector.get_stream_df().equals(stream_df) == True
+
+
+def test_collector_compaction(monkeypatch):
+	"""Merging the buffered stream-level frames along the way gives the same result as a single concatenation"""
+	from modules import ResultCollector as result_collector
+	monkeypatch.setattr(result_collector, "__compact_size__", 3)
+
+	frames = [pd.DataFrame({"stream_id": [stream_id], "status": ["Processed"], "message": [None],
+	                        "count of 0 and NaN": [stream_id * 2]}) for stream_id in range(10)]
+
+	collector = ResultCollector()
+	for df in frames:
+		collector.add_stream_level_results(df)
+
+	assert len(collector) == 10
+	# each block is merged once - they are concatenated together only when the summary is requested
+	assert [len(df.index) for df in collector.__stream_blocks__] == [3, 3, 3]
+	assert collector.get_stream_df().equals(pd.concat(frames, ignore_index=True)) == True
+
+	# more streams after the summary was requested
+	collector.add_stream_level_results(frames[0])
+	assert collector.get_stream_df().equals(pd.concat(frames + frames[:1], ignore_index=True)) == True
@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+import pandas as pd
+import config
+from modules import ann, DataStream
+
+
+def get_signatures(n_streams: int = 2000, n_shapes: int = 20, noise: float = 0.3, seed: int = 0) -> np.ndarray:
+	"""Unit signatures around a few load shapes - so that every stream has close neighbours"""
+	rng = np.random.default_rng(seed)
+	shapes = rng.normal(size=(n_shapes, 24))
+	signatures = shapes[rng.integers(0, n_shapes, n_streams)] + rng.normal(0, noise, (n_streams, 24))
+	signatures -= signatures.mean(axis=1, keepdims=True)
+	return signatures / np.linalg.norm(signatures, axis=1, keepdims=True)
+
+
+def get_hourly_df(stream_id: int, values: np.ndarray, n_days: int = 3) -> pd.DataFrame:
+	"""hourly results with the same 24 values every day"""
+	return pd.DataFrame({"stream_id": stream_id,
+	                     "day_interval": np.repeat(np.arange(n_days), 24),
+	                     "hour_interval": np.tile(np.arange(24), n_days),
+	                     "hour_mean": np.tile(values, n_days)})
+
+
+def test_get_load_shapes():
+	values = np.arange(24, dtype="float64")
+	df = pd.concat([get_hourly_df(5, values), get_hourly_df(2, values * 3 + 10), get_hourly_df(9, np.ones(24))])
+	# a missing hour, and a NaN
+	df = df[~((df["stream_id"] == 5) & (df["hour_interval"] == 0))]
+	df.loc[df["stream_id"] == 5, "hour_mean"] = df.loc[df["stream_id"] == 5, "hour_mean"].replace(3.0, np.nan)
+
+	stream_ids, signatures = ann.get_load_shapes(df)
+
+	assert stream_ids.tolist() == [2, 5, 9]
+	assert np.allclose(np.linalg.norm(signatures[:2], axis=1), 1) == True
+	assert np.allclose(signatures[0], (values - values.mean()) / np.linalg.norm(values - values.mean())) == True
+	assert signatures[1][0] == 0 and signatures[1][3] == 0
+	# a flat load shape has no direction
+	assert np.array_equal(signatures[2], np.zeros(24)) == True
+
+
+def test_query():
+	signatures = get_signatures()
+	index = ann.SimilarityIndex(n_tables=8, n_bits=8)
+	index.add_many(np.arange(len(signatures)) + 1000, signatures)
+
+	res = index.query(signatures[7], k=5)
+	assert res.columns.tolist() == ["stream_id", "correlation"]
+	assert res.loc[0, "stream_id"] == 1007
+	assert res.loc[0, "correlation"] == pytest.approx(1)
+	assert res["correlation"].is_monotonic_decreasing == True
+
+	# the stream itself is excluded when querying by stream ID
+	res = index.query_stream(1007, k=5)
+	assert 1007 not in res["stream_id"].tolist()
+	assert len(res.index) == 5
+
+
+def test_recall():
+	"""Top 10 of the index vs the exact top 10 (all the signatures compared)"""
+	signatures = get_signatures()
+	index = ann.SimilarityIndex(n_tables=8, n_bits=8)
+	index.add_many(np.arange(len(signatures)), signatures)
+
+	hits = 0
+	for stream_id in range(100):
+		exact = np.argsort(-(signatures @ signatures[stream_id]))[1:11]
+		hits += len(set(exact) & set(index.query_stream(stream_id, k=10, n_probes=2)["stream_id"]))
+
+	assert hits / 1000 > 0.9
+
+
+def test_add_replaces_stream():
+	signatures = get_signatures(n_streams=50)
+	index = ann.SimilarityIndex()
+	index.add_many(np.arange(50), signatures)
+	index.add(10, signatures[20])
+
+	assert len(index) == 50
+	assert np.array_equal(index.get_signature(10), signatures[20]) == True
+	assert index.query(signatures[20], k=2)["stream_id"].tolist() in ([10, 20], [20, 10])
+	# no stale bucket entries of the old signature
+	assert 10 in index.get_stream_ids()[index.get_candidates(signatures[20])]
+	shares_bucket = (index.get_keys(signatures[[10]]) == index.get_keys(signatures[[20]])).any()
+	assert (10 in index.get_stream_ids()[index.get_candidates(signatures[10])]) == shares_bucket
+
+
+def test_save_and_load(tmp_path):
+	signatures = get_signatures(n_streams=300)
+	index = ann.SimilarityIndex(n_tables=4, n_bits=6, seed=3)
+	for stream_id, signature in enumerate(signatures):
+		index.add(stream_id, signature)
+
+	path = f"{tmp_path}/index/similarity_index.npz"
+	index.save(path)
+	loaded = ann.get_index(path)
+
+	assert len(loaded) == 300
+	for stream_id in [0, 150, 299]:
+		assert loaded.query_stream(stream_id, k=10).equals(index.query_stream(stream_id, k=10)) == True
+
+
+def test_get_index_missing(tmp_path):
+	index = ann.get_index(f"{tmp_path}/similarity_index.npz")
+	assert len(index) == 0
+
+
+def test_add_data_stream():
+	index = ann.SimilarityIndex()
+	for stream_id in [1, 718]:
+		ds = DataStream.DataStream(stream_id, config.valid_column_names)
+		path = "csv_local_test/718.csv" if stream_id == 718 else "calculate_interval_level_data_test/1.csv"
+		ds.read_csv_data(file=f"{config.csv_path_test}{path}")
+		ds.get_stream_level_results()
+		assert index.add_data_stream(ds) == True
+
+	assert len(index) == 2
+	assert np.linalg.norm(index.get_signature(718)) == pytest.approx(1)
+
+	# invalid streams aren't added
+	ds = DataStream.DataStream(6, config.valid_column_names)
+	ds.read_csv_data(file=f"{config.csv_path_test}calculate_stream_level_data_test/6.csv")
+	ds.get_stream_level_results()
+	assert ds.is_valid_stream() == False
+	assert index.add_data_stream(ds) == False
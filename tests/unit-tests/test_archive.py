@@ -0,0 +1,140 @@
+import os
+import io
+import tarfile
+import zipfile
+import threading
+import pytest
+import config as conf
+import main
+from modules import DataStream, archive, csv, sinks
+
+__test_path__ = f"{conf.csv_path_test}csv_local_test/"
+
+
+@pytest.fixture
+def file_list():
+	return sorted(csv.get_list_of_files(__test_path__, conf.csv_pattern))
+
+
+def write_archive(path: str, file_list: list[str]) -> None:
+	"""The test files under all-data.tar/csv/ - with a directory and files that don't match the pattern"""
+	members = {f"all-data.tar/csv/{file}": f"{__test_path__}{file}" for file in file_list}
+	members["all-data.tar/meta/all_sites.csv"] = f"{__test_path__}{file_list[0]}"
+
+	if path.endswith(".zip"):
+		with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+			for name, file in members.items():
+				zf.write(file, arcname=name)
+			zf.writestr("all-data.tar/README", "not a stream")
+	else:
+		with tarfile.open(path, "w:gz") as tar:
+			for name, file in members.items():
+				tar.add(file, arcname=name)
+			data = b"not a stream"
+			info = tarfile.TarInfo("all-data.tar/README")
+			info.size = len(data)
+			tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("archive_name", ["all-data.tar.gz", "all-data.zip"])
+def test_iter_archive_tasks(tmp_path, file_list, archive_name):
+	path = f"{tmp_path}/{archive_name}"
+	write_archive(path, file_list)
+	assert archive.is_archive(path)
+
+	tasks = list(archive.iter_archive_tasks(path, conf.csv_pattern, conf.stream_id_pattern, queue_size=1))
+	# all_sites.csv doesn't match the pattern
+	assert [member.name for _, member in tasks] == [f"all-data.tar/csv/{file}" for file in file_list]
+	assert [stream_id for stream_id, _ in tasks] == [int(file[:-4]) for file in file_list]
+	for (_, member), file in zip(tasks, file_list):
+		with open(f"{__test_path__}{file}", "rb") as f:
+			assert member.data == f.read()
+
+	# nothing was extracted
+	assert os.listdir(tmp_path) == [archive_name]
+
+
+@pytest.mark.parametrize("processing_mode, intake_mode", [("serial", "memory"), ("parallel", "memory"),
+                                                          ("pipelined", "memory"), ("serial", "typed")])
+def test_archive_results(tmp_path, file_list, monkeypatch, processing_mode, intake_mode):
+	"""Same results as the files of the directory"""
+	monkeypatch.setattr(DataStream, "intake_mode", intake_mode)
+	path = f"{tmp_path}/all-data.tar.gz"
+	write_archive(path, file_list)
+
+	expected = list(main.get_stream_results(path=__test_path__, file_list=file_list, processing_mode="serial"))
+	tasks = archive.iter_archive_tasks(path, conf.csv_pattern, conf.stream_id_pattern)
+	results = list(main.get_task_results(tasks, processing_mode=processing_mode, max_workers=2))
+
+	assert len(results) == len(expected) == len(file_list)
+	for (stream, interval), (expected_stream, expected_interval) in zip(results, expected):
+		assert stream.equals(expected_stream)
+		assert interval.keys() == expected_interval.keys()
+		for grouping_type in interval:
+			assert interval[grouping_type]["df"].equals(expected_interval[grouping_type]["df"])
+
+
+def test_archive_early_stop(tmp_path, file_list):
+	path = f"{tmp_path}/all-data.tar.gz"
+	write_archive(path, file_list)
+
+	tasks = archive.iter_archive_tasks(path, conf.csv_pattern, conf.stream_id_pattern, queue_size=1)
+	next(tasks)
+	tasks.close()
+	# the decompression thread is done
+	assert "archive-decompress" not in [thread.name for thread in threading.enumerate()]
+
+
+def test_invalid_archive(tmp_path):
+	with pytest.raises(FileNotFoundError):
+		archive.iter_archive_tasks(f"{tmp_path}/missing.tar.gz", conf.csv_pattern, conf.stream_id_pattern)
+
+	path = f"{tmp_path}/broken.zip"
+	with open(path, "w") as f:
+		f.write("not an archive")
+	with pytest.raises(ValueError):
+		archive.iter_archive_tasks(path, conf.csv_pattern, conf.stream_id_pattern)
+
+
+def write_truncated_archive(path: str, file_list: list[str]) -> None:
+	"""The archive cut in the middle of its members - it opens, and fails part-way through"""
+	write_archive(path, file_list)
+	with open(path, "rb") as f:
+		data = f.read()
+	with open(path, "wb") as f:
+		f.write(data[:len(data) // 2])
+
+
+def test_truncated_archive(tmp_path, file_list):
+	path = f"{tmp_path}/all-data.tar.gz"
+	write_truncated_archive(path, file_list)
+
+	tasks = archive.iter_archive_tasks(path, conf.csv_pattern, conf.stream_id_pattern)
+	with pytest.raises(ValueError, match="Invalid archive"):
+		list(tasks)
+	assert "archive-decompress" not in [thread.name for thread in threading.enumerate()]
+
+
+def test_main_truncated_archive(tmp_path, file_list, monkeypatch):
+	"""The outputs of the streams read before the archive failed are closed, the batch of the result store is marked as
+	failed, and a Critical notification is sent"""
+	path = f"{tmp_path}/all-data.tar.gz"
+	write_truncated_archive(path, file_list)
+
+	notifications = []
+	monkeypatch.setattr(main.smtp, "send_email_notification",
+	                    lambda level, message: notifications.append((level, message)))
+	monkeypatch.setattr(conf, "archive_path", path)
+	monkeypatch.setattr(conf, "output_stream_path", f"{tmp_path}/stream_level.csv")
+	monkeypatch.setattr(conf, "result_sink", "sqlite")
+	monkeypatch.setattr(conf, "sqlite_path", f"{tmp_path}/results.sqlite")
+	monkeypatch.setattr(conf, "metrics_path", None)
+	main.main()
+
+	assert [level for level, _ in notifications] == ["Critical"]
+	assert "Invalid archive" in notifications[0][1]
+	# the streams read before the failure
+	with open(f"{tmp_path}/stream_level.csv") as f:
+		assert len(f.readlines()) > 1
+	with sinks.connect(f"{tmp_path}/results.sqlite") as connection:
+		assert connection.execute("SELECT status, finished_at FROM batches").fetchall()[0][0] == "failed"
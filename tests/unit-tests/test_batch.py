@@ -0,0 +1,127 @@
+import os
+import json
+import pytest
+import pandas as pd
+import config
+import main
+from modules import batch, csv, rollup
+from benchmarks.synthetic import write_synthetic_streams
+
+
+@pytest.fixture
+def batch_config(tmp_path, monkeypatch):
+	"""Synthetic streams, and the queue/partials/outputs of the batch in the temporary directory"""
+	path = f"{tmp_path}/csv/"
+	write_synthetic_streams(path, n_streams=7, n_intervals=2000, seed=11, binary_ratio=0.2)
+
+	plan_path = f"{tmp_path}/plan.json"
+	with open(plan_path, "w") as f:
+		json.dump({"groupings": {
+			"day_interval": {"interval": "day", "statistics": ["max", "min", "median", "mean", "sum"],
+			                 "output": f"{tmp_path}/output/daily.csv"},
+			"hour_interval": {"interval": "hour", "statistics": ["max", "mean"],
+			                  "output": f"{tmp_path}/output/hourly.csv"}}}, f)
+
+	monkeypatch.setattr(config, "rollup_plan_path", plan_path)
+	monkeypatch.setattr(config, "output_stream_path", f"{tmp_path}/output/stream_level.csv")
+	monkeypatch.setattr(config, "batch_queue_path", f"{tmp_path}/batches/queue.sqlite")
+	monkeypatch.setattr(config, "batch_partials_path", f"{tmp_path}/batches/")
+	monkeypatch.setattr(config, "batch_shard_size", 2)
+	monkeypatch.setattr(config, "batch_lease_seconds", 0.2)
+	monkeypatch.setattr(config, "rank_top_n", 3)
+	monkeypatch.setattr(batch, "__poll_seconds__", 0.05)
+	return {"path": path, "file_list": csv.get_list_of_files(path, config.csv_pattern), "tmp_path": tmp_path}
+
+
+def get_serial_results(batch_config: dict) -> tuple[pd.DataFrame, dict]:
+	"""Stream-level results (ranked) and the concatenated interval-level results of a serial run"""
+	stream_frames, interval_frames = [], dict()
+	for stream_level_res, interval_level_res in main.get_stream_results(path=batch_config["path"],
+	                                                                    file_list=batch_config["file_list"]):
+		stream_frames.append(stream_level_res)
+		for grouping_type, res in interval_level_res.items():
+			interval_frames.setdefault(grouping_type, []).append(res["df"])
+
+	stream_df = pd.concat(stream_frames, ignore_index=True)
+	rank = stream_df.loc[stream_df["ignore"] == False]["count of 0 and NaN"].rank(ascending=False, method="dense")
+	stream_df["rank"] = rank[rank <= config.rank_top_n].astype("int32")
+	return stream_df, {grouping_type: pd.concat(frames, ignore_index=True) for grouping_type, frames in
+	                   interval_frames.items()}
+
+
+def test_batch(batch_config):
+	queue = batch.get_queue()
+	batch_id = queue.create_batch(batch_config["path"], batch_config["file_list"], shard_size=config.batch_shard_size)
+	assert [len(shard["files"]) for shard in queue.get_shards(batch_id)] == [2, 2, 2, 1]
+
+	# a worker claims a shard, and crashes (never renews its lease)
+	crashed = queue.claim(batch_id, "crashed-worker")
+	assert crashed["shard_id"] == 0
+
+	# the reducer only runs once every shard is done
+	with pytest.raises(ValueError):
+		batch.reduce_batch(queue, batch_id)
+
+	assert batch.run_worker(queue, batch_id, worker_id="worker-1", wait=False) == 3
+	assert queue.get_progress(batch_id) == {"pending": 0, "claimed": 1, "done": 3, "failed": 0}
+
+	# the lease of the crashed worker expires - its shard is retried by another worker
+	assert batch.run_worker(queue, batch_id, worker_id="worker-2", wait=True) == 1
+	assert queue.get_progress(batch_id) == {"pending": 0, "claimed": 0, "done": 4, "failed": 0}
+	assert queue.get_shards(batch_id)[0]["attempts"] == 2
+	# the crashed worker can't complete the shard that was taken over
+	assert queue.complete(crashed, "somewhere") == False
+
+	stream_df = batch.reduce_batch(queue, batch_id)
+	assert queue.get_batch(batch_id)["status"] == "complete"
+
+	# same outputs as a serial run - the ranks of the merged rankings included
+	expected_stream_df, expected_interval = get_serial_results(batch_config)
+	with open(config.output_stream_path, "r") as f:
+		assert f.read() == expected_stream_df.to_csv(index=False)
+	assert stream_df["rank"].notna().sum() == expected_stream_df["rank"].notna().sum() > 0
+
+	for grouping_type, output in [("day_interval", "daily"), ("hour_interval", "hourly")]:
+		with open(f"{batch_config['tmp_path']}/output/{output}.csv", "r") as f:
+			assert f.read() == rollup.format_interval_keys(expected_interval[grouping_type]).to_csv(index=False)
+	queue.close()
+
+
+def test_failed_shard(batch_config, monkeypatch):
+	monkeypatch.setattr(config, "batch_max_attempts", 2)
+	queue = batch.get_queue()
+	batch_id = queue.create_batch(batch_config["path"], batch_config["file_list"][:2], shard_size=2)
+
+	def fail_shard(queue, path, shard, partials_path):
+		raise OSError("disk full")
+
+	monkeypatch.setattr(batch, "process_shard", fail_shard)
+	assert batch.run_worker(queue, batch_id, worker_id="worker-1") == 0
+
+	shard = queue.get_shards(batch_id)[0]
+	assert (shard["status"], shard["attempts"]) == ("failed", 2)
+	assert "disk full" in shard["error"]
+	queue.close()
+
+
+def test_run_batch_crashed_worker(batch_config, monkeypatch):
+	"""A worker process that dies is replaced, and its shard is put back on the queue"""
+	process_shard = batch.process_shard
+	crash_flag = f"{batch_config['tmp_path']}/crashed"
+
+	def crash_once(queue, path, shard, partials_path):
+		if not os.path.exists(crash_flag):
+			open(crash_flag, "w").close()
+			os._exit(1)
+		return process_shard(queue, path, shard, partials_path)
+
+	monkeypatch.setattr(config, "batch_lease_seconds", 300)
+	monkeypatch.setattr(batch, "process_shard", crash_once)
+	batch_id = batch.run_batch(batch_config["path"], batch_config["file_list"], n_workers=2)
+
+	queue = batch.get_queue()
+	assert queue.get_batch(batch_id)["status"] == "complete"
+	assert sum(shard["attempts"] for shard in queue.get_shards(batch_id)) == 5
+	expected_stream_df, _ = get_serial_results(batch_config)
+	assert len(pd.read_csv(config.output_stream_path).index) == len(expected_stream_df.index)
+	queue.close()
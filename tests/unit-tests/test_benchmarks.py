@@ -0,0 +1,55 @@
+import json
+import numpy as np
+import config
+from modules import DataStream
+from benchmarks import suite, synthetic
+
+
+def test_write_synthetic_streams(tmp_path):
+	path = f"{tmp_path}/"
+	file_list = synthetic.write_synthetic_streams(path, n_streams=4, n_intervals=2000, nan_ratio=0.2, zero_ratio=0,
+	                                              binary_ratio=0.5)
+	assert file_list == ["1.csv", "2.csv", "3.csv", "4.csv"]
+
+	ignore = []
+	for stream_id, file in enumerate(file_list, start=1):
+		ds = DataStream.get_data_stream(stream_id, f"{path}{file}", config.valid_column_names)
+		values = ds.get_df()["value"].to_numpy()
+		assert 0.15 < np.isnan(values).mean() < 0.25
+		ignore.append(bool(ds.get_stream_level_results()["ignore"].iloc[0]))
+
+	# the first half of the streams only has 0's and 1's
+	assert ignore == [True, True, False, False]
+
+
+def test_suite(tmp_path):
+	output = f"{tmp_path}/results.json"
+	assert suite.main(["--streams", "3", "--intervals", "600", "--repeat", "1", "--output", output]) == 0
+
+	with open(output, "r") as f:
+		results = json.load(f)
+	assert results["meta"]["streams"] == 3
+	assert list(results["stages"]) == ["read_csv_data", "get_stream_level_results",
+	                                   "get_interval_level_results[day_interval]",
+	                                   "get_interval_level_results[hour_interval]", "ranking", "write"]
+
+	# a baseline where every stage was 10 times as fast
+	baseline = {"stages": {stage: {"seconds": timings["seconds"] / 10} for stage, timings in results["stages"].items()}}
+	with open(f"{tmp_path}/baseline.json", "w") as f:
+		json.dump(baseline, f)
+	assert suite.main(["--streams", "3", "--intervals", "600", "--repeat", "1", "--output", output, "--baseline",
+	                   f"{tmp_path}/baseline.json", "--threshold", "1", "--min-seconds", "0"]) == 1
+
+
+def test_compare():
+	stages = {"read_csv_data": {"seconds": 1.3}, "write": {"seconds": 0.9}, "ranking": {"seconds": 0.03}}
+	baseline = {"stages": {"read_csv_data": {"seconds": 1.0}, "write": {"seconds": 1.0}, "ranking": {"seconds": 0.01}}}
+
+	regressions = suite.compare(stages, baseline, threshold=0.2)
+	assert [r["stage"] for r in regressions] == ["read_csv_data"]
+	assert regressions[0]["ratio"] == 1.3
+
+	# ranking is too short to be compared by default
+	assert [r["stage"] for r in suite.compare(stages, baseline, threshold=0.2, min_seconds=0)] == ["read_csv_data",
+	                                                                                              "ranking"]
+	assert suite.compare(stages, baseline, threshold=0.5) == []
@@ -0,0 +1,148 @@
+import os
+import shutil
+import pytest
+import numpy as np
+import config as conf
+from modules import cache, DataStream
+
+
+@pytest.fixture
+def stream_file(tmp_path):
+	"""copy of a test file - so that it can be modified"""
+	file_path = f"{tmp_path}/718.csv"
+	shutil.copyfile(f"{conf.csv_path_test}csv_local_test/718.csv", file_path)
+	return file_path
+
+
+# the files are parsed with the typed intake (see get_df)
+__intake__ = cache.get_intake_signature("typed", False)
+
+
+@pytest.fixture
+def stream_cache(tmp_path):
+	return cache.StreamCache(cache_path=f"{tmp_path}/cache/")
+
+
+def get_df(file_path):
+	ds = DataStream.DataStream(718, conf.valid_column_names)
+	ds.read_csv_data_typed(file=file_path)
+	return ds.get_df()
+
+
+def test_store_and_load(stream_file, stream_cache):
+	df = get_df(stream_file)
+
+	assert stream_cache.load(stream_file, __intake__) is None
+	stream_cache.store(stream_file, df, __intake__)
+
+	cached_df = stream_cache.load(stream_file, __intake__)
+	assert cached_df.equals(df) == True
+	assert cached_df.dtypes.equals(df.dtypes) == True
+
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_load_mmap(tmp_path, stream_file, mmap):
+	"""With mmap, the loaded columns are still backed by the memory-mapped .npy files (not copied into memory)"""
+	stream_cache = cache.StreamCache(cache_path=f"{tmp_path}/cache/", mmap=mmap)
+	df = get_df(stream_file)
+	stream_cache.store(stream_file, df, __intake__)
+
+	cached_df = stream_cache.load(stream_file, __intake__)
+	assert cached_df.equals(df) == True
+	for column in cached_df.columns:
+		values = cached_df[column].to_numpy()
+		assert isinstance(values.base, np.memmap) == mmap
+		assert values.flags.writeable != mmap
+
+
+@pytest.mark.parametrize("verify_hash", [False, True])
+def test_invalidation(tmp_path, stream_file, verify_hash):
+	stream_cache = cache.StreamCache(cache_path=f"{tmp_path}/cache/", verify_hash=verify_hash)
+	stream_cache.store(stream_file, get_df(stream_file), __intake__)
+	# an entry of another intake isn't valid
+	assert stream_cache.load(stream_file, cache.get_intake_signature("memory", False)) is None
+
+	# touched, but the content is the same - only valid when the content hash is compared
+	os.utime(stream_file, ns=(0, 0))
+	assert (stream_cache.load(stream_file, __intake__) is not None) == verify_hash
+
+	# modified - not valid
+	stream_cache.store(stream_file, get_df(stream_file), __intake__)
+	with open(stream_file, "a") as f:
+		f.write('1325548800,2012-01-03 00:00:00,1.0,0,""\n')
+	assert stream_cache.load(stream_file, __intake__) is None
+
+
+def test_eviction(tmp_path, stream_file, stream_cache):
+	df = get_df(stream_file)
+
+	file_paths = []
+	for i in range(3):
+		file_path = f"{tmp_path}/{i + 1}.csv"
+		shutil.copyfile(stream_file, file_path)
+		stream_cache.store(file_path, df, __intake__)
+		file_paths.append(file_path)
+
+	# the first entry is the most recently used one
+	os.utime(f"{stream_cache.get_entry_path(file_paths[0])}meta.json", (2 ** 31, 2 ** 31))
+
+	entry_size = cache.get_directory_size(stream_cache.get_entry_path(file_paths[0]))
+	assert stream_cache.evict(max_bytes=entry_size) == 2
+	assert stream_cache.load(file_paths[0], __intake__) is not None
+	assert stream_cache.load(file_paths[1], __intake__) is None
+	assert stream_cache.load(file_paths[2], __intake__) is None
+
+	assert stream_cache.clear() == 1
+	assert stream_cache.list_entries() == []
+
+
+def test_invalid_format(tmp_path):
+	with pytest.raises(ValueError):
+		cache.StreamCache(cache_path=f"{tmp_path}/cache/", cache_format="something random")
+
+
+def test_get_data_stream_with_cache(monkeypatch, stream_file, stream_cache):
+	monkeypatch.setattr(DataStream, "use_cache", True)
+	monkeypatch.setattr(DataStream, "intake_mode", "typed")
+	monkeypatch.setattr(cache, "__stream_cache__", stream_cache)
+
+	ds = DataStream.get_data_stream(stream_id=718, file_path=stream_file, valid_column_names=conf.valid_column_names)
+	assert len(stream_cache.list_entries()) == 1
+	# the entry is keyed by the intake the file was actually read with (config.intake_mode isn't patched)
+	assert stream_cache.load(stream_file, __intake__) is not None
+
+	cached_ds = DataStream.get_data_stream(stream_id=718, file_path=stream_file,
+	                                       valid_column_names=conf.valid_column_names)
+	assert cached_ds.get_df().equals(ds.get_df()) == True
+	assert cached_ds.get_stream_level_results().equals(ds.get_stream_level_results()) == True
+
+	for grouping_type, grouping_config in ds.get_grouping_config().items():
+		res = cached_ds.get_interval_level_results(grouping_type, cached_ds.get_grouping_config()[grouping_type])
+		assert res.equals(ds.get_interval_level_results(grouping_type, grouping_config)) == True
+
+
+@pytest.mark.parametrize("processing_mode", ["serial", "parallel"])
+def test_rebuild_cache(monkeypatch, tmp_path, stream_file, stream_cache, processing_mode):
+	"""With rebuild_cache, the file is parsed again and its entry overwritten - the flag is passed with each task, so
+	the worker processes get it too"""
+	import main
+
+	monkeypatch.setattr(DataStream, "use_cache", True)
+	monkeypatch.setattr(DataStream, "intake_mode", "typed")
+	monkeypatch.setattr(cache, "__stream_cache__", stream_cache)
+
+	# stale entry - only the first rows of the file
+	df = get_df(stream_file)
+	stream_cache.store(stream_file, df.head(10), __intake__)
+
+	ds = DataStream.get_data_stream(stream_id=718, file_path=stream_file, valid_column_names=conf.valid_column_names)
+	assert ds.get_total_intervals() == 10
+
+	results = list(main.get_stream_results(path=f"{tmp_path}/", file_list=["718.csv"], processing_mode=processing_mode,
+	                                       max_workers=1, rebuild_cache=True))
+	expected_ds = DataStream.DataStream(718, conf.valid_column_names)
+	expected_ds.set_df(df.copy())
+	expected = DataStream.get_data_stream_results(expected_ds)
+	for grouping_type, res in expected[1].items():
+		assert results[0][1][grouping_type]["df"].equals(res["df"]) == True
+	assert stream_cache.load(stream_file, __intake__).equals(df) == True
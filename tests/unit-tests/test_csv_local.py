@@ -1,3 +1,4 @@
+import os
 import pytest
 import config as conf
 from modules import csv
@@ -32,8 +33,59 @@ def test_get_list_of_files_invalid_path():
 		assert type(files) == NotADirectoryError
 
 
+@pytest.fixture
+def sharded_dir(tmp_path):
+	"""Files sharded into sub-directories, and files that don't match the pattern"""
+	files = {"1.csv": 10, "00/2.csv": 30, "00/3.csv": 20, "01/nested/4.csv": 40, "notes.txt": 50, "01/0.csv": 5}
+	for name, size in files.items():
+		os.makedirs(os.path.dirname(f"{tmp_path}/{name}"), exist_ok=True)
+		with open(f"{tmp_path}/{name}", "w") as f:
+			f.write("x" * size)
+	return f"{tmp_path}/"
 
 
+def test_iter_file_records(sharded_dir):
+	records = csv.iter_file_records(sharded_dir, conf.csv_pattern, conf.stream_id_pattern)
+	assert not isinstance(records, list)
+	assert [(record.stream_id, record.size) for record in records] == [(1, 10)]
 
+	records = list(csv.iter_file_records(sharded_dir, conf.csv_pattern, conf.stream_id_pattern, recursive=True))
+	assert sorted(record.stream_id for record in records) == [1, 2, 3, 4]
+	assert all(os.path.isfile(record.path) and record.mtime > 0 for record in records)
 
+	records = csv.iter_file_records(sharded_dir, conf.csv_pattern, conf.stream_id_pattern, recursive=True,
+	                                order="largest_first")
+	assert [record.stream_id for record in records] == [4, 2, 3, 1]
 
+	assert sorted(csv.get_list_of_files(sharded_dir, conf.csv_pattern, recursive=True)) == \
+		["00/2.csv", "00/3.csv", "01/nested/4.csv", "1.csv"]
+
+
+def test_iter_file_records_invalid(sharded_dir):
+	with pytest.raises(ValueError):
+		csv.iter_file_records(sharded_dir, conf.csv_pattern, conf.stream_id_pattern, order="random")
+	# raised before the first record is requested
+	with pytest.raises(NotADirectoryError):
+		csv.iter_file_records("something random and invalid", conf.csv_pattern, conf.stream_id_pattern)
+
+
+def test_file_manifest(sharded_dir, tmp_path):
+	manifest_path = f"{tmp_path}/manifest/manifest.json"
+
+	def discover() -> list[int]:
+		manifest = csv.FileManifest(manifest_path)
+		records = csv.iter_file_records(sharded_dir, conf.csv_pattern, conf.stream_id_pattern, recursive=True,
+		                                manifest=manifest)
+		stream_ids = sorted(record.stream_id for record in records)
+		manifest.save()
+		return stream_ids
+
+	# records that were yielded but not saved (e.g., the run failed) are discovered again
+	list(csv.iter_file_records(sharded_dir, conf.csv_pattern, conf.stream_id_pattern,
+	                           manifest=csv.FileManifest(manifest_path)))
+	assert discover() == [1, 2, 3, 4]
+	assert discover() == []
+
+	with open(f"{sharded_dir}00/3.csv", "a") as f:
+		f.write("more rows")
+	assert discover() == [3]
@@ -0,0 +1,82 @@
+import io
+import pytest
+import numpy as np
+import pandas as pd
+import config
+from modules import DataStream, csv, greenbutton
+from benchmarks.synthetic import generate_stream, write_greenbutton_stream
+
+
+@pytest.fixture
+def stream_files(tmp_path):
+	"""The same stream as a CSV file and as a Green Button file - with NaN's, and some estimated readings"""
+	df = generate_stream(3 * 288 + 100, seed=4, nan_ratio=0.05)
+	df.loc[10:20, "estimated"] = 1
+	df.to_csv(f"{tmp_path}/5.csv", index=False)
+	write_greenbutton_stream(f"{tmp_path}/5.xml", df)
+	return f"{tmp_path}/5.csv", f"{tmp_path}/5.xml"
+
+
+def test_read_interval_readings(stream_files):
+	csv_file, xml_file = stream_files
+	expected = pd.read_csv(csv_file, parse_dates=["dttm_utc"])
+
+	pd.testing.assert_frame_equal(greenbutton.read_interval_readings(xml_file), expected)
+	with open(xml_file, "rb") as f:
+		pd.testing.assert_frame_equal(greenbutton.read_interval_readings(f), expected)
+
+
+def test_read_interval_readings_order_and_scale():
+	xml = ('<feed xmlns="http://www.w3.org/2005/Atom" xmlns:espi="http://naesb.org/espi">'
+	       '<entry><content><espi:IntervalBlock>'
+	       '<espi:IntervalReading><espi:timePeriod><espi:duration>3600</espi:duration><espi:start>7200</espi:start>'
+	       '</espi:timePeriod><espi:value>3</espi:value></espi:IntervalReading>'
+	       '</espi:IntervalBlock></content></entry>'
+	       '<entry><content><espi:IntervalBlock>'
+	       '<espi:IntervalReading><espi:timePeriod><espi:duration>3600</espi:duration><espi:start>0</espi:start>'
+	       '</espi:timePeriod><espi:value>1</espi:value></espi:IntervalReading>'
+	       '<espi:IntervalReading><espi:timePeriod><espi:duration>3600</espi:duration><espi:start>3600</espi:start>'
+	       '</espi:timePeriod></espi:IntervalReading>'
+	       '</espi:IntervalBlock></content></entry>'
+	       # the ReadingType after the blocks - kWh, in hundreds
+	       '<entry><content><espi:ReadingType><espi:powerOfTenMultiplier>2</espi:powerOfTenMultiplier>'
+	       '<espi:uom>169</espi:uom></espi:ReadingType></content></entry></feed>')
+
+	df = greenbutton.read_interval_readings(io.BytesIO(xml.encode()))
+	assert df["timestamp"].tolist() == [3600, 7200, 10800]
+	assert np.allclose(df["value"], [100, np.nan, 300], equal_nan=True)
+
+
+@pytest.mark.parametrize("intake_mode", ["memory", "chunked"])
+def test_greenbutton_intake(stream_files, monkeypatch, intake_mode):
+	"""Same stream-level and interval-level results as the CSV intake (the chunked intake is for the CSV files only)"""
+	csv_file, xml_file = stream_files
+	monkeypatch.setattr(DataStream, "intake_mode", intake_mode)
+
+	results = []
+	for file in (csv_file, xml_file):
+		ds = DataStream.get_data_stream(5, file, config.valid_column_names)
+		results.append(DataStream.get_data_stream_results(ds))
+
+	(csv_stream, csv_interval), (xml_stream, xml_interval) = results
+	pd.testing.assert_frame_equal(xml_stream, csv_stream)
+	assert list(xml_interval) == list(csv_interval)
+	for grouping_type in csv_interval:
+		pd.testing.assert_frame_equal(xml_interval[grouping_type]["df"], csv_interval[grouping_type]["df"])
+
+
+def test_invalid_greenbutton_file(tmp_path):
+	path = f"{tmp_path}/6.xml"
+	with open(path, "w") as f:
+		f.write('<feed xmlns="http://www.w3.org/2005/Atom"><entry>')
+
+	ds = DataStream.DataStream(6, config.valid_column_names)
+	assert ds.read_greenbutton_data(path) == False
+	assert type(ds.get_file_intake_error()) == ValueError
+
+
+def test_get_input_source():
+	assert csv.get_input_source("greenbutton") == (config.gb_xml_path, config.gb_xml_pattern,
+	                                                config.gb_xml_stream_id_pattern)
+	with pytest.raises(ValueError):
+		csv.get_input_source("json")
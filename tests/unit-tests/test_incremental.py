@@ -0,0 +1,144 @@
+import os
+import pytest
+import config as conf
+import main
+from modules import DataStream, incremental, rollup
+from modules.ResultCollector import ResultCollector
+
+
+@pytest.fixture
+def lines():
+	with open(f"{conf.csv_path_test}csv_local_test/718.csv", "r") as f:
+		return [line for line in f.readlines() if line.strip() != ""]
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+	monkeypatch.setattr(conf, "checkpoint_path", f"{tmp_path}/checkpoints/")
+	monkeypatch.setattr(conf, "incremental", True)
+	return {"path": f"{tmp_path}/csv/", "checkpoint_path": f"{tmp_path}/checkpoints/"}
+
+
+def get_output(path: str) -> tuple[str, dict]:
+	"""stream-level and interval-level CSV output (as strings) for all the files in the path"""
+	collector = ResultCollector()
+	for stream_level_res, interval_level_res in main.get_stream_results(path=path, file_list=sorted(os.listdir(path))):
+		collector.add_stream_level_results(stream_level_res)
+		collector.add_interval_level_results(interval_level_res)
+
+	return (collector.get_stream_df().to_csv(index=False),
+	        {grouping_type: rollup.format_interval_keys(res["df"]).to_csv(index=False)
+	         for grouping_type, res in collector.get_interval_df().items()})
+
+
+def get_full_output(path: str, monkeypatch, intake_mode: str = "chunked") -> tuple[str, dict]:
+	with monkeypatch.context() as m:
+		m.setattr(conf, "incremental", False)
+		m.setattr(DataStream, "intake_mode", intake_mode)
+		return get_output(path)
+
+
+def test_incremental_matches_full_recompute(settings, lines, monkeypatch):
+	"""Appending to the files between runs - the output should always be the same as the one of a full recompute"""
+	os.makedirs(settings["path"])
+
+	# split in the middle of an hour, on the day boundary, and in the middle of the second day
+	splits = [1, 100, 288, 289, 400, len(lines)]
+
+	written = 0
+	for split in splits:
+		with open(f"{settings['path']}718.csv", "a") as f:
+			f.writelines(lines[written:split])
+		with open(f"{settings['path']}2.csv", "a") as f:
+			f.writelines(lines[written:split])
+		written = split
+
+		res = get_output(settings["path"])
+		assert res == get_full_output(settings["path"], monkeypatch)
+
+	assert len(os.listdir(settings["checkpoint_path"])) == 2
+
+
+def test_incremental_only_reads_new_rows(settings, lines):
+	os.makedirs(settings["path"])
+	file = f"{settings['path']}718.csv"
+
+	with open(file, "w") as f:
+		f.writelines(lines[:300])
+
+	ds = DataStream.DataStream(718, conf.valid_column_names)
+	incremental.read_csv_data_incremental(ds=ds, file=file, chunk_size=50, checkpoint_path=settings["checkpoint_path"])
+	assert ds.get_total_intervals() == 299
+
+	with open(file, "a") as f:
+		f.writelines(lines[300:])
+
+	checkpoint = incremental.load_checkpoint(incremental.get_checkpoint_dir(settings["checkpoint_path"], 718), file,
+	                                         ds.get_grouping_config())
+	assert checkpoint["offset"] == len("".join(lines[:300]).encode())
+	assert checkpoint["total_intervals"] == 299
+
+	# the rows of the complete first day are in the checkpoint - only the open day is kept as rows
+	assert len(checkpoint["open_rows"].index) == 299 - 287
+	assert len(checkpoint["chunked_results"]["day_interval"].index) == 1
+
+	ds = DataStream.DataStream(718, conf.valid_column_names)
+	incremental.read_csv_data_incremental(ds=ds, file=file, chunk_size=50, checkpoint_path=settings["checkpoint_path"])
+	assert ds.get_total_intervals() == len(lines) - 1
+
+
+def test_incremental_modified_file(settings, lines, monkeypatch):
+	"""A file that was modified (not only appended to) is processed from the start"""
+	os.makedirs(settings["path"])
+	file = f"{settings['path']}718.csv"
+
+	with open(file, "w") as f:
+		f.writelines(lines[:300])
+	get_output(settings["path"])
+
+	modified = lines[:300]
+	modified[10] = modified[10].replace(",29.", ",0.")
+	with open(file, "w") as f:
+		f.writelines(modified + lines[300:])
+
+	assert get_output(settings["path"]) == get_full_output(settings["path"], monkeypatch)
+
+
+def test_incremental_modified_in_place(settings, lines, monkeypatch):
+	"""An edit of the same length in the middle of the processed part (away from its first and last bytes) is detected
+	too - the output is the one of a full recompute with the in-memory intake"""
+	os.makedirs(settings["path"])
+	file = f"{settings['path']}718.csv"
+
+	with open(file, "w") as f:
+		f.writelines(lines[:300])
+	get_output(settings["path"])
+
+	modified = lines[:300]
+	assert ",20.2722," in modified[150]
+	modified[150] = modified[150].replace(",20.2722,", ",29.2722,")
+	with open(file, "w") as f:
+		f.writelines(modified + lines[300:])
+	assert os.path.getsize(file) == len("".join(lines).encode())
+
+	assert get_output(settings["path"]) == get_full_output(settings["path"], monkeypatch, intake_mode="memory")
+
+
+def test_incremental_partial_line(settings, lines, monkeypatch):
+	"""A row that is still being written is left for the next run"""
+	os.makedirs(settings["path"])
+	file = f"{settings['path']}718.csv"
+
+	with open(file, "w") as f:
+		f.writelines(lines[:300])
+		f.write(lines[300][:15])
+
+	ds = DataStream.DataStream(718, conf.valid_column_names)
+	incremental.read_csv_data_incremental(ds=ds, file=file, chunk_size=50, checkpoint_path=settings["checkpoint_path"])
+	assert ds.get_total_intervals() == 299
+
+	with open(file, "a") as f:
+		f.write(lines[300][15:])
+		f.writelines(lines[301:])
+
+	assert get_output(settings["path"]) == get_full_output(settings["path"], monkeypatch)
@@ -0,0 +1,79 @@
+import pytest
+import config as conf
+import main
+from modules import csv, pipeline
+
+
+@pytest.fixture
+def file_list():
+	return sorted(csv.get_list_of_files(f"{conf.csv_path_test}csv_local_test/", conf.csv_pattern))
+
+
+def test_get_stream_results_parallel_matches_serial(file_list):
+	path = f"{conf.csv_path_test}csv_local_test/"
+
+	serial = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="serial"))
+	parallel = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="parallel", max_workers=2))
+
+	assert len(serial) == len(parallel) == len(file_list)
+
+	for (serial_stream, serial_interval), (parallel_stream, parallel_interval) in zip(serial, parallel):
+		assert serial_stream.equals(parallel_stream) == True
+		assert serial_interval.keys() == parallel_interval.keys()
+
+		for grouping_type in serial_interval:
+			assert serial_interval[grouping_type]["df"].equals(parallel_interval[grouping_type]["df"]) == True
+
+
+def test_get_stream_results_invalid_mode(file_list):
+	path = f"{conf.csv_path_test}csv_local_test/"
+
+	with pytest.raises(ValueError):
+		list(main.get_stream_results(path=path, file_list=file_list, processing_mode="something random"))
+
+
+def test_get_stream_results_pipelined_matches_serial(file_list):
+	path = f"{conf.csv_path_test}csv_local_test/"
+	timings = pipeline.StageTimings()
+
+	serial = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="serial"))
+	pipelined = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="pipelined",
+	                                         timings=timings))
+
+	assert len(serial) == len(pipelined) == len(file_list)
+
+	for (serial_stream, serial_interval), (pipelined_stream, pipelined_interval) in zip(serial, pipelined):
+		assert serial_stream.equals(pipelined_stream) == True
+		assert serial_interval.keys() == pipelined_interval.keys()
+
+		for grouping_type in serial_interval:
+			assert serial_interval[grouping_type]["df"].equals(pipelined_interval[grouping_type]["df"]) == True
+
+	summary = timings.get_summary()
+	assert sorted(summary.keys()) == ["compute", "read", "write"]
+	assert all(summary[stage]["items"] == len(file_list) for stage in summary)
+
+
+@pytest.mark.parametrize("processing_mode", ["parallel", "pipelined"])
+def test_get_task_results_lazy(file_list, monkeypatch, processing_mode):
+	"""The tasks are taken as the results are consumed - not all of them up front"""
+	monkeypatch.setattr(conf, "parallel_chunksize", 1)
+	monkeypatch.setattr(conf, "pipeline_queue_size", 1)
+	path = f"{conf.csv_path_test}csv_local_test/"
+	taken = []
+
+	def get_tasks():
+		for i in range(200):
+			file = file_list[i % len(file_list)]
+			taken.append(file)
+			yield main.get_stream_id(pattern=conf.stream_id_pattern, file=file), f"{path}{file}"
+
+	results = main.get_task_results(get_tasks(), processing_mode=processing_mode, max_workers=2)
+	for _ in range(3):
+		next(results)
+	results.close()
+
+	# parallel: 2 chunks per worker, and the chunk being submitted. pipelined: the window of the pipeline (2 * queue
+	# size + readers + workers), the task queue, and the task being put on it
+	ahead = {"parallel": 2 * 2 + 1, "pipelined": (2 * 1 + 2 + 2) + 1 + 1}[processing_mode]
+	assert 3 <= len(taken) <= 3 + ahead
@@ -0,0 +1,139 @@
+import json
+import pstats
+import tracemalloc
+import numpy as np
+import config as conf
+import main
+from modules import csv, metrics
+
+
+def test_timer_and_summary():
+	registry = metrics.Metrics(n_slowest=2)
+
+	with registry.timer("intake", rows=100):
+		pass
+	with registry.timer("intake") as timer:
+		timer.set_rows(300)
+	registry.increment("files_listed", 3)
+	for stream_id, seconds in [(1, 0.5), (2, 0.1), (3, 0.9)]:
+		registry.add_stream(stream_id, seconds)
+
+	summary = registry.get_summary()
+	assert summary["stages"]["intake"]["calls"] == 2
+	assert summary["stages"]["intake"]["rows"] == 400
+	assert summary["stages"]["intake"]["rows_per_second"] > 0
+	assert summary["stages"]["intake"]["peak_memory_mb"] is None
+	assert summary["counters"] == {"files_listed": 3}
+	# only the 2 slowest streams are kept
+	assert [s["stream_id"] for s in summary["slowest_streams"]] == [3, 1]
+
+
+def test_peak_memory():
+	registry = metrics.Metrics()
+
+	tracemalloc.start()
+	try:
+		with registry.timer("outer"):
+			with registry.timer("inner"):
+				buffer = np.ones(2 ** 20)  # 8MB
+				del buffer
+			small = np.ones(2 ** 10)
+	finally:
+		tracemalloc.stop()
+
+	stages = registry.get_summary()["stages"]
+	assert 8 <= stages["inner"]["peak_memory_mb"] < 9
+	# the peak of the inner stage is also the peak of the outer one
+	assert stages["outer"]["peak_memory_mb"] >= stages["inner"]["peak_memory_mb"]
+
+
+def test_profile_call_peak_memory():
+	"""The peak of the whole call - not only the one since the last stage timed inside it"""
+	def func():
+		buffer = np.ones(2 ** 21)  # 16MB
+		del buffer
+		with metrics.timer("inner"):
+			return np.ones(2 ** 10)
+
+	res, profile = metrics.profile_call(func, (), "tracemalloc")
+	assert len(res) == 2 ** 10
+	assert 16 <= float(profile.splitlines()[0].split(":")[1][:-2]) < 17
+	assert tracemalloc.is_tracing() == False
+
+
+def test_merge():
+	registry, worker = metrics.Metrics(), metrics.Metrics()
+	registry.add("intake", seconds=1.0, rows=10)
+	worker.add("intake", seconds=2.0, rows=20)
+	worker.add("classify", seconds=0.5, rows=20, peak_bytes=2 ** 20)
+	worker.increment("streams_read")
+	worker.add_stream(7, 2.0)
+
+	registry.merge(worker.get_state())
+	state = registry.get_state()
+	assert state["stages"]["intake"] == {"calls": 2, "seconds": 3.0, "max_seconds": 2.0, "rows": 30, "peak_bytes": None}
+	assert state["stages"]["classify"]["peak_bytes"] == 2 ** 20
+	assert state["counters"] == {"streams_read": 1}
+	assert state["slowest"] == [(2.0, 7)]
+
+
+def test_write_prometheus(tmp_path):
+	registry = metrics.Metrics()
+	registry.add("calc.max", seconds=0.25, rows=24)
+	registry.increment("files_listed", 2)
+	registry.write_prometheus(f"{tmp_path}/metrics.prom")
+
+	with open(f"{tmp_path}/metrics.prom") as f:
+		lines = f.read().splitlines()
+	assert "# TYPE enel_stage_seconds_total counter" in lines
+	assert 'enel_stage_seconds_total{stage="calc.max"} 0.25' in lines
+	assert 'enel_stage_rows_total{stage="calc.max"} 24' in lines
+	assert 'enel_events_total{name="files_listed"} 2' in lines
+	# no peak memory without tracemalloc
+	assert not any(line.startswith("enel_stage_peak_memory_bytes{") for line in lines)
+
+	assert metrics.escape_label('a"b\\c') == 'a\\"b\\\\c'
+
+
+def test_get_stream_results_metrics(tmp_path):
+	path = f"{conf.csv_path_test}csv_local_test/"
+	registry = metrics.get_metrics()
+	registry.reset()
+
+	file_list = sorted(csv.get_list_of_files(path, conf.csv_pattern))
+	profiles = metrics.StreamProfiles(n=2, mode="cprofile")
+	serial = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="serial", profiles=profiles))
+	assert len(serial) == len(file_list)
+
+	summary = registry.get_summary()
+	assert {"list_files", "intake", "classify", "definition.hour_interval", "calc.max", "calc.median"} <= \
+		set(summary["stages"])
+	assert summary["stages"]["intake"]["calls"] == len(file_list)
+	assert summary["counters"]["files_listed"] == len(file_list)
+	assert len(summary["slowest_streams"]) == len(file_list)
+
+	paths = profiles.write(f"{tmp_path}/profiles/")
+	assert len(paths) == 2
+	assert pstats.Stats(paths[0]).total_calls > 0
+
+	# the metrics of the worker processes are merged into the ones of the main process
+	registry.reset()
+	parallel = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="parallel", max_workers=2))
+	assert len(parallel) == len(file_list)
+	summary = registry.get_summary()
+	assert summary["stages"]["intake"]["calls"] == len(file_list)
+	assert summary["counters"]["streams_read"] == len(file_list)
+
+	# pipelined - the intake runs on the reader threads, and the calculations on the worker processes
+	registry.reset()
+	pipelined = list(main.get_stream_results(path=path, file_list=file_list, processing_mode="pipelined"))
+	assert len(pipelined) == len(file_list)
+	assert summary["stages"]["intake"]["calls"] == registry.get_summary()["stages"]["intake"]["calls"]
+	assert summary["stages"]["calc.max"]["calls"] == registry.get_summary()["stages"]["calc.max"]["calls"]
+	assert len(registry.get_summary()["slowest_streams"]) == len(file_list)
+	summary = registry.get_summary()
+
+	registry.write_summary(f"{tmp_path}/metrics.json")
+	with open(f"{tmp_path}/metrics.json") as f:
+		assert json.load(f)["stages"]["intake"]["rows"] == summary["stages"]["intake"]["rows"]
+	registry.reset()
@@ -0,0 +1,211 @@
+import os
+import time
+import random
+import threading
+import pytest
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from modules import pipeline, rollup, writers
+
+
+def slow_read(position: int, delay: float) -> int:
+	time.sleep(delay)
+	return position
+
+
+def test_pipeline_order():
+	"""Results come out in the order of the tasks, even when they are finished out of order"""
+	rng = random.Random(0)
+	tasks = [(i, rng.random() / 100) for i in range(50)]
+
+	res = list(pipeline.Pipeline(read=slow_read, compute=lambda x: x * 2, n_readers=4, n_workers=3,
+	                             queue_size=2).run(tasks))
+
+	assert res == [i * 2 for i in range(50)]
+
+
+def test_pipeline_backpressure():
+	"""A slow consumer holds back the readers - only a bounded number of items is ever read ahead"""
+	lock = threading.Lock()
+	read = []
+
+	def read_item(position: int) -> int:
+		with lock:
+			read.append(position)
+		return position
+
+	queue_size, n_readers, n_workers = 2, 2, 1
+	for position in pipeline.Pipeline(read=read_item, compute=lambda x: x, n_readers=n_readers, n_workers=n_workers,
+	                                  queue_size=queue_size).run([(i,) for i in range(40)]):
+		time.sleep(0.005)
+		# items in the 2 queues, and in the hands of the readers/workers
+		assert len(read) <= position + 1 + 2 * queue_size + n_readers + n_workers
+
+
+def compute_pid(x: int) -> tuple[int, int]:
+	return x * 2, os.getpid()
+
+
+def raise_on_7(x: int) -> int:
+	if x == 7:
+		raise ValueError("bad item")
+	return x
+
+
+def test_pipeline_executor():
+	"""With a process pool, the items are computed in the worker processes - still in the order of the tasks"""
+	with ProcessPoolExecutor(max_workers=2) as executor:
+		res = list(pipeline.Pipeline(read=slow_read, compute=compute_pid, n_readers=2, n_workers=2,
+		                             executor=executor).run([(i, 0) for i in range(20)]))
+
+	assert [x for x, _ in res] == [i * 2 for i in range(20)]
+	assert os.getpid() not in {pid for _, pid in res}
+
+	with ProcessPoolExecutor(max_workers=1) as executor:
+		with pytest.raises(ValueError, match="bad item"):
+			list(pipeline.Pipeline(read=lambda x: x, compute=raise_on_7, executor=executor).run([(i,) for i in range(20)]))
+
+
+def test_pipeline_error():
+	def compute(x: int) -> int:
+		if x == 7:
+			raise ValueError("bad item")
+		return x
+
+	with pytest.raises(ValueError):
+		list(pipeline.Pipeline(read=lambda x: x, compute=compute).run([(i,) for i in range(20)]))
+
+
+def test_pipeline_read_error():
+	"""A failure of the read stage reaches the consumer as is - it isn't handed to the compute stage"""
+	computed = []
+
+	def read(x: int) -> int:
+		if x == 7:
+			raise FileNotFoundError("missing file")
+		return x
+
+	def compute(x: int) -> int:
+		computed.append(x)
+		return x * 2
+
+	res = pipeline.Pipeline(read=read, compute=compute, n_readers=1, n_workers=1).run([(i,) for i in range(20)])
+	assert [next(res) for _ in range(7)] == [i * 2 for i in range(7)]
+	with pytest.raises(FileNotFoundError, match="missing file"):
+		next(res)
+	assert all(type(x) == int for x in computed)
+
+
+def test_pipeline_tasks_error():
+	"""An exception of the task iterator reaches the consumer after the results of the tasks before it"""
+	def get_tasks():
+		for i in range(5):
+			yield (i,)
+		raise OSError("listing failed")
+
+	res = pipeline.Pipeline(read=lambda x: x, compute=lambda x: x).run(get_tasks())
+	assert [next(res) for _ in range(5)] == list(range(5))
+	with pytest.raises(OSError, match="listing failed"):
+		next(res)
+
+
+def test_pipeline_early_stop():
+	"""Stopping the consumer early shouldn't leave the threads hanging"""
+	res = pipeline.Pipeline(read=lambda x: x, compute=lambda x: x, queue_size=1).run([(i,) for i in range(100)])
+	assert next(res) == 0
+	res.close()
+
+	assert [t for t in threading.enumerate() if t.name.startswith("pipeline-")] == []
+
+
+def test_pipeline_empty():
+	assert list(pipeline.Pipeline(read=lambda x: x, compute=lambda x: x).run([])) == []
+
+
+def test_pipeline_invalid_settings():
+	with pytest.raises(ValueError):
+		pipeline.Pipeline(read=lambda x: x, compute=lambda x: x, queue_size=0)
+
+
+def test_csv_writer(tmp_path):
+	"""Appending the frames one at a time gives the same file as writing the concatenated frame"""
+	frames = [pd.DataFrame({"stream_id": stream_id,
+	                        "day_interval": pd.Series([15340, 15341], dtype="int32"),
+	                        "day_mean": [1.5, float("nan")]}) for stream_id in [1, 2, 3]]
+
+	writer = writers.CsvWriter(f"{tmp_path}/out/daily.csv")
+	for df in frames:
+		writer.write(df)
+	writer.close()
+
+	rollup.format_interval_keys(pd.concat(frames, ignore_index=True)).to_csv(f"{tmp_path}/expected.csv", index=False)
+	with open(f"{tmp_path}/out/daily.csv") as f, open(f"{tmp_path}/expected.csv") as expected:
+		assert f.read() == expected.read()
+	assert writer.get_rows() == 6
+
+
+def test_stream_level_writer(tmp_path):
+	"""The rows written one stream at a time, with the ranks filled in at the end, give the same file as the ranked
+	concatenated results"""
+	frames = [pd.DataFrame({"stream_id": [stream_id], "status": ["Processed"], "message": [None], "rank": [float("nan")],
+	                        "% of 0 and NaN": [stream_id / 7], "count of 0 and NaN": [stream_id % 3],
+	                        "ignore": [False]}) for stream_id in range(6)]
+	frames[2] = frames[2].assign(status="Warning", message='Empty file, "no data"', **{"count of 0 and NaN": float("nan")})
+	ranks = {0: 2, 3: 2, 5: 1}
+
+	writer = writers.StreamLevelWriter(f"{tmp_path}/out/stream_level.csv")
+	for df in frames:
+		writer.write(df)
+	writer.close(ranks)
+
+	expected = pd.concat(frames, ignore_index=True)
+	expected["rank"] = expected["stream_id"].map(ranks)
+	with open(f"{tmp_path}/out/stream_level.csv") as f:
+		assert f.read() == expected.to_csv(index=False)
+	assert writer.get_rows() == 6
+	# the spool is removed
+	assert sorted(os.listdir(f"{tmp_path}/out")) == ["stream_level.csv"]
+
+
+def get_interval_frames(n_streams: int = 5) -> list:
+	return [pd.DataFrame({"stream_id": stream_id,
+	                      "day_interval": pd.Series([15340, 15341, 15342], dtype="int32"),
+	                      "day_mean": [1.5, float("nan"), stream_id / 3]}) for stream_id in range(n_streams)]
+
+
+@pytest.mark.parametrize("row_group_size", [1, 4, 100])
+def test_columnar_writer(tmp_path, row_group_size):
+	frames = get_interval_frames()
+
+	writer = writers.get_writer(f"{tmp_path}/daily.csv", output_format="columnar", row_group_size=row_group_size)
+	for df in frames:
+		writer.write(df)
+	writer.close()
+
+	expected = pd.concat(frames, ignore_index=True)
+	res = writers.read_columnar(writer.get_path())
+
+	assert writer.get_rows() == 15
+	assert sum(writer.get_row_groups()) == 15
+	assert len(writer.get_row_groups()) == {1: 5, 4: 3, 100: 1}[row_group_size]
+	assert res["stream_id"].equals(expected["stream_id"]) == True
+	assert res["day_mean"].equals(expected["day_mean"]) == True
+	assert res["day_interval"].dt.strftime("%Y-%m-%d").tolist()[:3] == ["2012-01-01", "2012-01-02", "2012-01-03"]
+
+	# a column at a time
+	assert writers.read_columnar(writer.get_path(), columns=["day_mean"]).columns.tolist() == ["day_mean"]
+
+
+def test_columnar_writer_replaces_output(tmp_path):
+	for n_streams in [5, 2]:
+		writer = writers.ColumnarWriter(f"{tmp_path}/daily.csv", row_group_size=1)
+		for df in get_interval_frames(n_streams):
+			writer.write(df)
+		writer.close()
+
+	assert len(writers.read_columnar(writer.get_path()).index) == 6
+
+
+def test_get_writer_invalid_format(tmp_path):
+	with pytest.raises(ValueError):
+		writers.get_writer(f"{tmp_path}/daily.csv", output_format="xlsx")
@@ -0,0 +1,102 @@
+import sqlite3
+import pytest
+import pandas as pd
+import config
+from modules import DataStream, query, sinks
+
+
+@pytest.fixture
+def store(tmp_path):
+	"""result store with one batch of stream 718 (2 days), and stream 1"""
+	path = f"{tmp_path}/results.sqlite"
+	sink = sinks.SqliteSink(path)
+	for file, stream_id in [("csv_local_test/718.csv", 718), ("calculate_interval_level_data_test/1.csv", 1)]:
+		_, interval_level_res = DataStream.process_data_stream(stream_id=stream_id,
+		                                                       file_path=f"{config.csv_path_test}{file}",
+		                                                       valid_column_names=config.valid_column_names)
+		sink.write_interval_level_results(interval_level_res)
+	sink.close()
+	return path
+
+
+def test_get_interval_results(store):
+	q = query.ResultQuery(store)
+
+	res = q.get_interval_results(718, grouping_type="day_interval")
+	assert res.columns.tolist() == ["stream_id", "day_interval", "day_max", "day_min", "day_median", "day_mean",
+	                                "day_sum"]
+	assert len(res.index) == 2
+	first_day = res.loc[0, "day_interval"]
+
+	res = q.get_interval_results(718, grouping_type="hour_interval", start=first_day, end=first_day,
+	                             columns=["hour_max"])
+	assert res.columns.tolist() == ["stream_id", "day_interval", "hour_interval", "hour_max"]
+	assert len(res.index) == 24
+	assert res["day_interval"].unique().tolist() == [first_day]
+	assert res["hour_interval"].tolist() == list(range(24))
+
+	# nothing in the range
+	assert len(q.get_interval_results(718, start="2030-01-01", end="2030-12-31").index) == 0
+	# unknown stream
+	assert len(q.get_interval_results(12345).index) == 0
+
+
+def test_cache_metrics(store):
+	q = query.ResultQuery(store)
+
+	q.get_interval_results(718, grouping_type="hour_interval")
+	q.get_interval_results(718, grouping_type="hour_interval", start="2012-01-02")
+	q.get_interval_results(718, grouping_type="day_interval")
+	q.get_interval_results(1, grouping_type="hour_interval")
+	q.get_interval_results(718, grouping_type="hour_interval", columns=["hour_mean"])
+
+	metrics = q.get_metrics()
+	assert metrics["hits"] == 2 and metrics["misses"] == 3
+	assert metrics["hit_rate"] == pytest.approx(0.4)
+	assert metrics["entries"] == 3
+	assert metrics["hit_latency_mean_ms"] > 0 and metrics["miss_latency_mean_ms"] > 0
+
+
+def test_query_cache_eviction():
+	df = pd.DataFrame({"value": range(100)})
+	size = int(df.memory_usage(index=True, deep=True).sum())
+	cache = query.QueryCache(max_bytes=size * 2)
+
+	cache.put("a", df)
+	cache.put("b", df)
+	assert cache.get("a") is df
+
+	# "b" is the least recently used one
+	cache.put("c", df)
+	assert cache.get("b") is None
+	assert cache.get("a") is df and cache.get("c") is df
+	assert cache.get_size() == size * 2
+	assert cache.get_metrics()["evictions"] == 1
+
+	# too big for the cache
+	cache.put("d", pd.concat([df] * 3))
+	assert cache.get("d") is None and len(cache) == 2
+
+
+def test_query_errors(store, tmp_path):
+	q = query.ResultQuery(store)
+	with pytest.raises(ValueError):
+		q.get_interval_results(718, grouping_type="week_interval")
+	with pytest.raises(ValueError):
+		q.get_interval_results(718, columns=["hour_max"])
+
+	with pytest.raises(sqlite3.Error):
+		query.ResultQuery(f"{tmp_path}/missing.sqlite").get_interval_results(718)
+
+
+def test_get_day_key():
+	assert query.get_day_key("1970-01-02") == 1
+	assert query.get_day_key("2012-03-01") == 15400
+
+
+def test_query_cli(store, capsys):
+	query.main(["718", "--store", store, "--columns", "day_max"])
+	lines = capsys.readouterr().out.splitlines()
+
+	assert lines[0].split() == ["stream_id", "day_interval", "day_max"]
+	assert len(lines) == 3
@@ -0,0 +1,46 @@
+import pytest
+import numpy as np
+import pandas as pd
+from modules import ranking
+
+
+def get_stream_df(n_streams: int, seed: int = 0) -> pd.DataFrame:
+	rng = np.random.default_rng(seed)
+	# few distinct counts - lots of ties
+	return pd.DataFrame({"stream_id": np.arange(1, n_streams + 1),
+	                     "count of 0 and NaN": rng.integers(0, 50, n_streams),
+	                     "ignore": rng.random(n_streams) < 0.1})
+
+
+def get_expected(stream_df: pd.DataFrame, n: int | None) -> pd.Series:
+	rank = stream_df.loc[stream_df["ignore"] == False]["count of 0 and NaN"].rank(ascending=False, method="dense")
+	return (rank[rank <= n] if n is not None else rank).astype("int32")
+
+
+@pytest.mark.parametrize("n", [None, 1, 5, 100])
+def test_ranking(n):
+	stream_df = get_stream_df(1000)
+	stream_ranking = ranking.StreamRanking(n=n)
+	for i in range(0, len(stream_df.index), 7):
+		stream_ranking.add_stream_level_results(stream_df.iloc[i:i + 7])
+
+	expected = get_expected(stream_df, n)
+	assert stream_ranking.get_rank(stream_df).equals(expected)
+	assert len(stream_ranking) == len(expected.index)
+
+
+def test_merge():
+	stream_df = get_stream_df(1000, seed=1)
+
+	merged = ranking.StreamRanking(n=10)
+	for part in np.array_split(stream_df, 4):
+		worker = ranking.StreamRanking(n=10)
+		worker.add_stream_level_results(part)
+		merged.merge(worker.get_state())
+
+	assert merged.get_rank(stream_df).sort_index().equals(get_expected(stream_df, 10))
+
+
+def test_invalid_n():
+	with pytest.raises(ValueError):
+		ranking.StreamRanking(n=0)
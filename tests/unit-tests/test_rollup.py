@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+import pandas as pd
+from modules import rollup
+
+
+def get_df():
+	"""3 groups - one with a NaN, one with only NaN's, and one with an even number of values"""
+	return pd.DataFrame({"day_interval": ["b", "a", "a", "c", "b", "a", "c", "b", "b"],
+	                     "value": [4.0, 2.0, np.nan, np.nan, 1.0, 7.0, np.nan, 3.0, 10.0]})
+
+
+def test_compute_rollup():
+	calcs = {"max": rollup.calculate_max, "min": rollup.calculate_min, "median": rollup.calculate_median,
+	         "mean": rollup.calculate_mean, "sum": rollup.calculate_sum, "count": rollup.calculate_count}
+
+	res = rollup.compute_rollup(df=get_df(), group_by=["day_interval"], operation_field="value", calcs=calcs)
+
+	assert res.columns.tolist() == ["day_interval", "max", "min", "median", "mean", "sum", "count"]
+	assert res["day_interval"].tolist() == ["a", "b", "c"]
+
+	# compare with the groupby per statistic
+	expected = get_df().groupby("day_interval")["value"].agg(["max", "min", "median", "mean", "sum", "count"])
+	for column in expected.columns:
+		assert np.allclose(res[column].values, expected[column].values, equal_nan=True) == True
+
+
+def test_compute_rollup_multiple_keys():
+	df = get_df()
+	df["hour_interval"] = [1, 0, 0, 0, 1, 1, 0, 0, 1]
+
+	res = rollup.compute_rollup(df=df, group_by=["day_interval", "hour_interval"], operation_field="value",
+	                            calcs={"median": rollup.calculate_median, "sum": rollup.calculate_sum})
+
+	expected = df.groupby(["day_interval", "hour_interval"])["value"].agg(["median", "sum"]).reset_index()
+	assert res[["day_interval", "hour_interval"]].equals(expected[["day_interval", "hour_interval"]]) == True
+	assert np.allclose(res["median"].values, expected["median"].values, equal_nan=True) == True
+	assert np.allclose(res["sum"].values, expected["sum"].values) == True
+
+
+def test_compute_rollup_empty():
+	df = pd.DataFrame({"day_interval": [], "value": []})
+
+	res = rollup.compute_rollup(df=df, group_by=["day_interval"], operation_field="value",
+	                            calcs={"max": rollup.calculate_max, "sum": rollup.calculate_sum})
+
+	assert len(res.index) == 0
+	assert res.columns.tolist() == ["day_interval", "max", "sum"]
+
+
+def get_hourly_df():
+	rng = np.random.default_rng(0)
+	timestamp = 1325376300 + np.arange(3 * 288) * 300
+	value = np.round(rng.normal(50, 10, len(timestamp)), 4)
+	value[rng.random(len(timestamp)) < 0.05] = np.nan
+	# a full hour without any values
+	value[24:36] = np.nan
+
+	return pd.DataFrame({"day_interval": timestamp // 86400, "hour_interval": (timestamp // 3600) % 24,
+	                     "value": value})
+
+
+def test_partials_match_flat_rollup():
+	df = get_hourly_df()
+	calcs = {"max": rollup.calculate_max, "min": rollup.calculate_min, "median": rollup.calculate_median,
+	         "mean": rollup.calculate_mean, "sum": rollup.calculate_sum, "count": rollup.calculate_count}
+
+	hourly = rollup.get_segments(df=df, group_by=["day_interval", "hour_interval"], operation_field="value")
+	daily = hourly.rollup(keys=hourly.get_keys()[["day_interval"]], median_mode="exact")
+
+	res = rollup.get_results(daily, calcs)
+	expected = rollup.compute_rollup(df=df, group_by=["day_interval"], operation_field="value", calcs=calcs)
+
+	assert res["day_interval"].equals(expected["day_interval"]) == True
+	for column in calcs:
+		assert np.allclose(res[column].values, expected[column].values, equal_nan=True) == True
+
+
+def test_partials_merged_values():
+	"""The exact median/percentiles of a derived grouping merge the sorted values of the finer one - also when its
+	groups aren't next to each other (hour of the day, across the days), and along a chain of derived groupings"""
+	df = get_hourly_df()
+	hourly = rollup.get_segments(df=df, group_by=["day_interval", "hour_interval"], operation_field="value")
+
+	by_hour = hourly.rollup(keys=hourly.get_keys()[["hour_interval"]], median_mode="exact")
+	expected = df.groupby("hour_interval")["value"]
+	assert np.allclose(rollup.calculate_median(by_hour), expected.median().values, equal_nan=True) == True
+	assert np.allclose(rollup.calculate_percentile(by_hour, 0.95), expected.quantile(0.95).values,
+	                   equal_nan=True) == True
+
+	daily = hourly.rollup(keys=hourly.get_keys()[["day_interval"]], median_mode="exact")
+	weekly = daily.rollup(keys=pd.DataFrame({"week_interval": (daily.get_keys()["day_interval"] + 3) // 7}))
+	expected = df.groupby((df["day_interval"] + 3) // 7)["value"]
+	assert np.allclose(rollup.calculate_median(weekly), expected.median().values, equal_nan=True) == True
+	assert np.array_equal(weekly.get_segments().get_values(),
+	                      np.concatenate([np.sort(values) for _, values in expected]), equal_nan=True) == True
+
+
+def test_partials_approximate_median():
+	df = get_hourly_df()
+
+	hourly = rollup.get_segments(df=df, group_by=["day_interval", "hour_interval"], operation_field="value")
+	daily = hourly.rollup(keys=hourly.get_keys()[["day_interval"]], median_mode="approximate")
+
+	res = rollup.calculate_median(daily)
+	expected = df.groupby("day_interval")["value"].median().values
+
+	# the approximation is one of the hourly medians - should be close to the exact median
+	assert np.isin(res, hourly.get_medians()).all() == True
+	assert np.allclose(res, expected, rtol=0.05) == True
+
+	# derived groupings can be chained (e.g., weekly from daily)
+	total = daily.rollup(keys=pd.DataFrame({"week_interval": np.zeros(len(daily.get_keys().index))}),
+	                     median_mode="exact")
+	assert np.allclose(rollup.calculate_median(total), np.nanmedian(df["value"].values)) == True
+	assert np.allclose(rollup.calculate_sum(total), np.nansum(df["value"].values)) == True
+
+
+def test_partials_invalid_median_mode():
+	df = get_hourly_df()
+	hourly = rollup.get_segments(df=df, group_by=["day_interval", "hour_interval"], operation_field="value")
+
+	with pytest.raises(ValueError):
+		hourly.rollup(keys=hourly.get_keys()[["day_interval"]], median_mode="something random")
+
+
+def test_format_interval_keys():
+	df = pd.DataFrame({"stream_id": [1, 1], "day_interval": np.array([15340, 15341], dtype="int32"),
+	                   "day_max": [1.0, 2.0]})
+
+	res = rollup.format_interval_keys(df)
+	assert res["day_interval"].astype(str).tolist() == ["2012-01-01", "2012-01-02"]
+	assert res.columns.tolist() == df.columns.tolist()
+
+	# already formatted keys are left as-is
+	assert rollup.format_interval_keys(res).equals(res) == True
@@ -0,0 +1,140 @@
+import json
+import pytest
+import numpy as np
+import pandas as pd
+import config
+from modules import DataStream, rollup, rollup_plan
+from benchmarks.synthetic import generate_stream
+
+__plan__ = {
+	"groupings": {
+		"quarter_hour_interval": {"interval": "15min", "statistics": ["mean", "count"]},
+		"hour_interval": {"interval": "hour", "statistics": ["max", "min", "median", "mean", "sum"]},
+		"day_interval": {"interval": "day", "statistics": ["max", "std", "p95", {"statistic": "p5", "column": "low"}]},
+		"week_interval": {"interval": "week", "statistics": ["min", "median", "std", "count"]},
+		"month_interval": {"interval": "month", "statistics": ["max", "mean", "p99.5", "sum"]}
+	}
+}
+
+
+@pytest.fixture
+def plan_path(tmp_path, monkeypatch):
+	path = f"{tmp_path}/plan.json"
+	with open(path, "w") as f:
+		json.dump(__plan__, f)
+	monkeypatch.setattr(config, "rollup_plan_path", path)
+	return path
+
+
+@pytest.fixture
+def stream_file(tmp_path):
+	# 45 days - across a month and several weeks
+	path = f"{tmp_path}/1.csv"
+	generate_stream(45 * 288, seed=3, nan_ratio=0.05).to_csv(path, index=False)
+	return path
+
+
+def get_expected(df: pd.DataFrame, grouping_config: dict) -> pd.DataFrame:
+	"""Results of the grouping, computed with pandas from the raw intervals"""
+	keys = grouping_config["definition"].get_keys(df["timestamp"].to_numpy())
+	grouped = df.assign(**keys).groupby(list(keys))["value"]
+
+	expected = pd.DataFrame(index=grouped.size().index)
+	for calc in grouping_config["calcs"]:
+		if calc["calc_type"] == "percentile":
+			expected[calc["column_name"]] = grouped.quantile(calc["q"])
+		else:
+			expected[calc["column_name"]] = grouped.agg(calc["calc_type"])
+	return expected.reset_index()
+
+
+def test_compile_plan(plan_path):
+	grouping_config = rollup_plan.get_grouping_config(plan_path)
+	assert grouping_config is rollup_plan.get_grouping_config(plan_path)
+	# shared by every stream - read-only
+	with pytest.raises(TypeError):
+		grouping_config["day_interval"]["output_path"] = "Output/other.csv"
+	with pytest.raises(TypeError):
+		del grouping_config["day_interval"]
+
+	# each grouping is derived from the coarsest grouping that nests in it
+	assert "derived_from" not in grouping_config["quarter_hour_interval"]
+	assert grouping_config["hour_interval"]["derived_from"] == {"grouping_type": "quarter_hour_interval"}
+	assert grouping_config["day_interval"]["derived_from"] == {"grouping_type": "hour_interval"}
+	assert grouping_config["week_interval"]["derived_from"] == {"grouping_type": "day_interval"}
+	assert grouping_config["month_interval"]["derived_from"] == {"grouping_type": "day_interval"}
+
+	assert [c["column_name"] for c in grouping_config["day_interval"]["calcs"]] == ["day_max", "day_std", "day_p95",
+	                                                                                "low"]
+	assert grouping_config["month_interval"]["calcs"][2] == {"column_name": "month_p99_5", "calc_type": "percentile",
+	                                                         "q": 0.995}
+	assert grouping_config["week_interval"]["output_path"].endswith("/Output/week_interval_data.csv")
+
+	# the default plan - the daily and hourly groupings
+	default = rollup_plan.compile_plan(rollup_plan.__default_plan__)
+	assert list(default) == ["day_interval", "hour_interval"]
+	assert default["day_interval"]["derived_from"] == {"grouping_type": "hour_interval"}
+
+
+@pytest.mark.parametrize("mode", ["hierarchical", "flat"])
+def test_plan_results(plan_path, stream_file, monkeypatch, mode):
+	monkeypatch.setattr(DataStream, "rollup_mode", mode)
+	ds = DataStream.get_data_stream(stream_id=1, file_path=stream_file, valid_column_names=config.valid_column_names)
+	raw = pd.read_csv(stream_file)
+
+	for grouping_type, grouping_config in ds.get_grouping_config().items():
+		res = ds.get_interval_level_results(grouping_type, grouping_config)
+		expected = get_expected(raw, grouping_config)
+
+		assert res.columns.tolist() == ["stream_id"] + expected.columns.tolist()
+		assert len(res.index) == len(expected.index)
+		for column in expected.columns:
+			assert np.allclose(res[column].to_numpy(dtype="float64"), expected[column].to_numpy(dtype="float64"),
+			                   equal_nan=True) == True, f"{grouping_type} - {column}"
+
+	months = ds.get_interval_level_results("month_interval", ds.get_grouping_config()["month_interval"])
+	assert rollup.format_interval_keys(months)["month_interval"].astype(str).tolist() == ["2012-01-01", "2012-02-01"]
+	weeks = ds.get_interval_level_results("week_interval", ds.get_grouping_config()["week_interval"])
+	assert all(day.weekday() == 0 for day in rollup.format_interval_keys(weeks)["week_interval"])
+
+
+def test_plan_chunked_intake(plan_path, stream_file):
+	"""The chunked intake only computes complete weeks and months - same results as the in-memory intake"""
+	ds = DataStream.DataStream(1, config.valid_column_names)
+	ds.read_csv_data(file=stream_file)
+	chunked_ds = DataStream.DataStream(1, config.valid_column_names)
+	chunked_ds.read_csv_data_chunked(file=stream_file, chunk_size=1000)
+
+	# weeks and months are flushed separately - the first week of February is computed before February is complete
+	last_computed = chunked_ds.get_chunked_intake_state()["last_computed_buckets"]
+	assert last_computed["month"] == 504  # 2012-01
+	assert last_computed["week"] > (15371 + 3) // 7  # after the week of 2012-02-01
+	for grouping_type, grouping_config in ds.get_grouping_config().items():
+		res = ds.get_interval_level_results(grouping_type, grouping_config)
+		chunked_res = chunked_ds.get_interval_level_results(grouping_type, grouping_config)
+		assert res.columns.tolist() == chunked_res.columns.tolist()
+		for column in res.columns:
+			assert np.allclose(res[column].to_numpy(dtype="float64"), chunked_res[column].to_numpy(dtype="float64"),
+			                   equal_nan=True) == True, f"{grouping_type} - {column}"
+
+
+def test_invalid_plans():
+	with pytest.raises(ValueError):
+		rollup_plan.compile_plan({"groupings": {}})
+	with pytest.raises(ValueError):
+		rollup_plan.compile_plan({"groupings": {"x": {"interval": "fortnight", "statistics": ["max"]}}})
+	with pytest.raises(ValueError):
+		rollup_plan.compile_plan({"groupings": {"x": {"interval": "day", "statistics": ["mode"]}}})
+	with pytest.raises(ValueError):
+		rollup_plan.compile_plan({"groupings": {"x": {"interval": "day", "statistics": ["p101"]}}})
+	with pytest.raises(ValueError):
+		rollup_plan.compile_plan({"groupings": {"x": {"interval": "day", "statistics": ["max", "max"]}}})
+
+
+def test_yaml_plan(tmp_path):
+	path = f"{tmp_path}/plan.yaml"
+	with open(path, "w") as f:
+		f.write("groupings:\n  week_interval:\n    interval: week\n    statistics: [max, p90]\n")
+
+	grouping_config = rollup_plan.get_grouping_config(path)
+	assert [c["column_name"] for c in grouping_config["week_interval"]["calcs"]] == ["week_max", "week_p90"]
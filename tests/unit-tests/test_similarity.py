@@ -0,0 +1,180 @@
+import os
+import numpy as np
+import pytest
+import pandas as pd
+from modules import similarity
+
+
+def get_matrix(n_streams: int = 40, n_slots: int = 96, seed: int = 0) -> np.ndarray:
+	"""Random profiles - stream 3 follows stream 7 (scaled/shifted + noise), and stream 12 is the inverse of stream 20"""
+	rng = np.random.default_rng(seed)
+	matrix = rng.normal(size=(n_streams, n_slots))
+	if n_streams < 21:
+		return matrix
+
+	matrix[3] = matrix[7] * 2 + 5 + rng.normal(0, 0.01, n_slots)
+	matrix[12] = -matrix[20]
+	return matrix
+
+
+def get_interval_df(matrix: np.ndarray) -> pd.DataFrame:
+	n_streams, n_slots = matrix.shape
+	return pd.DataFrame({"stream_id": np.repeat(np.arange(n_streams) + 100, n_slots),
+	                     "day_interval": np.tile(np.arange(n_slots) // 24, n_streams),
+	                     "hour_interval": np.tile(np.arange(n_slots) % 24, n_streams),
+	                     "hour_mean": matrix.ravel()})
+
+
+def test_top_k_similar_pairs():
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(40), matrix=get_matrix(), k=3)
+
+	assert res.columns.tolist() == ["stream_id_1", "stream_id_2", "correlation"]
+	assert len(res.index) == 3
+	assert res.loc[0, ["stream_id_1", "stream_id_2"]].tolist() == [3, 7]
+	assert res.loc[0, "correlation"] == pytest.approx(1, abs=1e-3)
+
+	# compare with the full correlation matrix
+	corr = np.corrcoef(get_matrix())
+	corr[np.tril_indices(40)] = -np.inf
+	expected = np.sort(corr.ravel())[::-1][:3]
+	assert np.allclose(res["correlation"].values, expected) == True
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 7, 40, 1000])
+def test_top_k_similar_pairs_block_size(block_size):
+	"""The result doesn't depend on the number of streams compared at a time"""
+	expected = similarity.top_k_similar_pairs(stream_ids=np.arange(40), matrix=get_matrix(), k=10, block_size=40)
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(40), matrix=get_matrix(), k=10, block_size=block_size)
+
+	assert res[["stream_id_1", "stream_id_2"]].equals(expected[["stream_id_1", "stream_id_2"]]) == True
+	assert np.allclose(res["correlation"].values, expected["correlation"].values) == True
+
+
+def test_top_k_similar_pairs_euclidean():
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(40), matrix=get_matrix(), k=1, metric="euclidean")
+
+	assert res.columns.tolist() == ["stream_id_1", "stream_id_2", "distance"]
+	assert res.loc[0, ["stream_id_1", "stream_id_2"]].tolist() == [3, 7]
+
+
+def test_top_k_similar_pairs_fewer_pairs():
+	# 3 streams -> only 3 pairs
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(3), matrix=get_matrix(n_streams=3), k=10)
+	assert len(res.index) == 3
+
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(1), matrix=get_matrix(n_streams=1), k=10)
+	assert len(res.index) == 0
+
+
+def test_top_k_similar_pairs_invalid_metric():
+	with pytest.raises(ValueError):
+		similarity.top_k_similar_pairs(stream_ids=np.arange(40), matrix=get_matrix(), metric="cosine")
+
+
+def test_find_similar_streams():
+	"""Streams with missing intervals are aligned on the shared time grid"""
+	df = get_interval_df(get_matrix())
+	df = df.drop(index=df.index[(df["stream_id"] == 107) & (df["day_interval"] == 0)]).sample(frac=1, random_state=0)
+
+	res = similarity.find_similar_streams(interval_df=df, value_column="hour_mean",
+	                                      key_columns=["day_interval", "hour_interval"], k=1)
+
+	assert res.loc[0, ["stream_id_1", "stream_id_2"]].tolist() == [103, 107]
+
+
+def test_build_matrix():
+	df = get_interval_df(get_matrix(n_streams=4, n_slots=48)).iloc[::-1]
+	stream_ids, matrix = similarity.build_matrix(interval_df=df, value_column="hour_mean",
+	                                             key_columns=["day_interval", "hour_interval"])
+
+	assert stream_ids.tolist() == [100, 101, 102, 103]
+	assert np.array_equal(matrix, get_matrix(n_streams=4, n_slots=48)) == True
+
+
+def test_normalize_overwrite():
+	matrix = get_matrix(n_streams=4, n_slots=48)
+	matrix[1, :5] = np.nan
+	original = matrix.copy()
+
+	z = similarity.normalize(matrix)
+	assert np.array_equal(matrix, original, equal_nan=True) == True
+	assert similarity.normalize(matrix, overwrite=True) is matrix
+	assert np.array_equal(matrix, z) == True
+	assert np.allclose(z[1, 5:].mean(), 0) == True
+	assert np.all(z[1, :5] == 0) == True
+
+
+def get_missing_matrix(n_streams: int = 40, n_slots: int = 96, seed: int = 1) -> np.ndarray:
+	"""get_matrix with ~30% of the intervals missing - and the last stream only has the first half of the intervals"""
+	matrix = get_matrix(n_streams=n_streams, n_slots=n_slots)
+	matrix[np.random.default_rng(seed).random(matrix.shape) < 0.3] = np.nan
+	matrix[-1, n_slots // 2:] = np.nan
+	return matrix
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 40])
+def test_top_k_similar_pairs_missing_intervals(block_size):
+	"""With missing intervals, the correlation is Pearson's over the intervals both streams have values for"""
+	matrix = get_missing_matrix()
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(40), matrix=matrix, k=10, block_size=block_size)
+
+	# pairwise-complete correlation of every pair
+	corr = pd.DataFrame(matrix.T).corr(min_periods=2).to_numpy()
+	corr[np.tril_indices(40)] = -np.inf
+	order = np.argsort(-corr.ravel(), kind="stable")[:10]
+
+	assert res.loc[0, ["stream_id_1", "stream_id_2"]].tolist() == [3, 7]
+	assert np.allclose(res["correlation"].values, corr.ravel()[order]) == True
+	assert res[["stream_id_1", "stream_id_2"]].values.tolist() == np.stack(np.divmod(order, 40), axis=1).tolist()
+
+
+def test_top_k_similar_pairs_min_overlap():
+	"""Pairs that share fewer intervals than min_overlap aren't compared"""
+	matrix = get_matrix(n_streams=3, n_slots=48)
+	matrix[0, 24:] = np.nan
+	matrix[1, :24] = np.nan
+
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(3), matrix=matrix, k=10, min_overlap=2)
+	assert res[["stream_id_1", "stream_id_2"]].values.tolist() in ([[0, 2], [1, 2]], [[1, 2], [0, 2]])
+
+	res = similarity.top_k_similar_pairs(stream_ids=np.arange(3), matrix=matrix, k=10, min_overlap=25)
+	assert len(res.index) == 0
+
+
+def test_profile_spool(tmp_path):
+	"""The spilled profiles are laid out as the same matrix as build_matrix - memory-mapped from the .npy file"""
+	matrix = get_missing_matrix(n_streams=6, n_slots=48)
+	df = get_interval_df(matrix)
+	df = df[~df["hour_mean"].isna()]
+
+	spool = similarity.ProfileSpool(f"{tmp_path}/profiles.npy")
+	# the streams in reverse order, each with its intervals in reverse order - and stream 101 replaced
+	spool.add_profile(101, df[["day_interval", "hour_interval"]].iloc[:5], np.zeros(5))
+	for stream_id, stream_df in list(df.groupby("stream_id"))[::-1]:
+		stream_df = stream_df.iloc[::-1]
+		spool.add_profile(stream_id, stream_df[["day_interval", "hour_interval"]], stream_df["hour_mean"].to_numpy())
+	assert len(spool) == 6
+
+	stream_ids, spooled = spool.get_matrix()
+	expected_ids, expected = similarity.build_matrix(interval_df=df, value_column="hour_mean",
+	                                                 key_columns=["day_interval", "hour_interval"])
+	order = np.argsort(stream_ids)
+	assert isinstance(spooled, np.memmap) == True
+	assert spooled.dtype == "float32"
+	assert stream_ids[order].tolist() == expected_ids.tolist()
+	assert np.array_equal(spooled[order], expected.astype("float32"), equal_nan=True) == True
+	assert os.listdir(tmp_path) == ["profiles.npy"]
+
+	res = similarity.top_k_similar_pairs(stream_ids=stream_ids, matrix=spooled, k=3, block_size=2)
+	expected_res = similarity.top_k_similar_pairs(stream_ids=expected_ids, matrix=expected, k=3)
+	assert np.allclose(res["correlation"].values, expected_res["correlation"].values, atol=1e-5) == True
+
+	spool.remove()
+	assert os.listdir(tmp_path) == []
+
+
+def test_profile_spool_empty(tmp_path):
+	spool = similarity.ProfileSpool(f"{tmp_path}/profiles.npy")
+	stream_ids, matrix = spool.get_matrix()
+	assert len(stream_ids) == 0
+	assert len(similarity.top_k_similar_pairs(stream_ids=stream_ids, matrix=matrix, k=3).index) == 0
@@ -0,0 +1,135 @@
+import sqlite3
+import numpy as np
+import pytest
+import pandas as pd
+import config
+from modules import DataStream, sinks
+from modules.ResultCollector import ResultCollector
+
+
+@pytest.fixture
+def results():
+	"""stream-level/interval-level results of a few test files (718 has 2 days of data)"""
+	files = [(f"{config.csv_path_test}csv_local_test/718.csv", 718),
+	         (f"{config.csv_path_test}calculate_interval_level_data_test/1.csv", 1),
+	         (f"{config.csv_path_test}calculate_stream_level_data_test/5.csv", 5)]
+	return [DataStream.process_data_stream(stream_id=stream_id, file_path=path,
+	                                       valid_column_names=config.valid_column_names) for path, stream_id in files]
+
+
+def write_batch(path: str, results: list, batch_size: int = 50000) -> tuple[sinks.SqliteSink, ResultCollector]:
+	collector = ResultCollector()
+	sink = sinks.get_result_sink("sqlite", path=path, batch_size=batch_size)
+
+	for stream_level_res, interval_level_res in results:
+		collector.add_stream_level_results(stream_level_res)
+		collector.add_interval_level_results(interval_level_res)
+		sink.write_interval_level_results(interval_level_res)
+
+	sink.write_stream_level_results(collector.get_stream_df())
+	sink.close()
+	return sink, collector
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 50000])
+def test_sqlite_sink(tmp_path, results, batch_size):
+	path = f"{tmp_path}/results.sqlite"
+	sink, collector = write_batch(path, results, batch_size=batch_size)
+
+	with sqlite3.connect(path) as connection:
+		for grouping_type, res in collector.get_interval_df().items():
+			df = pd.read_sql_query(f'SELECT * FROM "{grouping_type}" ORDER BY rowid', connection)
+
+			assert df["batch_id"].unique().tolist() == [sink.get_batch_id()]
+			expected = res["df"]
+			assert df.columns.tolist() == ["batch_id"] + expected.columns.tolist()
+			for column in expected.columns:
+				assert np.allclose(df[column].to_numpy(dtype="float64"), expected[column].to_numpy(dtype="float64"),
+				                   equal_nan=True) == True
+
+		stream_df = pd.read_sql_query("SELECT * FROM stream_level ORDER BY stream_id", connection)
+		assert stream_df["stream_id"].tolist() == [1, 5, 718]
+		assert stream_df["ignore"].tolist() == [0, 1, 0]
+		assert stream_df.loc[2, "count_zero_and_nan"] == collector.get_stream_df().loc[0, "count of 0 and NaN"]
+
+		status = connection.execute("SELECT status, finished_at FROM batches").fetchall()
+		assert status[0][0] == "complete" and status[0][1] is not None
+
+		indexes = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+		assert sorted(indexes) == ["day_interval_keys", "hour_interval_keys", "stream_level_keys"]
+
+		# the hourly index covers the (stream, day, hour) lookups
+		plan = connection.execute('EXPLAIN QUERY PLAN SELECT hour_max FROM hour_interval WHERE stream_id = 718 AND '
+		                          'day_interval = 15340').fetchall()
+		assert "hour_interval_keys" in str(plan)
+
+
+def test_sqlite_sink_stream_ranks(tmp_path, results):
+	"""The stream-level rows written as each stream is done, and ranked once all of them are"""
+	sink = sinks.SqliteSink(f"{tmp_path}/results.sqlite", batch_size=1)
+	for stream_level_res, _ in results:
+		sink.write_stream_level_results(stream_level_res)
+	sink.write_stream_ranks({718: 1})
+	sink.close()
+
+	with sqlite3.connect(f"{tmp_path}/results.sqlite") as connection:
+		rows = connection.execute("SELECT stream_id, rank FROM stream_level ORDER BY stream_id").fetchall()
+	assert rows == [(1, None), (5, None), (718, 1.0)]
+
+
+def test_sqlite_sink_batches(tmp_path, results):
+	"""Every run gets its own batch ID - the previous batches are kept"""
+	path = f"{tmp_path}/results.sqlite"
+	first, _ = write_batch(path, results)
+	second, _ = write_batch(path, results)
+
+	assert second.get_batch_id() == first.get_batch_id() + 1
+
+	with sqlite3.connect(path) as connection:
+		assert sinks.get_latest_batch_id(connection) == second.get_batch_id()
+		counts = connection.execute("SELECT batch_id, COUNT(*) FROM day_interval GROUP BY batch_id").fetchall()
+		assert counts[0][1] == counts[1][1]
+
+
+def test_sqlite_sink_incomplete_batch(tmp_path, results):
+	path = f"{tmp_path}/results.sqlite"
+	first, _ = write_batch(path, results)
+
+	sink = sinks.SqliteSink(path)
+	sink.write_interval_level_results(results[0][1])
+	sink.flush()
+
+	with sqlite3.connect(path) as connection:
+		# a batch that wasn't closed isn't the latest one
+		assert sinks.get_latest_batch_id(connection) == first.get_batch_id()
+
+
+def test_sqlite_sink_new_column(tmp_path, results):
+	"""A column added since the earlier batches (e.g., a new statistic) is added to their table"""
+	path = f"{tmp_path}/results.sqlite"
+	first, _ = write_batch(path, results)
+
+	stream_level_res, interval_level_res = results[0]
+	df = interval_level_res["day_interval"]["df"].assign(day_std=1.5)
+	sink = sinks.SqliteSink(path)
+	sink.write_interval_level_results({"day_interval": {"df": df, "output_path": ""}})
+	sink.close()
+
+	with sqlite3.connect(path) as connection:
+		rows = connection.execute("SELECT batch_id, day_std FROM day_interval WHERE stream_id = 718").fetchall()
+	assert sorted(set(rows)) == [(first.get_batch_id(), None), (sink.get_batch_id(), 1.5)]
+
+
+def test_result_sink_interface():
+	with pytest.raises(TypeError):
+		sinks.ResultSink()
+
+
+def test_get_latest_batch_id_empty(tmp_path):
+	with sqlite3.connect(f"{tmp_path}/empty.sqlite") as connection:
+		assert sinks.get_latest_batch_id(connection) is None
+
+
+def test_invalid_sink(tmp_path):
+	with pytest.raises(ValueError):
+		sinks.get_result_sink("mongodb", path=f"{tmp_path}/results")
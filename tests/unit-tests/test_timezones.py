@@ -0,0 +1,90 @@
+import pytest
+import numpy as np
+import pandas as pd
+import config
+from modules import DataStream, rollup, timezones
+from benchmarks.synthetic import generate_stream
+
+
+@pytest.fixture
+def meta_path(tmp_path, monkeypatch):
+	path = f"{tmp_path}/all_sites.csv"
+	pd.DataFrame({"SITE_ID": [8, 9, 10],
+	              "INDUSTRY": ["Commercial Property"] * 3,
+	              "TIME_ZONE": ["America/New_York", "Not/AZone", None],
+	              "TZ_OFFSET": ["-04:00", "-06:00", "+05:30"]}).to_csv(path, index=False)
+	monkeypatch.setattr(config, "site_meta_path", path)
+	monkeypatch.setattr(config, "local_time", True)
+	return path
+
+
+@pytest.fixture
+def stream_file(tmp_path):
+	# 310 days of 2012 - across both DST transitions (2012-03-11 and 2012-11-04 in New York)
+	path = f"{tmp_path}/8.csv"
+	generate_stream(310 * 288, seed=5, nan_ratio=0.02).to_csv(path, index=False)
+	return path
+
+
+def test_offset_table():
+	table = timezones.OffsetTable("America/New_York", 2011, 2013)
+	timestamps = np.arange(1293840000, 1388534400, 900, dtype="int64")  # 2011 to 2013, every 15 minutes
+	times = pd.to_datetime(timestamps, unit="s").tz_localize("UTC")
+	expected = (times.tz_convert("America/New_York").tz_localize(None) - times.tz_localize(None)).asi8 // 10 ** 9
+
+	assert np.array_equal(table.get_offsets(timestamps), expected)
+	# 2 transitions a year
+	assert np.count_nonzero(np.diff(table.get_offsets(timestamps))) == 6
+
+	# 2012-03-11 02:00 EST -> 03:00 EDT
+	assert table.get_offsets(np.array([1331449199, 1331449200])).tolist() == [-18000, -14400]
+
+
+def test_offset_fallbacks(meta_path):
+	timestamps = np.array([1325376300, 1341100800], dtype="int64")  # January, July
+
+	assert timezones.get_local_timestamps(8, timestamps, meta_path).tolist() == [1325376300 - 18000, 1341100800 - 14400]
+	# unknown time zone -> fixed TZ_OFFSET; no time zone -> fixed TZ_OFFSET; not in the metadata -> UTC
+	assert (timezones.get_local_timestamps(9, timestamps, meta_path) - timestamps).tolist() == [-21600, -21600]
+	assert (timezones.get_local_timestamps(10, timestamps, meta_path) - timestamps).tolist() == [19800, 19800]
+	assert (timezones.get_local_timestamps(11, timestamps, meta_path) - timestamps).tolist() == [0, 0]
+
+	# the table of a site is built once
+	table = timezones.get_offset_table(8, meta_path, 2011, 2013)
+	timezones.get_local_timestamps(8, timestamps, meta_path)
+	assert timezones.get_offset_table(8, meta_path, 2011, 2013) is table
+
+
+@pytest.mark.parametrize("intake", ["memory", "chunked"])
+def test_local_time_rollups(meta_path, stream_file, intake):
+	ds = DataStream.DataStream(8, config.valid_column_names)
+	if intake == "chunked":
+		ds.read_csv_data_chunked(file=stream_file, chunk_size=5000)
+		# the local days are still in order - no fallback to the in-memory intake
+		assert ds.get_chunked_intake_state() is not None
+	else:
+		ds.read_csv_data(file=stream_file)
+
+	df = pd.read_csv(stream_file)
+	local = pd.to_datetime(df["timestamp"], unit="s").dt.tz_localize("UTC").dt.tz_convert("America/New_York")
+	df["day_interval"] = local.dt.strftime("%Y-%m-%d")
+	df["hour_interval"] = local.dt.hour
+
+	daily = ds.get_interval_level_results("day_interval", ds.get_grouping_config()["day_interval"])
+	daily = rollup.format_interval_keys(daily)
+	expected = df.groupby("day_interval")["value"].agg(["max", "min", "median", "mean", "sum"]).reset_index()
+	assert daily["day_interval"].astype(str).tolist() == expected["day_interval"].tolist()
+	for calc in ["max", "min", "median", "mean", "sum"]:
+		assert np.allclose(daily[f"day_{calc}"], expected[calc], equal_nan=True), calc
+
+	hourly = rollup.format_interval_keys(
+		ds.get_interval_level_results("hour_interval", ds.get_grouping_config()["hour_interval"]))
+	expected = df.groupby(["day_interval", "hour_interval"])["value"].agg(["max", "sum"]).reset_index()
+	assert len(hourly.index) == len(expected.index)
+	assert np.allclose(hourly["hour_max"], expected["max"], equal_nan=True)
+	assert np.allclose(hourly["hour_sum"], expected["sum"], equal_nan=True)
+
+	# 23 local hours on the spring-forward day, 24 on the fall-back day (01:00 is repeated, in the same hour)
+	hours = hourly.groupby(hourly["day_interval"].astype(str)).size()
+	assert hours["2012-03-11"] == 23
+	assert hours["2012-11-04"] == 24